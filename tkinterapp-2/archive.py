@@ -0,0 +1,121 @@
+import calendar
+import glob
+from datetime import datetime, timedelta
+
+from library import epoch
+
+# Where returned loans are moved; "{year}" splits them into one file per year
+ARCHIVE_PATH = "library-archive-{year}.db"
+
+COLUMNS = "id, book_id, member_id, borrow_date, return_date, due_at, returned_at, copy_id"
+
+
+def _year_range(year):
+    return calendar.timegm((year, 1, 1, 0, 0, 0)), calendar.timegm((year + 1, 1, 1, 0, 0, 0))
+
+
+def _create_archive_table(db):
+    """Create (or bring up to date) the borrows table of the attached archive."""
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS archive.borrows (
+            id INTEGER PRIMARY KEY,
+            book_id INTEGER,
+            member_id INTEGER,
+            borrow_date TEXT,
+            return_date TEXT,
+            due_at INTEGER,
+            returned_at INTEGER,
+            copy_id INTEGER
+        )
+    """)
+    # Files written before copies were tracked lack the column; their
+    # loans keep a NULL copy_id, as in library.db
+    columns = [row[1] for row in db.query("PRAGMA archive.table_info(borrows)")]
+    if "copy_id" not in columns:
+        db.execute("ALTER TABLE archive.borrows ADD COLUMN copy_id INTEGER")
+    db.execute("CREATE INDEX IF NOT EXISTS archive.idx_borrows_returned_at ON borrows (returned_at)")
+
+
+def upgrade_archives(db, archive_path=ARCHIVE_PATH):
+    """Bring every existing archive file matching ``archive_path`` up to the current columns."""
+    for path in sorted(glob.glob(archive_path.replace("{year}", "[0-9]" * 4))):
+        db.execute("ATTACH DATABASE ? AS archive", (path,))
+        try:
+            with db.transaction():
+                _create_archive_table(db)
+        finally:
+            db.execute("DETACH DATABASE archive")
+
+
+def _archive_range(db, path, start, end):
+    """Move returned loans with start <= returned_at < end into ``path``."""
+    db.execute("ATTACH DATABASE ? AS archive", (path,))
+    try:
+        # Copy, commit, then delete what the archive now holds. Transactions
+        # across a WAL database and an attached file aren't atomic together, so
+        # this order (and keeping the ids) makes a rerun after a crash safe
+        with db.transaction():
+            _create_archive_table(db)
+            db.execute(
+                f"""INSERT OR IGNORE INTO archive.borrows ({COLUMNS})
+                SELECT {COLUMNS} FROM main.borrows WHERE returned_at >= ? AND returned_at < ?""",
+                (start, end),
+            )
+        with db.transaction():
+            return db.execute(
+                """DELETE FROM main.borrows WHERE returned_at >= ? AND returned_at < ?
+                AND id IN (SELECT id FROM archive.borrows)""",
+                (start, end),
+            ).rowcount
+    finally:
+        db.execute("DETACH DATABASE archive")
+
+
+def archive_loans(db, before, archive_path=ARCHIVE_PATH):
+    """Move loans returned before the datetime ``before`` out of library.db.
+
+    Active loans are never touched. Returns {archive file: loans moved}.
+    """
+    before = epoch(before)
+    # Older files, which this run may not write to, get any new columns too
+    upgrade_archives(db, archive_path)
+    moved = {}
+    if "{year}" not in archive_path:
+        count = _archive_range(db, archive_path, 0, before)
+        if count:
+            moved[archive_path] = count
+        return moved
+    years = db.query(
+        "SELECT DISTINCT CAST(strftime('%Y', returned_at, 'unixepoch') AS INTEGER) "
+        "FROM borrows WHERE returned_at < ?",
+        (before,),
+    )
+    for (year,) in years:
+        start, end = _year_range(year)
+        path = archive_path.format(year=year)
+        count = _archive_range(db, path, start, min(end, before))
+        if count:
+            moved[path] = count
+    return moved
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import DB_PATH, configure, init_db
+
+    parser = argparse.ArgumentParser(description="Move old returned loans into archive database files.")
+    parser.add_argument("--days", type=int, default=365,
+                        help="archive loans returned more than this many days ago (default: %(default)s)")
+    parser.add_argument("--archive", default=ARCHIVE_PATH,
+                        help="archive file; {year} is replaced by the year of return (default: %(default)s)")
+    parser.add_argument("--db", default=DB_PATH, help="database file (default: %(default)s)")
+    args = parser.parse_args()
+
+    db = configure(args.db)
+    init_db()
+    moved = archive_loans(db, datetime.now() - timedelta(days=args.days), args.archive)
+    for path, count in moved.items():
+        print(f"Archived {count} loans to {path}")
+    if not moved:
+        print("Nothing to archive")
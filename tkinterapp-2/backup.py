@@ -0,0 +1,204 @@
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+# Snapshots go here, named after the database and the time they were taken
+BACKUP_DIR = "backups"
+# How many snapshots of a database are kept; older ones are deleted
+KEEP = 24
+# Copies of the database saved just before a restore are named with this
+# suffix and counted separately, so routine snapshots never push them out
+PRE_RESTORE = "-pre-restore"
+KEEP_PRE_RESTORE = 5
+# Pages copied per step of the online backup, and the pause between steps,
+# so a large copy doesn't starve the app's own reads and writes
+PAGES_PER_STEP = 1024
+STEP_PAUSE = 0.005
+
+TIMESTAMP_FORMAT = "%Y%m%d-%H%M%S"
+
+
+class BackupError(Exception):
+    """Raised when a snapshot can't be made or fails its integrity check."""
+
+
+class BackupResult:
+    def __init__(self, source, path):
+        self.source = source
+        self.path = path
+        self.pages = 0
+        self.steps = 0
+        self.bytes = 0
+        self.elapsed = 0.0
+        self.pruned = []
+
+    @property
+    def rate(self):
+        """Megabytes copied per second."""
+        return self.bytes / self.elapsed / 1e6 if self.elapsed else 0.0
+
+    def __str__(self):
+        return (f"Copied {self.pages} pages ({self.bytes / 1e6:.1f} MB) of {self.source} to {self.path} "
+                f"in {self.elapsed:.2f}s, {self.steps} steps ({self.rate:.1f} MB/s)")
+
+
+def _copy(source, target, result, pages, pause):
+    def step(status, remaining, total):
+        result.steps += 1
+        result.pages = total
+        if remaining and pause:
+            time.sleep(pause)
+
+    source.backup(target, pages=pages, progress=step)
+    result.bytes = result.pages * source.execute("PRAGMA page_size").fetchone()[0]
+
+
+def snapshot_name(path, moment=None, suffix=""):
+    base = os.path.splitext(os.path.basename(path))[0]
+    return f"{base}-{(moment or datetime.now()).strftime(TIMESTAMP_FORMAT)}{suffix}.db"
+
+
+def snapshots(path, directory=BACKUP_DIR, suffix=None):
+    """Snapshots of the database at ``path``, oldest first.
+
+    With ``suffix``, only those taken with that suffix ("" for plain snapshots).
+    """
+    base = os.path.splitext(os.path.basename(path))[0] + "-"
+    if not os.path.isdir(directory):
+        return []
+    names = sorted(name for name in os.listdir(directory) if name.startswith(base) and name.endswith(".db"))
+    if suffix is not None:
+        length = len(snapshot_name(path, suffix=suffix))
+        names = [name for name in names if len(name) == length and name.endswith(suffix + ".db")]
+    return [os.path.join(directory, name) for name in names]
+
+
+def check_integrity(path):
+    """Raise BackupError unless SQLite's integrity_check passes on ``path``."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        problems = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+    except sqlite3.DatabaseError as e:
+        raise BackupError(f"{path} is not a usable database: {e}") from None
+    finally:
+        conn.close()
+    if problems != ["ok"]:
+        raise BackupError(f"{path} failed its integrity check: " + "; ".join(problems[:5]))
+
+
+def backup(path, directory=BACKUP_DIR, keep=KEEP, pages=PAGES_PER_STEP, pause=STEP_PAUSE, suffix=""):
+    """Take a consistent snapshot of the live database at ``path`` with SQLite's online backup API.
+
+    The copy is made a few pages at a time from its own connection, so the
+    app and other clients carry on reading and writing meanwhile. Only the
+    ``keep`` newest snapshots with the same ``suffix`` are kept.
+    """
+    os.makedirs(directory, exist_ok=True)
+    target_path = os.path.join(directory, snapshot_name(path, suffix=suffix))
+    result = BackupResult(path, target_path)
+    partial = target_path + ".part"
+    start = time.perf_counter()
+    source = sqlite3.connect(path, timeout=5)
+    target = sqlite3.connect(partial)
+    try:
+        try:
+            _copy(source, target, result, pages, pause)
+        finally:
+            target.close()
+            source.close()
+    except BaseException:
+        # Don't leave a half-written copy behind
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    os.replace(partial, target_path)
+    result.elapsed = time.perf_counter() - start
+
+    if keep:
+        for old in snapshots(path, directory, suffix)[:-keep]:
+            os.remove(old)
+            result.pruned.append(old)
+    return result
+
+
+def restore(snapshot, path, directory=BACKUP_DIR, pages=PAGES_PER_STEP):
+    """Replace the database at ``path`` with ``snapshot`` after checking the snapshot's integrity.
+
+    The current database is snapshotted first (with a "-pre-restore" suffix),
+    so a restore can itself be undone; the ``KEEP_PRE_RESTORE`` newest of
+    those are kept.
+    """
+    check_integrity(snapshot)
+    saved = None
+    if os.path.exists(path):
+        saved = backup(path, directory, KEEP_PRE_RESTORE, suffix=PRE_RESTORE).path
+    result = BackupResult(snapshot, path)
+    start = time.perf_counter()
+    source = sqlite3.connect(f"file:{snapshot}?mode=ro", uri=True)
+    target = sqlite3.connect(path, timeout=5)
+    try:
+        _copy(source, target, result, pages, 0)
+    finally:
+        target.close()
+        source.close()
+    result.elapsed = time.perf_counter() - start
+    return result, saved
+
+
+def run_schedule(path, interval, directory=BACKUP_DIR, keep=KEEP):
+    """Take a snapshot every ``interval`` seconds until interrupted."""
+    while True:
+        try:
+            print(backup(path, directory, keep), flush=True)
+        except (sqlite3.Error, OSError) as e:
+            print(f"Backup failed: {e}", flush=True)
+        time.sleep(interval)
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    from database import DB_PATH
+
+    parser = argparse.ArgumentParser(description="Back up and restore the library database while it is in use.")
+    parser.add_argument("--db", default=DB_PATH, help="database file (default: %(default)s)")
+    parser.add_argument("--dir", default=BACKUP_DIR, help="snapshot directory (default: %(default)s)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = commands.add_parser("backup", help="take a snapshot now")
+    command.add_argument("--keep", type=int, default=KEEP, help="snapshots to keep (default: %(default)s)")
+    command.add_argument("--pages", type=int, default=PAGES_PER_STEP, help="pages per step (default: %(default)s)")
+    command = commands.add_parser("schedule", help="take a snapshot every --every minutes")
+    command.add_argument("--every", type=float, default=60, help="minutes between snapshots (default: %(default)s)")
+    command.add_argument("--keep", type=int, default=KEEP, help="snapshots to keep (default: %(default)s)")
+    commands.add_parser("list", help="list snapshots")
+    command = commands.add_parser("restore", help="check a snapshot and copy it over the database")
+    command.add_argument("snapshot", nargs="?", help="snapshot file (default: the newest)")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "backup":
+            result = backup(args.db, args.dir, args.keep, args.pages)
+            print(result)
+            for old in result.pruned:
+                print(f"Removed {old}")
+        elif args.command == "schedule":
+            run_schedule(args.db, args.every * 60, args.dir, args.keep)
+        elif args.command == "list":
+            for path in snapshots(args.db, args.dir):
+                print(f"{path}\t{os.path.getsize(path) / 1e6:.1f} MB")
+        else:
+            snapshot = args.snapshot or (snapshots(args.db, args.dir) or [None])[-1]
+            if snapshot is None:
+                sys.exit("No snapshots found")
+            result, saved = restore(snapshot, args.db, args.dir)
+            if saved:
+                print(f"Saved the current database as {saved}")
+            print(result)
+    except BackupError as e:
+        sys.exit(str(e))
+    except sqlite3.Error as e:
+        sys.exit(f"Database error: {e}")
+    except KeyboardInterrupt:
+        pass
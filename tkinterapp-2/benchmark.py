@@ -0,0 +1,407 @@
+import contextlib
+import csv
+import io
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from database import configure, get_db, init_db
+from library import overdue_loans, overdue_report
+from widgets import RowWindow
+
+# Catalogue sizes: books, members and active loans
+SIZES = {
+    "10k": (10_000, 1_000, 1_000),
+    "100k": (100_000, 10_000, 10_000),
+    "1m": (1_000_000, 100_000, 100_000),
+}
+
+# Returned loans generated per active loan, as borrow history
+HISTORY_PER_LOAN = 5
+
+# Rows inserted per executemany call while generating
+GENERATE_BATCH = 50_000
+
+# Medians slower than the baseline by more than this fraction (and by more
+# than NOISE_MS) are reported as regressions by --compare
+TOLERANCE = 0.20
+NOISE_MS = 0.5
+
+# What the view_books search box and the return form are benchmarked with
+SEARCHES = ["", "harry", "har", "lost garden", "zzz"]
+# Misspelt on purpose, for the fuzzy search mode
+FUZZY_SEARCHES = ["hary poter", "silnt rivr", "yilmaz"]
+LOAN_SEARCHES = ["", "harry"]
+
+WORDS = [
+    "harry", "potter", "lost", "garden", "silent", "river", "night", "empire",
+    "shadow", "winter", "ocean", "secret", "history", "journey", "storm", "glass",
+    "city", "stone", "fire", "dragon", "island", "memory", "crown", "forest",
+    "light", "broken", "golden", "house", "war", "peace", "dream", "machine",
+    "north", "letters", "summer", "kingdom", "star", "hunter", "road", "time",
+]
+FIRST_NAMES = [
+    "Ali", "Ayşe", "Mehmet", "Zeynep", "John", "Mary", "Emma", "Noah", "Olivia",
+    "Liam", "Can", "Elif", "Deniz", "Sofia", "Lucas", "Mia", "Ahmet", "Fatma",
+]
+LAST_NAMES = [
+    "Yılmaz", "Kaya", "Demir", "Şahin", "Smith", "Brown", "Taylor", "Wilson",
+    "Johnson", "Müller", "García", "Rossi", "Öztürk", "Aydın", "Martin", "Lee",
+]
+
+# Loans are dated relative to this, not to today, so runs are comparable
+BASE_DATE = datetime(2025, 1, 1)
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def _quiet(fn, *args):
+    # init_db prints when it creates the schema; keep the JSON output clean
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args)
+
+
+def remove_db(path):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def generate(db, books, members, loans, seed=0):
+    """Fill an empty, initialised database with a deterministic catalogue."""
+    rng = random.Random(seed)
+
+    def title():
+        return " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 4))).title()
+
+    def person():
+        return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+    with db.transaction():
+        for start in range(0, books, GENERATE_BATCH):
+            count = min(GENERATE_BATCH, books - start)
+            db.executemany(
+                "INSERT INTO books (title, author, available, copies) VALUES (?, ?, 1, 1)",
+                [(title(), person()) for _ in range(count)],
+            )
+        db.create_copies()
+        rows = []
+        for i in range(1, members + 1):
+            name = person()
+            rows.append((name, f"{name.lower().replace(' ', '.')}.{i}@example.com"))
+        db.executemany("INSERT INTO members (name, email) VALUES (?, ?)", rows)
+        # History first, so it has the lower ids, as it would in real use
+        rows = []
+        for _ in range(loans * HISTORY_PER_LOAN):
+            borrowed = BASE_DATE - timedelta(days=rng.randint(60, 730), seconds=rng.randint(0, 86399))
+            due = borrowed + timedelta(days=rng.randint(7, 30))
+            returned = borrowed + timedelta(days=rng.randint(1, 40))
+            rows.append((rng.randint(1, books), rng.randint(1, members), borrowed.strftime(DATE_FORMAT),
+                         due.strftime(DATE_FORMAT), returned.strftime(DATE_FORMAT)))
+        db.executemany(
+            """INSERT INTO borrows (book_id, member_id, borrow_date, return_date, due_at, returned_at)
+            VALUES (?1, ?2, ?3, ?4, CAST(strftime('%s', ?4) AS INTEGER), CAST(strftime('%s', ?5) AS INTEGER))""",
+            rows,
+        )
+        loaned = rng.sample(range(1, books + 1), loans)
+        rows = []
+        for book_id in loaned:
+            borrowed = BASE_DATE - timedelta(days=rng.randint(0, 60), seconds=rng.randint(0, 86399))
+            due = borrowed + timedelta(days=rng.randint(7, 30))
+            rows.append((book_id, rng.randint(1, members), borrowed.strftime(DATE_FORMAT), due.strftime(DATE_FORMAT)))
+        # Each book has one copy; the triggers mark it lent and the book unavailable
+        db.executemany(
+            """INSERT INTO borrows (book_id, member_id, borrow_date, return_date, due_at, copy_id)
+            VALUES (?1, ?2, ?3, ?4, CAST(strftime('%s', ?4) AS INTEGER),
+                    (SELECT id FROM copies WHERE book_id = ?1))""",
+            rows,
+        )
+    db.execute("ANALYZE")
+    db.mark_changed()
+
+
+def prepare(path, size, seed=0):
+    """Open the benchmark database for ``size``, generating it unless it already matches."""
+    books, members, loans = SIZES[size]
+    if os.path.exists(path):
+        db = configure(path)
+        try:
+            counts = db.query_one(
+                "SELECT (SELECT count(*) FROM books), (SELECT count(*) FROM members), (SELECT count(*) FROM borrows)"
+            )
+        except sqlite3.Error:
+            counts = None
+        # Benchmarked returns add to the history, so there may be more loans
+        if counts is not None and counts[:2] == (books, members) and counts[2] >= loans * (1 + HISTORY_PER_LOAN):
+            _quiet(init_db)
+            return db
+        db.close()
+        remove_db(path)
+
+    log(f"Generating {size} catalogue in {path} ...")
+    start = time.perf_counter()
+    db = configure(path)
+    _quiet(init_db)
+    generate(db, books, members, loans, seed)
+    log(f"Generated in {time.perf_counter() - start:.1f}s")
+    return db
+
+
+def summarize(times):
+    return {
+        "runs": len(times),
+        "min_ms": round(min(times), 3),
+        "median_ms": round(statistics.median(times), 3),
+        "max_ms": round(max(times), 3),
+    }
+
+
+def timed(fn, repeat, setup=None):
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return summarize(times)
+
+
+def first_screen(query):
+    # What PagedTreeview does when a search is shown: one page, then the total
+    window = RowWindow(query)
+    page, _ = window.load_next()
+    return len(page) if window.exhausted else query.count()
+
+
+def bench_init_db(db, repeat):
+    results = {}
+    fresh = os.path.join(tempfile.mkdtemp(prefix="library-bench-"), "fresh.db")
+
+    def create():
+        remove_db(fresh)
+        configure(fresh)
+
+    results["init_db/new"] = timed(lambda: _quiet(init_db), repeat, setup=create)
+    configure(fresh).close()
+    remove_db(fresh)
+    os.rmdir(os.path.dirname(fresh))
+
+    configure(db.path)
+    results["init_db/existing"] = timed(lambda: _quiet(init_db), repeat, setup=lambda: configure(db.path))
+    return results
+
+
+def bench_import(books, repeat, seed=0):
+    """Bulk-load a CSV of ``books`` books into a fresh database with importer.py."""
+    from importer import import_file
+
+    rng = random.Random(seed)
+    directory = tempfile.mkdtemp(prefix="library-bench-")
+    source = os.path.join(directory, "books.csv")
+    fresh = os.path.join(directory, "import.db")
+    with open(source, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["title", "author", "copies"])
+        for _ in range(books):
+            title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 4))).title()
+            writer.writerow([title, f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", rng.randint(1, 3)])
+
+    def create():
+        remove_db(fresh)
+        configure(fresh)
+        _quiet(init_db)
+
+    results = {"import/books_csv": timed(lambda: import_file(get_db(), "books", source), repeat, setup=create)}
+    configure(fresh).close()
+    remove_db(fresh)
+    os.remove(source)
+    os.rmdir(directory)
+    return results
+
+
+def bench_searches(db, repeat):
+    results = {}
+    clear = db.result_cache.clear
+    for text in SEARCHES:
+        results[f"search/view_books/{text or 'all'}"] = timed(
+            lambda: first_screen(db.search_books(text)), repeat, setup=clear
+        )
+        results[f"search/borrow_form/{text or 'all'}"] = timed(
+            lambda: first_screen(db.search_books(text, title_only=True, available_only=True)), repeat, setup=clear
+        )
+    for text in FUZZY_SEARCHES:
+        results[f"search/fuzzy/{text}"] = timed(
+            lambda: first_screen(db.search_books(text, fuzzy=True)), repeat, setup=clear
+        )
+    for text in LOAN_SEARCHES:
+        results[f"borrowed_books/{text or 'all'}"] = timed(
+            lambda: first_screen(db.borrowed_books(text)), repeat, setup=clear
+        )
+    for days in (0, 7):
+        results[f"overdue/within_{days}_days"] = timed(
+            lambda: first_screen(overdue_loans(db, days, BASE_DATE)), repeat
+        )
+        results[f"overdue/report_within_{days}_days"] = timed(
+            lambda: overdue_report(db, days, BASE_DATE), repeat
+        )
+    results["statistics"] = timed(db.circulation_stats, repeat)
+    return results
+
+
+def bench_borrow_return(db, operations):
+    query = db.search_books("", title_only=True, available_only=True)
+    book_ids = [key[-1] for key, _ in query.page(None, operations)]
+    borrow_date = BASE_DATE.strftime(DATE_FORMAT)
+    return_date = (BASE_DATE + timedelta(days=14)).strftime(DATE_FORMAT)
+    borrows, returns = [], []
+    for book_id in book_ids:
+        start = time.perf_counter()
+        borrow_id = db.borrow_book(book_id, 1, borrow_date, return_date)
+        if borrow_id is None:
+            raise RuntimeError(f"Book {book_id} could not be borrowed")
+        borrows.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        db.return_book(borrow_id)
+        returns.append((time.perf_counter() - start) * 1000)
+    return {"borrow": summarize(borrows), "return": summarize(returns)}
+
+
+def bench_scroll(db, repeat, pages=25):
+    """Scroll the View Books list down ``pages`` pages and back up, without a display."""
+    def scroll():
+        window = RowWindow(db.search_books(""))
+        for _ in range(pages):
+            window.load_next()
+        while window.first_page > 0:
+            window.load_previous()
+
+    results = {"treeview/model_scroll": timed(scroll, repeat, setup=db.result_cache.clear)}
+
+    # What the borrow form does to its list after a loan: re-read and fold in
+    # the one changed book, versus reloading the first screen as it used to
+    query = db.search_books("", title_only=True, available_only=True)
+    window = RowWindow(query)
+    window.load_next()
+    book_id = next(window.rows())[0][-1]
+    results["treeview/model_update_one"] = timed(
+        lambda: window.update({book_id}, query.rows_for({book_id})), repeat
+    )
+    results["treeview/model_reload"] = timed(lambda: RowWindow(query).load_next(), repeat)
+    return results
+
+
+def bench_treeview(db, repeat, pages=10):
+    """Fill and scroll a real PagedTreeview; skipped when there is no display (use Xvfb)."""
+    import tkinter as tk
+
+    from widgets import PagedTreeview
+
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        log(f"Skipping Treeview benchmark: {e}")
+        return {}
+    root.withdraw()
+    table = PagedTreeview(root, columns=("ID", "Title", "Author", "Available"))
+    table.pack()
+
+    def populate():
+        table.set_query(db.search_books(""))
+        for _ in range(pages):
+            table._load(table.window.load_next, at_end=True)
+        root.update()
+
+    try:
+        return {"treeview/populate": timed(populate, repeat, setup=db.result_cache.clear)}
+    finally:
+        root.destroy()
+
+
+def run(size, path=None, repeat=5, operations=200, seed=0, tk=True):
+    path = path or os.path.join(tempfile.gettempdir(), f"library-bench-{size}.db")
+    db = prepare(path, size, seed)
+    results = {}
+    log("Timing init_db ...")
+    results.update(bench_init_db(db, repeat))
+    db = configure(path)
+    log("Timing bulk import ...")
+    results.update(bench_import(SIZES[size][0], repeat, seed))
+    db = configure(path)
+    log("Timing searches ...")
+    results.update(bench_searches(db, repeat))
+    log("Timing borrow and return ...")
+    results.update(bench_borrow_return(db, operations))
+    log("Timing list scrolling ...")
+    results.update(bench_scroll(db, repeat))
+    if tk:
+        results.update(bench_treeview(db, repeat))
+    books, members, loans = SIZES[size]
+    return {
+        "size": size,
+        "books": books,
+        "members": members,
+        "loans": loans,
+        "seed": seed,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "fts5": db.has_fts,
+        "results": results,
+    }
+
+
+def compare(baseline, current, tolerance=TOLERANCE):
+    """Return [(name, old_ms, new_ms)] for results whose median got slower."""
+    regressions = []
+    for name, stats in current["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            continue
+        old_ms, new_ms = old["median_ms"], stats["median_ms"]
+        if new_ms > old_ms * (1 + tolerance) and new_ms - old_ms > NOISE_MS:
+            regressions.append((name, old_ms, new_ms))
+    return regressions
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the library workflows on a generated catalogue.")
+    parser.add_argument("--size", choices=list(SIZES), default="10k")
+    parser.add_argument("--db", help="benchmark database file (default: in the temp directory)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per timing (default: %(default)s)")
+    parser.add_argument("--operations", type=int, default=200, help="borrow/return pairs (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-tk", action="store_true", help="skip the real Treeview benchmark")
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="allowed slowdown of a median before it counts as a regression (default: %(default)s)")
+    args = parser.parse_args()
+
+    report = run(args.size, args.db, args.repeat, args.operations, args.seed, tk=not args.no_tk)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(json.load(f), report, args.tolerance)
+        for name, old_ms, new_ms in regressions:
+            log(f"REGRESSION {name}: {old_ms:.3f} ms -> {new_ms:.3f} ms")
+        if not regressions:
+            log("No regressions")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,58 @@
+import threading
+
+# Kinds of change, with the tables whose row ids they carry
+BOOK_ADDED = "book_added"                      # books
+AVAILABILITY_CHANGED = "availability_changed"  # books
+LOAN_CREATED = "loan_created"                  # borrows
+LOAN_CLOSED = "loan_closed"                    # borrows
+MEMBER_ADDED = "member_added"                  # members
+HOLD_PLACED = "hold_placed"                    # holds
+HOLD_CHANGED = "hold_changed"                  # holds
+# Too many rows changed to list them (a bulk import); the ids are None
+RELOADED = "reloaded"
+
+
+class Change:
+    """One committed change and the ids of the rows it touched, per table.
+
+    ``Change(LOAN_CREATED, borrows=[12])``; an id set of None means any row
+    of that table may have changed.
+    """
+
+    def __init__(self, kind, **ids):
+        self.kind = kind
+        self.ids = {table: None if rows is None else frozenset(rows) for table, rows in ids.items()}
+
+    def __repr__(self):
+        return f"Change({self.kind!r}, {self.ids!r})"
+
+
+class ChangeBus:
+    """Hands committed changes to every subscriber, in commit order.
+
+    Subscribers are called on the thread that committed the write, with a
+    list of Change objects; the GUI passes them on to the Tk thread itself
+    (see BookLendingApp.on_changes).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        with self._lock:
+            self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def publish(self, changes):
+        if not changes:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            callback(list(changes))
@@ -0,0 +1,1078 @@
+import functools
+import random
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from changes import (
+    AVAILABILITY_CHANGED, BOOK_ADDED, HOLD_CHANGED, HOLD_PLACED, LOAN_CLOSED, LOAN_CREATED, MEMBER_ADDED, Change,
+    ChangeBus,
+)
+from instrument import Histogram
+from search import (
+    CachedQuery, FuzzyMatcher, PrefixMatcher, ResultCache, StartsWithMatcher, SubstringMatcher, trigram_words,
+)
+
+DB_PATH = "library.db"
+
+# PRAGMAs applied to every connection we open
+DEFAULT_PRAGMAS = {
+    "journal_mode": "wal",
+    "synchronous": "normal",
+    "cache_size": -20000,       # negative = KiB, so ~20 MB page cache
+    "mmap_size": 268435456,     # 256 MB memory mapped I/O
+    "temp_store": "memory",
+    "busy_timeout": 5000,       # ms to wait for another connection's write lock
+}
+
+# A write that still finds the database locked after busy_timeout is retried
+# this many times, waiting RETRY_DELAY seconds, doubling each time
+WRITE_RETRIES = 4
+RETRY_DELAY = 0.05
+
+# SQL for "now" in the scale of borrows.due_at and returned_at
+NOW_SECONDS = "CAST(strftime('%s', 'now', 'localtime') AS INTEGER)"
+
+# Number of prepared statements kept per connection
+STATEMENT_CACHE_SIZE = 256
+
+# Columns the lists can be sorted by, as ORDER BY keys; the id breaks ties.
+# Each is backed by an index (see migrations.create_sort_indexes)
+BOOK_SORTS = {
+    "id": ("books.id",),
+    "title": ("books.title COLLATE NOCASE", "books.id"),
+    "author": ("books.author COLLATE NOCASE", "books.id"),
+    "available": ("books.available", "books.id"),
+}
+LOAN_SORTS = {
+    "book": ("borrows.book_id", "borrows.id"),
+    "title": ("books.title COLLATE NOCASE", "borrows.id"),
+    "author": ("books.author COLLATE NOCASE", "borrows.id"),
+    "borrower": ("members.name COLLATE NOCASE", "borrows.id"),
+    "email": ("members.email COLLATE NOCASE", "borrows.id"),
+    "return_date": ("borrows.due_at", "borrows.id"),
+}
+AVAILABILITY = {
+    "available": "books.available > 0",
+    "unavailable": "books.available = 0",
+}
+
+# Barcodes of copies that weren't labelled by hand: "<book id>-<copy number>".
+# GENERATED_BARCODE is the same in SQL, for books joined with a counter n(i)
+def generated_barcode(book_id, number):
+    return f"{book_id}-{number}"
+
+
+GENERATED_BARCODE = "books.id || '-' || n.i"
+
+# A waiting hold's place in its book's queue, counted on the queue index
+QUEUE_POSITION = """(SELECT count(*) FROM holds AS ahead
+    WHERE ahead.book_id = holds.book_id AND ahead.status = 'waiting'
+    AND (ahead.created_at, ahead.id) <= (holds.created_at, holds.id))"""
+
+# SQLite's NOCASE collation only folds ASCII letters
+NOCASE = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+# Ids looked up per statement when re-reading changed rows
+ID_BATCH = 500
+
+# Fuzzy search returns the FUZZY_LIMIT best rows scoring at least
+# FUZZY_THRESHOLD, re-ranked from up to FUZZY_CANDIDATES trigram index hits
+FUZZY_LIMIT = 100
+FUZZY_CANDIDATES = 1000
+FUZZY_THRESHOLD = 0.4
+
+
+def fts5_available():
+    """Whether the linked SQLite library was compiled with FTS5."""
+    try:
+        conn = sqlite3.connect(":memory:")
+        try:
+            conn.execute("CREATE VIRTUAL TABLE fts5_probe USING fts5(x)")
+        finally:
+            conn.close()
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def trigram_available():
+    """Whether FTS5 has the trigram tokenizer (SQLite 3.34 and later)."""
+    try:
+        conn = sqlite3.connect(":memory:")
+        try:
+            conn.execute("CREATE VIRTUAL TABLE trigram_probe USING fts5(x, tokenize='trigram')")
+        finally:
+            conn.close()
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def fts_query(search_query, columns=None):
+    """Turn free text into an FTS5 prefix query, e.g. 'harry pot' -> '"harry"* "pot"*'.
+
+    Returns None if the text has no searchable tokens.
+    """
+    tokens = re.findall(r"\w+", search_query)
+    if not tokens:
+        return None
+    expr = " ".join(f'"{token}"*' for token in tokens)
+    if columns:
+        return "{%s} : (%s)" % (" ".join(columns), expr)
+    return expr
+
+
+def like_escape(text):
+    """``text`` with LIKE wildcards escaped, for use with ESCAPE '\\'."""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def like_prefix(text):
+    """LIKE pattern matching values that start with ``text`` (escape character: backslash)."""
+    return like_escape(text) + "%"
+
+
+def like_substring(text):
+    """LIKE pattern matching values that contain ``text`` (escape character: backslash)."""
+    return "%" + like_escape(text) + "%"
+
+
+def is_busy(error):
+    return isinstance(error, sqlite3.OperationalError) and "locked" in str(error)
+
+
+def retry_busy(method):
+    """Re-run a Database write whose transaction failed because the database was locked."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        for attempt in range(WRITE_RETRIES + 1):
+            try:
+                return method(self, *args, **kwargs)
+            except sqlite3.OperationalError as e:
+                # Inside an outer transaction only the caller can start over
+                if not is_busy(e) or attempt == WRITE_RETRIES or self.connection().in_transaction:
+                    raise
+            self.busy_retries += 1
+            # Jitter so competing clients don't retry in lockstep
+            time.sleep(RETRY_DELAY * 2 ** attempt * random.uniform(0.5, 1.5))
+    return wrapper
+
+
+class QueryStats:
+    """Per-statement call counts and latency histograms."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, sql, elapsed):
+        key = " ".join(sql.split())
+        with self._lock:
+            histogram = self._stats.get(key)
+            if histogram is None:
+                histogram = self._stats[key] = Histogram()
+            histogram.add(elapsed)
+
+    def snapshot(self):
+        with self._lock:
+            return {sql: histogram.summary() for sql, histogram in self._stats.items()}
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+class KeysetQuery:
+    """A SELECT that is read page by page with keyset pagination.
+
+    Rows are ordered by the ``order`` expressions, the last of which must be
+    unique (normally the primary key). Each page continues strictly after the
+    key of the previous page's last row, so fetching page N costs the same as
+    fetching page 1 no matter how deep into the result set it is. With
+    ``descending`` every order expression is reversed.
+    """
+
+    def __init__(self, db, columns, source, where=(), params=(), order=("id",), descending=False):
+        self.db = db
+        self.columns = columns
+        self.source = source
+        self.where = list(where)
+        self.params = tuple(params)
+        self.order = tuple(order)
+        self.descending = descending
+
+    def _where_sql(self, extra=None):
+        clauses = self.where + ([extra] if extra else [])
+        return f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    def page_sql(self, after=None, limit=200):
+        keys = ", ".join(self.order)
+        direction = " DESC" if self.descending else ""
+        extra = None
+        params = self.params
+        if after is not None:
+            less = "<" if self.descending else ">"
+            extra = f"({keys}) {less} ({', '.join('?' * len(self.order))})"
+            params = params + tuple(after)
+            if len(self.order) > 1:
+                # The planner only sees a range on the leading column when it is
+                # spelled out; without it a sort index is passed over for page 2+
+                extra = f"{self.order[0]} {less}= ? AND {extra}"
+                params = self.params + (after[0],) + tuple(after)
+        sql = (
+            f"SELECT {keys}, {self.columns} FROM {self.source} {self._where_sql(extra)} "
+            f"ORDER BY {', '.join(key + direction for key in self.order)} LIMIT ?"
+        )
+        return sql, params + (limit,)
+
+    def sort_key(self, key):
+        """``key`` as Python should compare it to agree with ORDER BY (NOCASE text folded)."""
+        return tuple(
+            value.translate(NOCASE) if isinstance(value, str) and "NOCASE" in expression.upper() else value
+            for expression, value in zip(self.order, key)
+        )
+
+    def valid_key(self, key):
+        """Whether ``key`` (e.g. a cursor from a client) has this query's shape: one plain value per order column."""
+        return len(key) == len(self.order) and all(
+            isinstance(value, (str, int, float)) and not isinstance(value, bool) for value in key
+        )
+
+    def page(self, after=None, limit=200):
+        """Return up to ``limit`` (key, values) pairs following the key ``after``."""
+        rows = self.db.query(*self.page_sql(after, limit))
+        width = len(self.order)
+        return [(row[:width], row[width:]) for row in rows]
+
+    def count(self):
+        return self.db.query_one(
+            f"SELECT count(*) FROM {self.source} {self._where_sql()}", self.params
+        )[0]
+
+    @property
+    def key_table(self):
+        """Table whose ids are the rows' unique key, e.g. "books" for order ("hits.score", "books.id")."""
+        last = self.order[-1]
+        return last.split(".")[0] if "." in last else self.source.split()[0]
+
+    def rows_for(self, ids):
+        """(key, values) of the rows with these ids (of the last order column) that match the query."""
+        ids = list(ids)
+        keys = ", ".join(self.order)
+        rows = []
+        for i in range(0, len(ids), ID_BATCH):
+            batch = ids[i:i + ID_BATCH]
+            extra = f"{self.order[-1]} IN ({', '.join('?' * len(batch))})"
+            rows += self.db.query(
+                f"SELECT {keys}, {self.columns} FROM {self.source} {self._where_sql(extra)}",
+                self.params + tuple(batch),
+            )
+        width = len(self.order)
+        return [(row[:width], row[width:]) for row in rows]
+
+    def all(self, page_size=1000):
+        """Iterate over every row, one page in memory at a time."""
+        after = None
+        while True:
+            page = self.page(after, page_size)
+            for _, values in page:
+                yield values
+            if len(page) < page_size:
+                return
+            after = page[-1][0]
+
+
+class FuzzyQuery:
+    """Typo-tolerant book search with the same page/count interface as KeysetQuery.
+
+    Candidates come from the books_trigram index and are re-ranked by
+    FuzzyMatcher in Python; only the best FUZZY_LIMIT are kept, keyed by
+    (rank, id), so the whole result is computed once and then paged from memory.
+    """
+
+    def __init__(self, db, text, title_only=False, where=(), params=()):
+        self.db = db
+        self.text = text
+        self.title_only = title_only
+        # Extra filters on books, as in KeysetQuery
+        self.where = list(where)
+        self.params = tuple(params)
+        self.matcher = FuzzyMatcher(text, (1,) if title_only else (1, 2))
+        self._rows = None
+        self._lock = threading.Lock()
+
+    def stages(self):
+        """FTS5 match expressions, strictest first.
+
+        A typo spoils at most three trigrams of a word, so the strict stages
+        ask for two of a word's trigrams close together; the last accepts any
+        one. Unranked index lookups like these stream in rowid order and stop
+        after FUZZY_CANDIDATES hits, which keeps even a million titles fast;
+        bm25 ordering would have to score every hit first.
+        """
+        grams = trigram_words(self.text)
+        if not grams:
+            return []
+        quoted = [['"%s"' % gram.replace('"', '""') for gram in word] for word in grams]
+
+        def two_of(word):
+            if len(word) < 3:
+                return " OR ".join(word)
+            pairs = [f"{word[i]} AND {word[j]}" for i in range(len(word)) for j in range(i + 1, min(i + 4, len(word)))]
+            return "(" + " OR ".join(f"({pair})" for pair in pairs) + ")"
+
+        stages = [" AND ".join(two_of(word) for word in quoted)]
+        if len(quoted) > 1:
+            stages.append(" OR ".join(two_of(word) for word in quoted))
+        stages.append(" OR ".join(gram for word in quoted for gram in word))
+        if self.title_only:
+            stages = ["{title} : (%s)" % stage for stage in stages]
+        return list(dict.fromkeys(stages))
+
+    def _where_sql(self, extra=None):
+        clauses = self.where + ([extra] if extra else [])
+        return f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    def rows(self):
+        with self._lock:
+            if self._rows is None:
+                self._rows = self._search()
+            return self._rows
+
+    def _search(self):
+        candidates = {}
+        for match in self.stages():
+            rows = self.db.query(
+                f"""SELECT books.id, books.title, books.author, books.available
+                FROM (SELECT rowid AS id FROM books_trigram WHERE books_trigram MATCH ? LIMIT ?) AS hits
+                JOIN books ON books.id = hits.id {self._where_sql()}""",
+                (match, FUZZY_CANDIDATES) + self.params,
+            )
+            for row in rows:
+                candidates.setdefault(row[0], row)
+            if len(candidates) >= FUZZY_CANDIDATES:
+                break
+        scored = [(self.matcher.score(row), row) for row in candidates.values()]
+        scored = [(score, row) for score, row in scored if score >= FUZZY_THRESHOLD]
+        scored.sort(key=lambda item: (-item[0], item[1][0]))
+        return [((rank, row[0]), row) for rank, (_, row) in enumerate(scored[:FUZZY_LIMIT])]
+
+    def valid_key(self, key):
+        # (rank, id)
+        return len(key) == 2 and all(isinstance(value, int) and not isinstance(value, bool) for value in key)
+
+    def page(self, after=None, limit=200):
+        rows = self.rows()
+        start = 0 if after is None else tuple(after)[0] + 1
+        return rows[start:start + limit]
+
+    def count(self):
+        return len(self.rows())
+
+    def all(self, page_size=1000):
+        for _, values in self.rows():
+            yield values
+
+    key_table = "books"
+
+    def rows_for(self, ids):
+        """Fresh values for those of ``ids`` already in the result; new books aren't ranked in."""
+        with self._lock:
+            positions = {key[1]: i for i, (key, _) in enumerate(self._rows or [])}
+        wanted = [book_id for book_id in ids if book_id in positions]
+        if not wanted:
+            return []
+        placeholders = ", ".join("?" * len(wanted))
+        fresh = self.db.query(
+            "SELECT books.id, books.title, books.author, books.available FROM books "
+            + self._where_sql(f"books.id IN ({placeholders})"),
+            self.params + tuple(wanted),
+        )
+        rows = []
+        with self._lock:
+            for row in fresh:
+                i = positions[row[0]]
+                self._rows[i] = (self._rows[i][0], row)
+                rows.append(self._rows[i])
+        return rows
+
+
+class Database:
+    """Long-lived SQLite access shared by the whole application.
+
+    Each thread gets one connection which is kept open for the life of the
+    process, so handlers no longer pay for connect/close and the page cache
+    stays warm between clicks.
+    """
+
+    def __init__(self, path=DB_PATH, pragmas=None):
+        self.path = path
+        self.pragmas = dict(DEFAULT_PRAGMAS)
+        if pragmas:
+            self.pragmas.update(pragmas)
+        self.connect_count = 0
+        self.busy_retries = 0
+        self.stats = QueryStats()
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._has_fts = None
+        self._has_trigram = None
+        # Bumped by every write that changes what a book search returns
+        self.generation = 0
+        # Row-level changes, announced once their transaction has committed
+        self.changes = ChangeBus()
+        self.result_cache = ResultCache(self)
+
+    # Connection handling
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    def _connect(self):
+        # isolation_level=None: we issue BEGIN/COMMIT ourselves in transaction()
+        conn = sqlite3.connect(
+            self.path,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        for name, value in self.pragmas.items():
+            if value is not None:
+                conn.execute(f"PRAGMA {name} = {value}")
+        with self._lock:
+            self.connect_count += 1
+            self._connections.append(conn)
+        return conn
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+    # Statement execution
+    def execute(self, sql, params=()):
+        conn = self.connection()
+        start = time.perf_counter()
+        try:
+            return conn.execute(sql, params)
+        finally:
+            self.stats.record(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_params):
+        conn = self.connection()
+        start = time.perf_counter()
+        try:
+            return conn.executemany(sql, seq_of_params)
+        finally:
+            self.stats.record(sql, time.perf_counter() - start)
+
+    def query(self, sql, params=()):
+        conn = self.connection()
+        start = time.perf_counter()
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            self.stats.record(sql, time.perf_counter() - start)
+
+    def query_one(self, sql, params=()):
+        conn = self.connection()
+        start = time.perf_counter()
+        try:
+            return conn.execute(sql, params).fetchone()
+        finally:
+            self.stats.record(sql, time.perf_counter() - start)
+
+    @contextmanager
+    def transaction(self):
+        conn = self.connection()
+        if conn.in_transaction:
+            # Nested use joins the outer transaction
+            yield conn
+            return
+        # IMMEDIATE takes the write lock up front: a deferred transaction
+        # that reads first can't upgrade while another connection writes
+        conn.execute("BEGIN IMMEDIATE")
+        self._local.changes = []
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            self._local.changes = []
+            raise
+        else:
+            conn.execute("COMMIT")
+            changes, self._local.changes = self._local.changes, []
+            self.changes.publish(changes)
+
+    # Schema
+    def init_schema(self):
+        """Create or upgrade the schema; see migrations.py."""
+        from migrations import SCHEMA_VERSION, migrate
+
+        # Fast path for every start after the first: one read of the database
+        # header instead of a transaction per check
+        if self.query_one("PRAGMA user_version")[0] == SCHEMA_VERSION:
+            return []
+        applied = migrate(self)
+        self._has_fts = None
+        self._has_trigram = None
+        return applied
+
+    def mark_changed(self, *changes):
+        """Invalidate cached search results after books, members or loans changed.
+
+        ``changes`` are published on the change bus; inside a transaction they
+        wait until it commits, and are dropped if it rolls back.
+        """
+        self.generation += 1
+        if self.connection().in_transaction:
+            self._local.changes.extend(changes)
+        else:
+            self.changes.publish(changes)
+
+    @property
+    def has_fts(self):
+        if self._has_fts is None:
+            self._has_fts = self.query_one(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'books_fts'"
+            ) is not None
+        return self._has_fts
+
+    @property
+    def has_trigram(self):
+        if self._has_trigram is None:
+            self._has_trigram = self.query_one(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'books_trigram'"
+            ) is not None
+        return self._has_trigram
+
+    # Books
+    @retry_busy
+    def add_book(self, title, author, copies=1, barcodes=()):
+        """Add a title with ``copies`` new copies, labelled ``barcodes`` first. Returns the book id."""
+        with self.transaction():
+            # The counters start at zero; the copies triggers count the copies in
+            book_id = self.execute(
+                "INSERT INTO books (title, author, available, copies) VALUES (?, ?, 0, 0)", (title, author)
+            ).lastrowid
+            self._insert_copies(book_id, 0, copies, barcodes)
+        self.mark_changed(Change(BOOK_ADDED, books=[book_id]))
+        return book_id
+
+    @retry_busy
+    def add_copies(self, book_id, copies=1, barcodes=()):
+        """Add copies to a title. Returns their barcodes, or None if there is no such book."""
+        with self.transaction():
+            row = self.query_one("SELECT copies FROM books WHERE id = ?", (book_id,))
+            if row is None:
+                return None
+            labels = self._insert_copies(book_id, row[0], copies, barcodes)
+        self.mark_changed(Change(AVAILABILITY_CHANGED, books=[book_id]))
+        return labels
+
+    def _insert_copies(self, book_id, existing, copies, barcodes):
+        barcodes = list(barcodes)
+        labels = barcodes + [
+            generated_barcode(book_id, existing + len(barcodes) + i) for i in range(1, copies - len(barcodes) + 1)
+        ]
+        self.executemany("INSERT INTO copies (book_id, barcode) VALUES (?, ?)", [(book_id, label) for label in labels])
+        return labels
+
+    def create_copies(self, after_id=0):
+        """Create the copy rows of every book after ``after_id``, for bulk loads.
+
+        The books must have been inserted with ``copies`` and ``available``
+        already set to their number of copies. The per-copy trigger would
+        count them a second time, so it is suspended while one statement
+        creates them all with generated barcodes (and so is the hold trigger:
+        nobody can be queueing for a book that did not exist yet).
+        """
+        with self.transaction():
+            triggers = self.query(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name IN ('copies_ai', 'copies_hold_ai')"
+            )
+            for name, _ in triggers:
+                self.execute(f"DROP TRIGGER {name}")
+            self.execute(
+                f"""WITH RECURSIVE n(i) AS (
+                    SELECT 1 UNION ALL SELECT i + 1 FROM n
+                    WHERE i < (SELECT coalesce(max(copies), 0) FROM books WHERE id > ?1)
+                )
+                INSERT INTO copies (book_id, barcode)
+                SELECT books.id, {GENERATED_BARCODE} FROM books CROSS JOIN n
+                WHERE books.id > ?1 AND n.i <= books.copies""",
+                (after_id,),
+            )
+            for _, sql in triggers:
+                self.execute(sql)
+
+    def find_book(self, title, author):
+        """Id of the book with this title and author (ignoring case), or None."""
+        row = self.query_one(
+            "SELECT id FROM books WHERE title = ? COLLATE NOCASE AND author = ? COLLATE NOCASE LIMIT 1",
+            (title, author),
+        )
+        return row[0] if row else None
+
+    def get_book(self, book_id):
+        """The book's (id, title, author, available, copies) row, or None."""
+        return self.query_one("SELECT id, title, author, available, copies FROM books WHERE id = ?", (book_id,))
+
+    def book_copies(self, book_id):
+        """(copy id, barcode, lent) for each copy of the book."""
+        return self.query("SELECT id, barcode, lent FROM copies WHERE book_id = ? ORDER BY id", (book_id,))
+
+    def find_copy(self, barcode):
+        """The (copy id, book id, lent) of the copy with this barcode, or None."""
+        return self.query_one("SELECT id, book_id, lent FROM copies WHERE barcode = ?", (barcode,))
+
+    def search_books(self, search_query="", title_only=False, available_only=False, fuzzy=False,
+                     sort=None, descending=False, author="", availability=None):
+        """Return a pageable query over (id, title, author, available) rows.
+
+        Text searches are wrapped in a CachedQuery, so repeated and refined
+        searches can be answered from memory. With ``fuzzy`` the closest
+        matches are returned, best first, even when the text has typos.
+
+        ``sort`` (a BOOK_SORTS name, optionally ``descending``) orders the rows
+        by that column instead of by id or relevance, ``author`` keeps authors
+        starting with it and ``availability`` is "available" or "unavailable".
+        All of it is done in SQL on indexes, so sorted pages cost the same as
+        unsorted ones.
+        """
+        columns = "books.id, books.title, books.author, books.available"
+        where, params = [], ()
+        if author:
+            where.append("books.author LIKE ? ESCAPE '\\'")
+            params = (like_prefix(author),)
+        if availability:
+            where.append(AVAILABILITY[availability])
+        elif available_only and not search_query:
+            where.append(AVAILABILITY["available"])
+        order = BOOK_SORTS[sort] if sort else None
+
+        if search_query and fuzzy and self.has_trigram and trigram_words(search_query):
+            return FuzzyQuery(self, search_query, title_only, where, params)
+        if search_query:
+            fields = ("title",) if title_only else ("title", "author")
+            match = fts_query(search_query, fields) if self.has_fts else None
+            positions = (1,) if title_only else (1, 2)
+            if match is not None and order is None:
+                # Token/prefix search on the FTS index, best bm25 matches first
+                query = KeysetQuery(
+                    self, columns,
+                    """(SELECT rowid AS id, rank AS score FROM books_fts WHERE books_fts MATCH ?) AS hits
+                    JOIN books ON books.id = hits.id""",
+                    where, (match,) + params,
+                    order=("hits.score", "books.id"),
+                )
+                matcher = PrefixMatcher(positions)
+            elif match is not None:
+                # Sorted matches: the sort column's index gives the order, the FTS index the filter
+                query = KeysetQuery(
+                    self, columns, "books",
+                    ["books.id IN (SELECT rowid FROM books_fts WHERE books_fts MATCH ?)"] + where, (match,) + params,
+                    order=order, descending=descending,
+                )
+                matcher = PrefixMatcher(positions)
+            else:
+                # No FTS5 in this SQLite build: fall back to a substring scan
+                pattern = like_substring(search_query)
+                if title_only:
+                    like, like_params = "books.title LIKE ? ESCAPE '\\'", (pattern,)
+                else:
+                    like = "(books.title LIKE ? ESCAPE '\\' OR books.author LIKE ? ESCAPE '\\')"
+                    like_params = (pattern, pattern)
+                query = KeysetQuery(
+                    self, columns, "books", [like] + where, like_params + params,
+                    order=order or ("books.id",), descending=descending,
+                )
+                matcher = SubstringMatcher(positions)
+            kind = ("titles" if title_only else "books", type(matcher).__name__, sort, descending, author, availability)
+            return CachedQuery(query, self.result_cache, kind, search_query, matcher)
+        return KeysetQuery(self, columns, "books", where, params, order=order or ("books.id",), descending=descending)
+
+    # Members
+    @retry_busy
+    def add_member(self, name, email):
+        with self.transaction():
+            member_id = self.execute(
+                "INSERT INTO members (name, email) VALUES (?, ?)", (name, email)
+            ).lastrowid
+        self.mark_changed(Change(MEMBER_ADDED, members=[member_id]))
+        return member_id
+
+    def get_member(self, member_id):
+        """The member's (id, name, email) row, or None."""
+        return self.query_one("SELECT id, name, email FROM members WHERE id = ?", (member_id,))
+
+    def find_members(self, prefix, limit=20):
+        """Up to ``limit`` (id, name, email) rows whose name or email starts with ``prefix``.
+
+        Both lookups walk a NOCASE index in order and stop after ``limit``
+        rows, so this stays fast however many members there are. Results are
+        cached per prefix, and a longer prefix is filtered in memory from a
+        shorter one whose result was complete.
+        """
+        cache = self.result_cache
+        rows = cache.get(("members", limit), prefix)
+        if rows is None:
+            rows = cache.refine(("complete members", limit), prefix, StartsWithMatcher((1, 2)))
+        if rows is None:
+            generation = self.generation
+            rows = [((member[0],), member) for member in self._find_members(prefix, limit)]
+            cache.put(("members", limit), prefix, rows, generation)
+            if len(rows) < limit:
+                cache.put(("complete members", limit), prefix, rows, generation)
+        return [member for _, member in rows]
+
+    def _find_members(self, prefix, limit):
+        if not prefix:
+            return self.query(
+                "SELECT id, name, email FROM members ORDER BY name COLLATE NOCASE LIMIT ?", (limit,)
+            )
+        pattern = like_prefix(prefix)
+        by_name = self.query(
+            "SELECT id, name, email FROM members WHERE name LIKE ? ESCAPE '\\' "
+            "ORDER BY name COLLATE NOCASE LIMIT ?",
+            (pattern, limit),
+        )
+        by_email = self.query(
+            "SELECT id, name, email FROM members WHERE email LIKE ? ESCAPE '\\' "
+            "ORDER BY email COLLATE NOCASE LIMIT ?",
+            (pattern, limit),
+        )
+        seen = set()
+        members = []
+        for member in by_name + by_email:
+            if member[0] not in seen:
+                seen.add(member[0])
+                members.append(member)
+        return members[:limit]
+
+    # Borrows
+    @retry_busy
+    def borrow_book(self, book_id, member_id, borrow_date, return_date, copy_id=None):
+        """Record a loan of ``copy_id``, or of any free copy of the book.
+
+        A copy put aside for the member's hold counts as free for them, and
+        is the one they get. Returns the borrow id, or None if that copy (or
+        every copy) is out.
+        """
+        with self.transaction():
+            # The write lock is held from here, so no other client can take the copy in between
+            hold = self.member_hold(member_id, book_id)
+            if hold is not None and hold[1] == "ready" and copy_id in (None, hold[2]):
+                free = (hold[2],)
+            elif copy_id is None:
+                free = self.query_one("SELECT id FROM copies WHERE book_id = ? AND lent = 0 LIMIT 1", (book_id,))
+            else:
+                free = self.query_one(
+                    "SELECT id FROM copies WHERE id = ? AND book_id = ? AND lent = 0", (copy_id, book_id)
+                )
+            if free is None:
+                return None
+            # due_at is derived from return_date the same way the migration did it;
+            # the triggers mark the copy lent and take it off the book's available count
+            borrow_id = self.execute(
+                """INSERT INTO borrows (book_id, member_id, borrow_date, return_date, due_at, copy_id)
+                VALUES (?1, ?2, ?3, ?4, CAST(strftime('%s', ?4) AS INTEGER), ?5)""",
+                (book_id, member_id, borrow_date, return_date, free[0]),
+            ).lastrowid
+            changes = [Change(LOAN_CREATED, borrows=[borrow_id]), Change(AVAILABILITY_CHANGED, books=[book_id])]
+            if hold is not None:
+                # Whichever copy they got, the member is no longer waiting for
+                # the title; a copy set aside for them that they didn't take
+                # goes to the next in line
+                released = hold[2] if hold[1] == "ready" and hold[2] != free[0] else None
+                changes += self._close_hold(hold[0], book_id, released, "fulfilled")
+        self.mark_changed(*changes)
+        return borrow_id
+
+    @retry_busy
+    def return_book(self, borrow_id):
+        """Close one loan. Returns False if it was already returned."""
+        with self.transaction():
+            loan = self.query_one(
+                "SELECT book_id, copy_id FROM borrows WHERE id = ? AND returned_at IS NULL", (borrow_id,)
+            )
+            if loan is None:
+                return False
+            # The loan stays in borrows as history; the triggers put its copy
+            # back, or aside for the next hold in the title's queue
+            self.execute(f"UPDATE borrows SET returned_at = {NOW_SECONDS} WHERE id = ?", (borrow_id,))
+            changes = [Change(LOAN_CLOSED, borrows=[borrow_id]), Change(AVAILABILITY_CHANGED, books=[loan[0]])]
+            if self.copy_hold(loan[1]) is not None:
+                # A hold left the queue, so everyone behind it moved up
+                changes.append(self._queue_changed(loan[0]))
+        self.mark_changed(*changes)
+        return True
+
+    def copy_loan(self, copy_id):
+        """Id of the copy's active loan, or None."""
+        row = self.query_one("SELECT id FROM borrows WHERE copy_id = ? AND returned_at IS NULL", (copy_id,))
+        return row[0] if row else None
+
+    def oldest_loan(self, book_id):
+        """Id of the book's longest-running active loan, or None."""
+        row = self.query_one(
+            "SELECT min(id) FROM borrows WHERE book_id = ? AND returned_at IS NULL", (book_id,)
+        )
+        return row[0] if row else None
+
+    # Holds
+    @retry_busy
+    def place_hold(self, book_id, member_id):
+        """Queue the member for the book. Returns the hold id, or None if a copy is on the shelf."""
+        with self.transaction():
+            if self.query_one("SELECT 1 FROM copies WHERE book_id = ? AND lent = 0 LIMIT 1", (book_id,)):
+                return None
+            hold_id = self.execute(
+                f"INSERT INTO holds (book_id, member_id, created_at) VALUES (?, ?, {NOW_SECONDS})",
+                (book_id, member_id),
+            ).lastrowid
+        self.mark_changed(Change(HOLD_PLACED, holds=[hold_id]))
+        return hold_id
+
+    @retry_busy
+    def cancel_hold(self, hold_id, status="cancelled"):
+        """Close an open hold. A copy set aside for it goes to the next hold, or back on the shelf.
+
+        Returns False if the hold was not open.
+        """
+        with self.transaction():
+            hold = self.query_one(
+                "SELECT book_id, copy_id FROM holds WHERE id = ? AND status IN ('waiting', 'ready')", (hold_id,)
+            )
+            if hold is None:
+                return False
+            changes = self._close_hold(hold_id, hold[0], hold[1], status)
+        self.mark_changed(*changes)
+        return True
+
+    @retry_busy
+    def expire_holds(self, before):
+        """Close the ready holds set aside before ``before`` (in created_at's seconds). Returns how many."""
+        with self.transaction():
+            expired = self.query(
+                "SELECT id, book_id, copy_id FROM holds WHERE status = 'ready' AND ready_at < ?", (int(before),)
+            )
+            changes = []
+            for hold_id, book_id, copy_id in expired:
+                changes += self._close_hold(hold_id, book_id, copy_id, "expired")
+        if changes:
+            self.mark_changed(*changes)
+        return len(expired)
+
+    def _close_hold(self, hold_id, book_id, copy_id, status):
+        self.execute(f"UPDATE holds SET status = ?, closed_at = {NOW_SECONDS} WHERE id = ?", (status, hold_id))
+        changes = []
+        if copy_id is not None:
+            # Freeing the copy fires the trigger that hands it to the next in line
+            self.execute("UPDATE copies SET lent = 0 WHERE id = ?", (copy_id,))
+            changes.append(Change(AVAILABILITY_CHANGED, books=[book_id]))
+        changes.append(self._queue_changed(book_id, hold_id))
+        return changes
+
+    def _queue_changed(self, book_id, *closed):
+        """A HOLD_CHANGED for the book's open holds and the ``closed`` ones that just left its queue.
+
+        Queue positions are relative, so one hold leaving moves everyone behind it.
+        """
+        rows = self.query(
+            "SELECT id FROM holds WHERE book_id = ? AND status IN ('waiting', 'ready')", (book_id,)
+        )
+        return Change(HOLD_CHANGED, holds=[row[0] for row in rows] + list(closed))
+
+    def member_hold(self, member_id, book_id):
+        """The (hold id, status, copy id) of the member's open hold on the book, or None."""
+        return self.query_one(
+            "SELECT id, status, copy_id FROM holds "
+            "WHERE member_id = ? AND book_id = ? AND status IN ('waiting', 'ready')",
+            (member_id, book_id),
+        )
+
+    def copy_hold(self, copy_id):
+        """The (hold id, member id) of the ready hold the copy is set aside for, or None."""
+        if copy_id is None:
+            return None
+        return self.query_one("SELECT id, member_id FROM holds WHERE copy_id = ? AND status = 'ready'", (copy_id,))
+
+    def queue_position(self, hold_id):
+        """1 for the next waiting hold of its book, 2 for the one after, ...; None once it is not waiting."""
+        row = self.query_one(
+            f"SELECT {QUEUE_POSITION} FROM holds WHERE id = ? AND status = 'waiting'", (hold_id,)
+        )
+        return row[0] if row else None
+
+    def holds(self, search_query="", status=None):
+        """Return a pageable query over the open holds, title by title in queue order.
+
+        Rows are (book id, title, member, email, status, placed on, queue
+        position, barcode of the copy set aside); the last two are '' when
+        they don't apply, so the row shows as-is in a list.
+        ``search_query`` keeps titles starting with it; ``status`` is
+        "waiting" or "ready".
+        """
+        where, params = ["holds.status IN ('waiting', 'ready')"], ()
+        if status:
+            where.append("holds.status = ?")
+            params += (status,)
+        if search_query:
+            where.append("books.title LIKE ? ESCAPE '\\'")
+            params += (like_prefix(search_query),)
+        return KeysetQuery(
+            self,
+            f"""holds.book_id, books.title, members.name, members.email, holds.status,
+            date(holds.created_at, 'unixepoch'),
+            CASE holds.status WHEN 'waiting' THEN {QUEUE_POSITION} ELSE '' END, coalesce(copies.barcode, '')""",
+            """holds
+            JOIN books ON holds.book_id = books.id
+            JOIN members ON holds.member_id = members.id
+            LEFT JOIN copies ON holds.copy_id = copies.id""",
+            where, params,
+            order=("holds.book_id", "holds.created_at", "holds.id"),
+        )
+
+    def borrowed_books(self, search_query="", sort=None, descending=False, borrower="", due_from=None, due_to=None):
+        """Return a pageable query over the active loans, optionally filtered by title.
+
+        ``sort`` is a LOAN_SORTS name; ``borrower`` keeps members whose name or
+        email starts with it, and ``due_from``/``due_to`` (in due_at's seconds,
+        see library.epoch) limit the return date to [due_from, due_to).
+        """
+        # Returned loans are history; the partial indexes only cover active ones
+        where, params, matcher = ["borrows.returned_at IS NULL"], (), None
+        if search_query:
+            match = fts_query(search_query, ("title",)) if self.has_fts else None
+            if match is not None:
+                where.append("borrows.book_id IN (SELECT rowid FROM books_fts WHERE books_fts MATCH ?)")
+                params = (match,)
+                matcher = PrefixMatcher((1,))
+            else:
+                where.append("books.title LIKE ? ESCAPE '\\'")
+                params = (like_substring(search_query),)
+                matcher = SubstringMatcher((1,))
+        if borrower:
+            where.append("(members.name LIKE ? ESCAPE '\\' OR members.email LIKE ? ESCAPE '\\')")
+            params += (like_prefix(borrower),) * 2
+        if due_from is not None:
+            where.append("borrows.due_at >= ?")
+            params += (int(due_from),)
+        if due_to is not None:
+            where.append("borrows.due_at < ?")
+            params += (int(due_to),)
+        # Sorted by a book column, the planner sorts every active loan before
+        # the first page. While loans are dense among the books, walking the
+        # books index and probing for loans fills a page far sooner
+        loans = "borrows JOIN books ON borrows.book_id = books.id"
+        if sort in ("title", "author") and len(where) == 1 and self._loans_are_dense():
+            loans = "books CROSS JOIN borrows ON borrows.book_id = books.id"
+        query = KeysetQuery(
+            self,
+            "borrows.book_id, books.title, books.author, members.name, members.email, borrows.return_date",
+            f"""{loans}
+            JOIN members ON borrows.member_id = members.id""",
+            where, params,
+            order=LOAN_SORTS[sort] if sort else ("borrows.id",), descending=descending,
+        )
+        if matcher is None:
+            return query
+        kind = ("loans", type(matcher).__name__, sort, descending, borrower, due_from, due_to)
+        return CachedQuery(query, self.result_cache, kind, search_query, matcher)
+
+    def _loans_are_dense(self):
+        # At least one book in 20 out on loan; both numbers are single-row lookups
+        active = self.query_one("SELECT loans - returns FROM circulation_totals WHERE id = 1")
+        books = self.query_one("SELECT max(id) FROM books")
+        return bool(active and books and books[0] and active[0] * 20 >= books[0])
+
+    def overdue_loans(self, now, within_days=0):
+        """Loans due before ``now`` plus ``within_days`` days, most overdue first.
+
+        ``now`` is in due_at's seconds (see library.epoch). Rows are
+        (borrow id, member, email, title, return date, days overdue); a
+        negative number of days means the loan is due in that many days.
+        """
+        now = int(now)
+        return KeysetQuery(
+            self,
+            f"""borrows.id, members.name, members.email, books.title, borrows.return_date,
+            ({now} - borrows.due_at) / 86400""",
+            """borrows
+            JOIN books ON borrows.book_id = books.id
+            JOIN members ON borrows.member_id = members.id""",
+            ["borrows.returned_at IS NULL", "borrows.due_at < ?"], (now + within_days * 86400,),
+            order=("borrows.due_at", "borrows.id"),
+        )
+
+    # Statistics
+    def circulation_stats(self, top=10, days=30):
+        """Numbers for the statistics window, read from the trigger-maintained summary tables.
+
+        Returns a dict with "loans", "returns" and "active" totals, the "top_books"
+        as (title, author, loans), the "top_members" as (name, email, loans) and
+        the "daily" (day, loans, returns) volume of the last ``days`` days with activity.
+        """
+        totals = self.query_one("SELECT loans, returns FROM circulation_totals WHERE id = 1") or (0, 0)
+        return {
+            "loans": totals[0],
+            "returns": totals[1],
+            "active": totals[0] - totals[1],
+            "top_books": self.query("""
+                SELECT books.title, books.author, top.loans
+                FROM (SELECT book_id, loans FROM book_stats ORDER BY loans DESC LIMIT ?) AS top
+                JOIN books ON books.id = top.book_id
+                ORDER BY top.loans DESC
+            """, (top,)),
+            "top_members": self.query("""
+                SELECT members.name, members.email, top.loans
+                FROM (SELECT member_id, loans FROM member_stats ORDER BY loans DESC LIMIT ?) AS top
+                JOIN members ON members.id = top.member_id
+                ORDER BY top.loans DESC
+            """, (top,)),
+            "daily": self.query("SELECT day, loans, returns FROM daily_stats ORDER BY day DESC LIMIT ?", (days,)),
+        }
+
+
+_db = None
+_db_lock = threading.Lock()
+
+
+def configure(path=DB_PATH, pragmas=None):
+    """Replace the shared Database, e.g. to point at another file or tune PRAGMAs."""
+    global _db
+    with _db_lock:
+        if _db is not None:
+            _db.close()
+        _db = Database(path, pragmas)
+    return _db
+
+
+def get_db():
+    global _db
+    if _db is None:
+        with _db_lock:
+            if _db is None:
+                _db = Database()
+    return _db
+
+
+# Initialize the SQLite database
+def init_db():
+    try:
+        # Quiet unless the schema was created or upgraded, so command-line
+        # output stays clean for scripts
+        if get_db().init_schema():
+            print("Database initialized successfully")
+    except sqlite3.Error as e:
+        print(f"Error initializing database: {e}")
@@ -0,0 +1,202 @@
+import csv
+import gzip
+import json
+import os
+import time
+
+# Rows fetched from SQLite and written per step; memory use doesn't grow with the table
+BATCH_SIZE = 5000
+
+FORMATS = ("csv", "jsonl", "parquet")
+
+# kind: (columns as (name, SQL expression, type), FROM clause, table whose change_seq is tracked)
+EXPORTS = {
+    "books": (
+        [("id", "books.id", "int"), ("title", "books.title", "str"), ("author", "books.author", "str"),
+         ("available", "books.available", "int"), ("copies", "books.copies", "int")],
+        "books",
+        "books",
+    ),
+    "members": (
+        [("id", "members.id", "int"), ("name", "members.name", "str"), ("email", "members.email", "str")],
+        "members",
+        "members",
+    ),
+    # The join the return form lists, plus returned loans from the history
+    "loans": (
+        [("borrow_id", "borrows.id", "int"), ("book_id", "borrows.book_id", "int"),
+         ("title", "books.title", "str"), ("author", "books.author", "str"),
+         ("member", "members.name", "str"), ("email", "members.email", "str"),
+         ("borrow_date", "borrows.borrow_date", "str"), ("return_date", "borrows.return_date", "str"),
+         ("returned_at", "datetime(borrows.returned_at, 'unixepoch')", "str")],
+        """borrows
+        JOIN books ON borrows.book_id = books.id
+        JOIN members ON borrows.member_id = members.id""",
+        "borrows",
+    ),
+}
+
+
+class ExportResult:
+    def __init__(self, kind, path):
+        self.kind = kind
+        self.path = path
+        self.exported = 0
+        self.elapsed = 0.0
+        self.watermark = None
+
+    @property
+    def rate(self):
+        return self.exported / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (f"Exported {self.exported} {self.kind} to {self.path} "
+                f"in {self.elapsed:.2f}s ({self.rate:,.0f} rows/s)")
+
+
+def format_for(path):
+    """Guess the format from a file name such as books.jsonl.gz."""
+    name = path.lower()
+    if name.endswith(".gz"):
+        name = name[:-3]
+    for fmt in FORMATS:
+        if name.endswith("." + fmt):
+            return fmt
+    if name.endswith((".ndjson", ".json")):
+        return "jsonl"
+    return "csv"
+
+
+def watermark(db, kind):
+    """change_seq of the newest row written by the last incremental export of ``kind``."""
+    row = db.query_one("SELECT seq FROM export_watermarks WHERE name = ?", (kind,))
+    return row[0] if row else 0
+
+
+def _write_csv(path, compress, names, batches):
+    opener = gzip.open if compress else open
+    with opener(path, "wt", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(names)
+        for rows in batches:
+            writer.writerows(rows)
+
+
+def _write_jsonl(path, compress, names, batches):
+    opener = gzip.open if compress else open
+    with opener(path, "wt", encoding="utf-8") as f:
+        for rows in batches:
+            f.writelines(json.dumps(dict(zip(names, row)), ensure_ascii=False) + "\n" for row in rows)
+
+
+def _write_parquet(path, compress, names, types, batches):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("Parquet export needs the pyarrow package.") from None
+    schema = pa.schema([(name, pa.int64() if kind == "int" else pa.string()) for name, kind in zip(names, types)])
+    # Parquet compresses per column itself; one row group per batch
+    with pq.ParquetWriter(path, schema, compression="gzip" if compress else "snappy") as writer:
+        for rows in batches:
+            columns = zip(*rows)
+            arrays = [pa.array(column, type=field.type) for column, field in zip(columns, schema)]
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+
+
+def export_file(db, kind, path, fmt=None, compress=None, changed_only=False, progress=None,
+                batch_size=BATCH_SIZE):
+    """Stream the books, members or loans into a CSV, JSON Lines or Parquet file.
+
+    With ``changed_only`` only rows inserted or updated since the previous
+    incremental export of ``kind`` are written, and the watermark is moved on
+    once the file is complete. The file is written under a temporary name and
+    renamed at the end, so a failed export never leaves a partial file behind.
+    ``progress(rows_done)`` is called after each batch.
+    """
+    columns, source, table = EXPORTS[kind]
+    fmt = fmt or format_for(path)
+    if compress is None:
+        compress = path.lower().endswith(".gz")
+    names = [name for name, _, _ in columns]
+    types = [kind for _, _, kind in columns]
+    select = ", ".join(expression for _, expression, _ in columns)
+
+    result = ExportResult(kind, path)
+    start = time.perf_counter()
+    since = watermark(db, kind) if changed_only else None
+    if since is None:
+        sql, params = f"SELECT {select}, {table}.change_seq FROM {source} ORDER BY {table}.id", ()
+    else:
+        # Index range scan on change_seq
+        sql = (f"SELECT {select}, {table}.change_seq FROM {source} "
+               f"WHERE {table}.change_seq > ? ORDER BY {table}.change_seq")
+        params = (since,)
+
+    newest = since or 0
+
+    def batches():
+        nonlocal newest
+        cursor = db.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            for row in rows:
+                if row[-1] is not None and row[-1] > newest:
+                    newest = row[-1]
+            result.exported += len(rows)
+            yield [row[:-1] for row in rows]
+            if progress is not None:
+                progress(result.exported)
+
+    partial = path + ".part"
+    try:
+        if fmt == "csv":
+            _write_csv(partial, compress, names, batches())
+        elif fmt == "jsonl":
+            _write_jsonl(partial, compress, names, batches())
+        elif fmt == "parquet":
+            _write_parquet(partial, compress, names, types, batches())
+        else:
+            raise ValueError(f"Unknown export format: {fmt}")
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+    if changed_only:
+        with db.transaction():
+            db.execute(
+                "INSERT INTO export_watermarks (name, seq) VALUES (?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET seq = excluded.seq",
+                (kind, newest),
+            )
+        result.watermark = newest
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    from database import DB_PATH, configure, init_db
+
+    parser = argparse.ArgumentParser(description="Export books, members or loans to CSV, JSON Lines or Parquet.")
+    parser.add_argument("kind", choices=sorted(EXPORTS))
+    parser.add_argument("path", help="output file; the format follows the extension (.csv, .jsonl, .parquet, +.gz)")
+    parser.add_argument("--format", choices=FORMATS, help="override the format guessed from the extension")
+    parser.add_argument("--gzip", action="store_true", help="compress even without a .gz extension")
+    parser.add_argument("--changed", action="store_true",
+                        help="only rows added or changed since the last --changed export of this kind")
+    parser.add_argument("--db", default=DB_PATH, help="database file (default: %(default)s)")
+    args = parser.parse_args()
+
+    db = configure(args.db)
+    init_db()
+    try:
+        result = export_file(db, args.kind, args.path, args.format, args.gzip or None, args.changed)
+    except ValueError as e:
+        sys.exit(str(e))
+    print(result)
@@ -0,0 +1,315 @@
+import csv
+import io
+import json
+import os
+import sqlite3
+import time
+
+from changes import RELOADED, Change
+from library import ValidationError, validate_book, validate_member
+
+# Rows per executemany call
+BATCH_SIZE = 20000
+# Files at least this big, and any file loaded into an empty table, are loaded
+# with the table's secondary indexes dropped and rebuilt once at the end, which
+# is much cheaper than updating them per row
+DEFER_INDEX_BYTES = 8 * 1024 * 1024
+# Full-text indexes are filled in one pass at the end of an import. FTS5
+# writes a new index segment whenever its pending terms pass 'hashsize'
+# (1 MB by default); a bigger buffer means fewer segments to write and merge
+FTS_HASHSIZE = 16 * 1024 * 1024
+FTS_DEFAULT_HASHSIZE = 1024 * 1024
+
+JSON_EXTENSIONS = (".jsonl", ".ndjson", ".json")
+
+
+def parse_book(record):
+    title, author = validate_book(record.get("title"), record.get("author"))
+    # Files from before copies were tracked only have the available count
+    copies = record.get("copies")
+    if copies in (None, ""):
+        copies = record.get("available")
+    if copies in (None, ""):
+        return title, author, 1
+    try:
+        copies = int(copies)
+    except (TypeError, ValueError):
+        copies = -1
+    if copies < 0:
+        raise ValidationError("Copies must be a whole number.")
+    return title, author, copies
+
+
+def parse_member(record):
+    return validate_member(record.get("name"), record.get("email"))
+
+
+IMPORTS = {
+    # Every copy starts on the shelf; the copy rows are created in bulk afterwards.
+    # The last parameter is the change counter every imported row is stamped with
+    "books": ("books", parse_book,
+              "INSERT INTO books (title, author, available, copies, change_seq) VALUES (?1, ?2, ?3, ?3, ?4)"),
+    "members": ("members", parse_member, "INSERT INTO members (name, email, change_seq) VALUES (?, ?, ?)"),
+}
+
+
+class ImportResult:
+    def __init__(self, kind, path):
+        self.kind = kind
+        self.path = path
+        self.imported = 0
+        self.rejected = 0
+        self.elapsed = 0.0
+        self.errors_path = None
+
+    @property
+    def rate(self):
+        return self.imported / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        text = (f"Imported {self.imported} {self.kind}, rejected {self.rejected} "
+                f"in {self.elapsed:.2f}s ({self.rate:,.0f} rows/s)")
+        if self.errors_path:
+            text += f"; rejected rows written to {self.errors_path}"
+        return text
+
+
+class _CountingFile(io.RawIOBase):
+    """Binary file wrapper that counts the bytes read, for progress reporting."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = self.raw.readinto(buffer)
+        self.bytes_read += count or 0
+        return count
+
+
+def is_jsonl(path):
+    return path.lower().endswith(JSON_EXTENSIONS)
+
+
+def read_csv(lines):
+    """Yield (line number, record, error) for each CSV row."""
+    reader = csv.reader(lines)
+    header = next(reader, None) or []
+    for row in reader:
+        yield reader.line_num, dict(zip(header, row)), None
+
+
+def read_jsonl(lines):
+    """Yield (line number, record, error) for each JSON Lines row."""
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield number, {"_raw": line.rstrip("\n")}, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield number, {"_raw": line.rstrip("\n")}, "Expected a JSON object."
+            continue
+        yield number, record, None
+
+
+def rejected_path(path):
+    root, ext = os.path.splitext(path)
+    return f"{root}.rejected{ext or '.csv'}"
+
+
+class _RejectWriter:
+    """Writes rejected rows, with line number and reason, in the input's format."""
+
+    def __init__(self, path, jsonl, fieldnames):
+        self.path = path
+        self.jsonl = jsonl
+        self.fieldnames = fieldnames
+        self._file = None
+        self._writer = None
+
+    def write(self, line, record, error):
+        if self._file is None:
+            self._file = open(self.path, "w", newline="", encoding="utf-8")
+            if not self.jsonl:
+                self._writer = csv.DictWriter(
+                    self._file, list(self.fieldnames) + ["line", "error"], extrasaction="ignore"
+                )
+                self._writer.writeheader()
+        if self.jsonl:
+            self._file.write(json.dumps(dict(record, _line=line, _error=error), ensure_ascii=False) + "\n")
+        else:
+            self._writer.writerow(dict(record, line=line, error=error))
+
+    @property
+    def used(self):
+        return self._file is not None
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+def _defer_indexes(db, table):
+    """Drop the table's secondary indexes, returning the SQL to recreate them."""
+    indexes = db.query(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+        (table,),
+    )
+    for name, _ in indexes:
+        db.execute(f'DROP INDEX "{name}"')
+    return [sql for _, sql in indexes]
+
+
+def _defer_triggers(db, table):
+    """Suspend per-row FTS indexing and change stamping; returns {name: SQL} to restore."""
+    names = [f"{table}_change_ai"]
+    if table == "books" and db.has_fts:
+        names.append("books_fts_ai")
+    if table == "books" and db.has_trigram:
+        names.append("books_trigram_ai")
+    triggers = {}
+    for name in names:
+        trigger = db.query_one("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?", (name,))
+        if trigger is not None:
+            db.execute(f"DROP TRIGGER {name}")
+            triggers[name] = trigger[0]
+    return triggers
+
+
+def _fill_fts(db, fts, last_id):
+    """Index every book after ``last_id`` in the FTS5 table ``fts`` in one statement."""
+    db.execute(f"INSERT INTO {fts} ({fts}, rank) VALUES ('hashsize', ?)", (FTS_HASHSIZE,))
+    db.execute(f"INSERT INTO {fts} (rowid, title, author) SELECT id, title, author FROM books WHERE id > ?", (last_id,))
+    db.execute(f"INSERT INTO {fts} ({fts}, rank) VALUES ('hashsize', ?)", (FTS_DEFAULT_HASHSIZE,))
+
+
+def _insert_batch(db, sql, batch, rejects, result):
+    db.execute("SAVEPOINT import_batch")
+    try:
+        db.executemany(sql, [params for _, _, params in batch])
+        result.imported += len(batch)
+    except sqlite3.IntegrityError:
+        # Something in the batch clashes (e.g. a duplicate email):
+        # redo it row by row so only the offending rows are rejected
+        db.execute("ROLLBACK TO import_batch")
+        for line, record, params in batch:
+            try:
+                db.execute(sql, params)
+                result.imported += 1
+            except sqlite3.IntegrityError as e:
+                rejects.write(line, record, str(e))
+                result.rejected += 1
+    db.execute("RELEASE import_batch")
+
+
+def import_file(db, kind, path, errors_path=None, progress=None,
+                batch_size=BATCH_SIZE, defer_indexes=None):
+    """Stream a CSV or JSON Lines file of books or members into the database.
+
+    Rows are validated with the same rules as the forms; rejected rows go to
+    ``errors_path`` (by default next to the input). Everything is loaded in a
+    single transaction, so a failed import leaves the database untouched.
+    ``progress(rows_done, bytes_read, total_bytes)`` is called after each batch.
+
+    Inserting the rows is the cheap part of a books import: filling the two
+    full-text indexes and creating every copy row take most of the time
+    (see "import/books_csv" in benchmark.py). Members load at over 100k rows/s,
+    books at about 40k.
+    """
+    table, parse, sql = IMPORTS[kind]
+    total_bytes = os.path.getsize(path)
+    jsonl = is_jsonl(path)
+    result = ImportResult(kind, path)
+    start = time.perf_counter()
+
+    with open(path, "rb") as raw:
+        counter = _CountingFile(raw)
+        lines = io.TextIOWrapper(io.BufferedReader(counter), encoding="utf-8-sig", newline="")
+        records = read_jsonl(lines) if jsonl else read_csv(lines)
+        fieldnames = ("title", "author", "copies", "available") if kind == "books" else ("name", "email")
+        rejects = _RejectWriter(errors_path or rejected_path(path), jsonl, fieldnames)
+        try:
+            with db.transaction():
+                last_id = db.query_one(f"SELECT coalesce(max(id), 0) FROM {table}")[0]
+                triggers = _defer_triggers(db, table)
+                # The whole import counts as one change for exporter.py
+                db.execute("UPDATE change_counter SET seq = seq + 1 WHERE id = 1")
+                seq = db.query_one("SELECT seq FROM change_counter WHERE id = 1")[0]
+                if defer_indexes is None:
+                    # Rebuilding an empty table's indexes only sorts the new rows
+                    defer_indexes = total_bytes >= DEFER_INDEX_BYTES or last_id == 0
+                indexes = _defer_indexes(db, table) if defer_indexes else []
+
+                batch = []
+                for line, record, error in records:
+                    if error is None:
+                        try:
+                            params = parse(record)
+                        except ValidationError as e:
+                            error = str(e)
+                    if error is not None:
+                        rejects.write(line, record, error)
+                        result.rejected += 1
+                        continue
+
+                    batch.append((line, record, params + (seq,)))
+                    if len(batch) >= batch_size:
+                        _insert_batch(db, sql, batch, rejects, result)
+                        batch = []
+                        if progress is not None:
+                            progress(result.imported + result.rejected, counter.bytes_read, total_bytes)
+                if batch:
+                    _insert_batch(db, sql, batch, rejects, result)
+
+                if table == "books":
+                    db.create_copies(last_id)
+                # Index every new book in one pass
+                if "books_fts_ai" in triggers:
+                    _fill_fts(db, "books_fts", last_id)
+                if "books_trigram_ai" in triggers:
+                    _fill_fts(db, "books_trigram", last_id)
+                for index_sql in indexes:
+                    db.execute(index_sql)
+                # Then resume per-row indexing and stamping
+                for trigger in triggers.values():
+                    db.execute(trigger)
+        finally:
+            rejects.close()
+
+    # Too many rows to announce one by one; open lists reload instead
+    db.mark_changed(Change(RELOADED, **{table: None}))
+    if rejects.used:
+        result.errors_path = rejects.path
+    result.elapsed = time.perf_counter() - start
+    if progress is not None:
+        progress(result.imported + result.rejected, total_bytes, total_bytes)
+    return result
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import DB_PATH, configure, init_db
+
+    parser = argparse.ArgumentParser(description="Bulk import books or members from CSV or JSON Lines.")
+    parser.add_argument("kind", choices=sorted(IMPORTS))
+    parser.add_argument("path", help="CSV file with a header row, or a .jsonl file")
+    parser.add_argument("--errors", help="where to write rejected rows")
+    parser.add_argument("--db", default=DB_PATH, help="database file (default: %(default)s)")
+    args = parser.parse_args()
+
+    db = configure(args.db)
+    init_db()
+
+    def report(rows, done, total):
+        print(f"\r{rows:,} rows ({done * 100 // max(total, 1)}%)", end="", flush=True)
+
+    result = import_file(db, args.kind, args.path, args.errors, progress=report)
+    print()
+    print(result)
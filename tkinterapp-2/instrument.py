@@ -0,0 +1,166 @@
+import atexit
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Set to a file name to write the metrics there as JSON when the process exits
+METRICS_ENV = "LIBRARY_METRICS"
+# Set to a file name to cProfile the main thread and write pstats there on exit
+PROFILE_ENV = "LIBRARY_PROFILE"
+
+# Start-up marks are measured from here. The app imports this module before
+# anything else, so this is (nearly) when the process started running Python
+START = time.perf_counter()
+
+# Histogram bucket upper bounds in seconds: 10 µs doubling up to about 3 minutes
+BUCKETS = [0.00001 * 2 ** i for i in range(25)]
+
+
+class Histogram:
+    """Latency distribution in power-of-two buckets; cheap enough for every call."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def add(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        self.buckets[bisect.bisect_left(BUCKETS, elapsed)] += 1
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile (capped at the max)."""
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS + [self.max], self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "total": self.total,
+            "avg": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class Metrics:
+    """Named latency histograms and counters, shared by the whole process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timings = {}
+        self._counters = {}
+        self._marks = {}
+
+    def record(self, name, elapsed):
+        with self._lock:
+            histogram = self._timings.get(name)
+            if histogram is None:
+                histogram = self._timings[name] = Histogram()
+            histogram.add(elapsed)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def mark(self, name, elapsed):
+        with self._lock:
+            self._marks.setdefault(name, elapsed)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "timings": {name: histogram.summary() for name, histogram in self._timings.items()},
+                "counters": dict(self._counters),
+                "startup": dict(self._marks),
+            }
+
+    def reset(self):
+        # Start-up only happens once, so its marks are kept
+        with self._lock:
+            self._timings.clear()
+            self._counters.clear()
+
+    def dump(self, path, **extra):
+        """Write the snapshot, plus any ``extra`` sections, to ``path`` as JSON."""
+        data = dict(self.snapshot(), **extra)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+
+
+metrics = Metrics()
+
+
+@contextmanager
+def timer(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.record(name, time.perf_counter() - start)
+
+
+def mark(name):
+    """Note that start-up reached ``name``; only the first time counts."""
+    metrics.mark(name, time.perf_counter() - START)
+
+
+def timed(name=None):
+    """Decorator recording every call's duration under ``name`` (default: the function's name)."""
+    def decorate(fn):
+        label = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                metrics.record(label, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+_profiler = None
+
+
+def start_profiling():
+    """Start cProfile on the calling thread if PROFILE_ENV is set; stats are written on exit."""
+    global _profiler
+    path = os.environ.get(PROFILE_ENV)
+    if not path or _profiler is not None:
+        return
+    import cProfile
+
+    _profiler = cProfile.Profile()
+    _profiler.enable()
+
+    def save():
+        _profiler.disable()
+        _profiler.dump_stats(path)
+
+    atexit.register(save)
+
+
+def dump_on_exit(**extra):
+    """Write the metrics to METRICS_ENV's file, if it is set. ``extra`` values may be callables."""
+    path = os.environ.get(METRICS_ENV)
+    if path:
+        metrics.dump(path, **{key: value() if callable(value) else value for key, value in extra.items()})
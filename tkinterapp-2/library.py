@@ -0,0 +1,525 @@
+import calendar
+import re
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+# Library operations, usable without Tk: the forms, the bulk importer and the
+# command line below all go through these functions.
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Days a copy set aside for a hold waits to be collected before it goes to the next in line
+HOLD_PICKUP_DAYS = 7
+HOLD_STATUSES = ("waiting", "ready")
+# Longest loan that can be entered, and the largest id SQLite can store
+MAX_LOAN_DAYS = 3650
+MAX_ID = 2 ** 63 - 1
+# Shape of the "<book id>-<copy number>" barcodes generated for unlabelled
+# copies; a hand-entered one could take the label a later copy will need
+GENERATED_BARCODE_PATTERN = re.compile(r"[0-9]+-[0-9]+")
+
+
+class ValidationError(ValueError):
+    """Raised when user-entered data is rejected; the message is shown as-is."""
+
+
+class NotAvailableError(ValidationError):
+    """Raised when a borrow finds no copy the member may take; they can place a hold instead."""
+
+
+# Validation shared by the forms and the bulk importer
+def validate_book(title, author):
+    title = (title or "").strip()
+    author = (author or "").strip()
+    if not title:
+        raise ValidationError("Title cannot be empty or contain only spaces.")
+    if not author:
+        raise ValidationError("Author cannot be empty or contain only spaces.")
+    return title, author
+
+
+def validate_member(name, email):
+    name = (name or "").strip()
+    email = (email or "").strip()
+    if not name or not email:
+        raise ValidationError("All fields are required.")
+    if '@' not in email:
+        raise ValidationError("Please enter a valid email address.")
+    return name, email
+
+
+def validate_days(days):
+    try:
+        days = int(str(days).strip())
+    except ValueError:
+        days = 0
+    if days <= 0:
+        raise ValidationError("Please enter a valid number of days.")
+    if days > MAX_LOAN_DAYS:
+        raise ValidationError(f"A loan can last at most {MAX_LOAN_DAYS} days.")
+    return days
+
+
+def validate_copies(copies):
+    try:
+        copies = int(str(copies).strip())
+    except ValueError:
+        copies = 0
+    if copies <= 0:
+        raise ValidationError("Please enter a valid number of copies.")
+    return copies
+
+
+def validate_barcodes(barcodes):
+    # Scanners and JSON clients may send numeric barcodes
+    barcodes = [str(barcode).strip() for barcode in barcodes or () if barcode is not None and str(barcode).strip()]
+    if len(set(barcodes)) != len(barcodes):
+        raise ValidationError("The same barcode was given twice.")
+    for barcode in barcodes:
+        if GENERATED_BARCODE_PATTERN.fullmatch(barcode):
+            raise ValidationError(f"Barcodes like {barcode!r} are reserved for generated labels.")
+    return barcodes
+
+
+def _id(value, what):
+    try:
+        value_id = int(str(value).strip())
+    except ValueError:
+        value_id = 0
+    if not 0 < value_id <= MAX_ID:
+        raise ValidationError(f"Invalid {what} id: {value!r}")
+    return value_id
+
+
+def _check_member(db, member_id):
+    # Loans and holds are listed joined to their member, so one for a member
+    # who doesn't exist could never be seen or closed
+    if db.get_member(member_id) is None:
+        raise ValidationError("No such member.")
+
+
+def add_book(db, title, author, copies=1, barcodes=()):
+    """Validate and add ``copies`` copies of a book. Returns its id.
+
+    A title and author already in the catalogue get the new copies instead
+    of a second, duplicate book.
+    """
+    title, author = validate_book(title, author)
+    barcodes = validate_barcodes(barcodes)
+    copies = max(validate_copies(copies), len(barcodes))
+    book_id = db.find_book(title, author)
+    try:
+        if book_id is None:
+            return db.add_book(title, author, copies, barcodes)
+        db.add_copies(book_id, copies, barcodes)
+        return book_id
+    except sqlite3.IntegrityError:
+        raise ValidationError("That barcode is already in use.") from None
+
+
+def add_copies(db, book_id, copies=1, barcodes=()):
+    """Add copies to a book. Returns their barcodes."""
+    book_id = _id(book_id, "book")
+    barcodes = validate_barcodes(barcodes)
+    copies = max(validate_copies(copies), len(barcodes))
+    try:
+        labels = db.add_copies(book_id, copies, barcodes)
+    except sqlite3.IntegrityError:
+        raise ValidationError("That barcode is already in use.") from None
+    if labels is None:
+        raise ValidationError(f"No book {book_id}.")
+    return labels
+
+
+def add_member(db, name, email):
+    """Validate and add a member. Returns their id."""
+    name, email = validate_member(name, email)
+    return db.add_member(name, email)
+
+
+def borrow_book(db, book_id, member_id, days, now=None):
+    """Lend a book for ``days`` days. Returns the return date as shown to the user."""
+    book_id, member_id = _id(book_id, "book"), _id(member_id, "member")
+    days = validate_days(days)
+    now = now or datetime.now()
+    borrow_date = now.strftime(DATE_FORMAT)
+    return_date = (now + timedelta(days=days)).strftime(DATE_FORMAT)
+    with db.transaction():
+        _check_member(db, member_id)
+        borrowed = db.borrow_book(book_id, member_id, borrow_date, return_date)
+    if not borrowed:
+        raise NotAvailableError("Book is not available for borrowing.")
+    return return_date
+
+
+def _copy(db, barcode):
+    copy = db.find_copy("" if barcode is None else str(barcode).strip())
+    if copy is None:
+        raise ValidationError(f"Unknown barcode: {barcode!r}")
+    return copy
+
+
+def borrow_barcode(db, barcode, member_id, days, now=None):
+    """Lend the scanned copy for ``days`` days. Returns the return date as shown to the user."""
+    copy_id, book_id, lent = _copy(db, barcode)
+    member_id = _id(member_id, "member")
+    days = validate_days(days)
+    # lent is 1 on loan, 2 set aside for a hold (which only its member may borrow)
+    message = "This copy is set aside for another member's hold." if lent == 2 else "This copy is already lent out."
+    if lent == 1:
+        raise NotAvailableError(message)
+    now = now or datetime.now()
+    return_date = (now + timedelta(days=days)).strftime(DATE_FORMAT)
+    with db.transaction():
+        _check_member(db, member_id)
+        borrowed = db.borrow_book(book_id, member_id, now.strftime(DATE_FORMAT), return_date, copy_id)
+    if not borrowed:
+        raise NotAvailableError(message)
+    return return_date
+
+
+def return_barcode(db, barcode):
+    """Close the loan of the scanned copy."""
+    copy_id, _, _ = _copy(db, barcode)
+    borrow_id = db.copy_loan(copy_id)
+    if borrow_id is None or not db.return_book(borrow_id):
+        raise ValidationError("This copy is not lent out.")
+
+
+def return_book(db, borrow_id):
+    """Close a loan by its borrow id."""
+    if not db.return_book(_id(borrow_id, "borrow")):
+        raise ValidationError("This loan has already been returned.")
+
+
+def return_copy(db, book_id):
+    """Return the book's longest-running loan, for callers that only know the book."""
+    book_id = _id(book_id, "book")
+    with db.transaction():
+        borrow_id = db.oldest_loan(book_id)
+        if borrow_id is None:
+            raise ValidationError("This book is not borrowed.")
+        db.return_book(borrow_id)
+
+
+def place_hold(db, book_id, member_id):
+    """Queue the member for a book with no copy on the shelf. Returns their place in the queue."""
+    book_id, member_id = _id(book_id, "book"), _id(member_id, "member")
+    if db.get_book(book_id) is None:
+        raise ValidationError(f"No book {book_id}.")
+    try:
+        with db.transaction():
+            # A hold for nobody would still be handed a returned copy
+            _check_member(db, member_id)
+            if db.member_hold(member_id, book_id) is not None:
+                raise ValidationError("This member is already on hold for this book.")
+            hold_id = db.place_hold(book_id, member_id)
+    except sqlite3.IntegrityError:
+        # Placed by another desk in the meantime
+        raise ValidationError("This member is already on hold for this book.") from None
+    if hold_id is None:
+        raise ValidationError("A copy is on the shelf; borrow it instead.")
+    return db.queue_position(hold_id)
+
+
+def cancel_hold(db, hold_id):
+    """Cancel a hold; a copy set aside for it goes to the next in line."""
+    if not db.cancel_hold(_id(hold_id, "hold")):
+        raise ValidationError("This hold is no longer open.")
+
+
+def expire_holds(db, days=HOLD_PICKUP_DAYS, now=None):
+    """Release the copies set aside more than ``days`` days ago. Returns how many holds expired."""
+    return db.expire_holds(epoch(now or datetime.now()) - days * 86400)
+
+
+def holds(db, text="", status=None):
+    """Open holds, title by title in queue order; ``text`` keeps titles starting with it."""
+    if status and status not in HOLD_STATUSES:
+        raise ValidationError(f"Unknown hold status: {status!r}")
+    return db.holds((text or "").strip(), status or None)
+
+
+def epoch(moment):
+    """Seconds for a naive local datetime, in the same scale as borrows.due_at.
+
+    Dates are stored as local wall-clock strings, and SQLite's strftime('%s')
+    reads them as UTC; doing the same here keeps both sides comparable.
+    """
+    return calendar.timegm(moment.timetuple())
+
+
+def overdue_loans(db, within_days=0, now=None):
+    return db.overdue_loans(epoch(now or datetime.now()), within_days)
+
+
+def overdue_report(db, within_days=0, now=None):
+    """Overdue (and due within ``within_days`` days) loans grouped per member.
+
+    Returns [((name, email), [(title, return date, days overdue), ...])],
+    the member with the most overdue loan first.
+    """
+    members = {}
+    for _, name, email, title, return_date, days in overdue_loans(db, within_days, now).all():
+        members.setdefault((name, email), []).append((title, return_date, days))
+    return list(members.items())
+
+
+def _sort(sort, sorts):
+    if sort and sort not in sorts:
+        raise ValidationError(f"Cannot sort by {sort!r}.")
+    return sort or None
+
+
+def _day(text, what):
+    """A YYYY-MM-DD date as due_at seconds at its midnight, or None if blank."""
+    text = (text or "").strip()
+    if not text:
+        return None
+    try:
+        return epoch(datetime.strptime(text, "%Y-%m-%d"))
+    except ValueError:
+        raise ValidationError(f"Invalid {what} date: {text!r} (use YYYY-MM-DD)") from None
+
+
+def search_books(db, text="", title_only=False, available_only=False, fuzzy=False,
+                 sort=None, descending=False, author="", availability=None):
+    from database import AVAILABILITY, BOOK_SORTS
+
+    if availability and availability not in AVAILABILITY:
+        raise ValidationError(f"Unknown availability: {availability!r}")
+    return db.search_books((text or "").strip(), title_only=title_only, available_only=available_only, fuzzy=fuzzy,
+                           sort=_sort(sort, BOOK_SORTS), descending=descending,
+                           author=(author or "").strip(), availability=availability or None)
+
+
+def borrowed_books(db, text="", sort=None, descending=False, borrower="", due_from="", due_to=""):
+    """Active loans; ``due_from`` and ``due_to`` are YYYY-MM-DD and both days are included."""
+    from database import LOAN_SORTS
+
+    due_to = _day(due_to, "due to")
+    return db.borrowed_books((text or "").strip(), sort=_sort(sort, LOAN_SORTS), descending=descending,
+                             borrower=(borrower or "").strip(), due_from=_day(due_from, "due from"),
+                             due_to=None if due_to is None else due_to + 86400)
+
+
+class BatchResult:
+    def __init__(self, path):
+        self.path = path
+        self.done = 0
+        self.errors = []    # (line, message)
+        self.elapsed = 0.0
+
+    @property
+    def rate(self):
+        return self.done / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (f"Applied {self.done} operations, failed {len(self.errors)} "
+                f"in {self.elapsed:.2f}s ({self.rate:,.0f} ops/s)")
+
+
+def _apply(db, record, now):
+    action = (record.get("action") or "").strip().lower()
+    if action == "borrow":
+        if record.get("barcode"):
+            borrow_barcode(db, record.get("barcode"), record.get("member_id"), record.get("days"), now)
+        else:
+            borrow_book(db, record.get("book_id"), record.get("member_id"), record.get("days"), now)
+    elif action == "return":
+        if record.get("borrow_id"):
+            return_book(db, record.get("borrow_id"))
+        elif record.get("barcode"):
+            return_barcode(db, record.get("barcode"))
+        else:
+            return_copy(db, record.get("book_id"))
+    else:
+        raise ValidationError(f"Unknown action: {action!r}")
+
+
+def run_batch(db, path, now=None):
+    """Apply a file of borrow/return operations in a single transaction.
+
+    The file is CSV with an ``action,book_id,member_id,days,borrow_id,barcode``
+    header, or JSON Lines with the same keys. A ``barcode`` names the copy
+    scanned; otherwise borrows take any free copy of the ``book_id``. Returns
+    give a ``borrow_id``, a ``barcode``, or just a ``book_id`` to return that
+    book's oldest loan. Operations that are
+    rejected (e.g. the book is already lent out) are listed in the result and
+    don't stop the batch; a database error rolls the whole batch back.
+    """
+    from importer import is_jsonl, read_csv, read_jsonl
+
+    result = BatchResult(path)
+    now = now or datetime.now()
+    start = time.perf_counter()
+    with open(path, newline="", encoding="utf-8-sig") as lines:
+        records = read_jsonl(lines) if is_jsonl(path) else read_csv(lines)
+        with db.transaction():
+            for line, record, error in records:
+                if error is None:
+                    try:
+                        _apply(db, record, now)
+                        result.done += 1
+                        continue
+                    except ValidationError as e:
+                        error = str(e)
+                result.errors.append((line, error))
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    from database import DB_PATH, configure, init_db
+
+    parser = argparse.ArgumentParser(description="Run library operations without the GUI.")
+    parser.add_argument("--db", default=DB_PATH, help="database file (default: %(default)s)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = commands.add_parser("add-book", help="add a book, or copies of one already listed")
+    command.add_argument("title")
+    command.add_argument("author")
+    command.add_argument("--copies", type=int, default=1, help="copies to add (default: %(default)s)")
+    command.add_argument("--barcode", action="append", default=[], help="label of a copy; repeat for more")
+    command = commands.add_parser("add-copies", help="add copies of a book")
+    command.add_argument("book_id")
+    command.add_argument("--copies", type=int, default=1, help="copies to add (default: %(default)s)")
+    command.add_argument("--barcode", action="append", default=[], help="label of a copy; repeat for more")
+    command = commands.add_parser("add-member", help="add a member")
+    command.add_argument("name")
+    command.add_argument("email")
+    command = commands.add_parser("borrow", help="lend any free copy of a book")
+    command.add_argument("book_id")
+    command.add_argument("member_id")
+    command.add_argument("days")
+    command = commands.add_parser("borrow-barcode", help="lend the copy with this barcode")
+    command.add_argument("barcode")
+    command.add_argument("member_id")
+    command.add_argument("days")
+    command = commands.add_parser("return", help="close a loan by its borrow id")
+    command.add_argument("borrow_id")
+    command = commands.add_parser("return-barcode", help="return the copy with this barcode")
+    command.add_argument("barcode")
+    command = commands.add_parser("return-book", help="return the book's oldest loan")
+    command.add_argument("book_id")
+    command = commands.add_parser("hold", help="queue a member for a book that is lent out")
+    command.add_argument("book_id")
+    command.add_argument("member_id")
+    command = commands.add_parser("cancel-hold", help="cancel a hold; a copy set aside for it moves on")
+    command.add_argument("hold_id")
+    command = commands.add_parser("holds", help="list the open holds per book, in queue order")
+    command.add_argument("text", nargs="?", default="")
+    command.add_argument("--status", choices=HOLD_STATUSES)
+    command = commands.add_parser("expire-holds", help="pass on the copies not collected in time")
+    command.add_argument("--days", type=int, default=HOLD_PICKUP_DAYS,
+                         help="days a copy waits for pickup (default: %(default)s)")
+    command = commands.add_parser("search", help="search the catalogue by title or author")
+    command.add_argument("text", nargs="?", default="")
+    command.add_argument("--fuzzy", action="store_true", help="closest matches first, tolerating typos")
+    command.add_argument("--sort", help="id, title, author or available")
+    command.add_argument("--desc", action="store_true", help="reverse the sort order")
+    command.add_argument("--author", default="", help="only authors starting with this")
+    command.add_argument("--availability", choices=("available", "unavailable"))
+    command = commands.add_parser("borrowed", help="list the books lent out")
+    command.add_argument("text", nargs="?", default="")
+    command.add_argument("--sort", help="book, title, author, borrower, email or return_date")
+    command.add_argument("--desc", action="store_true", help="reverse the sort order")
+    command.add_argument("--borrower", default="", help="only members whose name or email starts with this")
+    command.add_argument("--due-from", default="", help="first return date to list, YYYY-MM-DD")
+    command.add_argument("--due-to", default="", help="last return date to list, YYYY-MM-DD")
+    command = commands.add_parser("overdue", help="list overdue loans per member")
+    command.add_argument("--days", type=int, default=0, help="also list loans due within this many days")
+    command = commands.add_parser("stats", help="circulation statistics")
+    command.add_argument("--top", type=int, default=10, help="books and members to list (default: %(default)s)")
+    command.add_argument("--days", type=int, default=14, help="days of loan volume to list (default: %(default)s)")
+    command = commands.add_parser("batch", help="apply a CSV/JSON Lines file of borrow and return operations")
+    command.add_argument("path")
+    args = parser.parse_args()
+
+    db = configure(args.db)
+    init_db()
+    try:
+        if args.command == "add-book":
+            print(f"Added book {add_book(db, args.title, args.author, args.copies, args.barcode)}")
+        elif args.command == "add-copies":
+            print("Added copies", *add_copies(db, args.book_id, args.copies, args.barcode))
+        elif args.command == "add-member":
+            print(f"Added member {add_member(db, args.name, args.email)}")
+        elif args.command == "borrow":
+            print(f"Borrowed; return by {borrow_book(db, args.book_id, args.member_id, args.days)}")
+        elif args.command == "borrow-barcode":
+            print(f"Borrowed; return by {borrow_barcode(db, args.barcode, args.member_id, args.days)}")
+        elif args.command == "return":
+            return_book(db, args.borrow_id)
+            print("Returned")
+        elif args.command == "return-barcode":
+            return_barcode(db, args.barcode)
+            print("Returned")
+        elif args.command == "return-book":
+            return_copy(db, args.book_id)
+            print("Returned")
+        elif args.command == "hold":
+            print(f"On hold; number {place_hold(db, args.book_id, args.member_id)} in the queue")
+        elif args.command == "cancel-hold":
+            cancel_hold(db, args.hold_id)
+            print("Cancelled")
+        elif args.command == "holds":
+            # Holds are listed with their hold id first, as taken by "cancel-hold"
+            query = holds(db, args.text, args.status)
+            after = None
+            while True:
+                page = query.page(after, 1000)
+                for key, values in page:
+                    print(key[-1], *values, sep="\t")
+                if len(page) < 1000:
+                    break
+                after = page[-1][0]
+        elif args.command == "expire-holds":
+            print(f"Expired {expire_holds(db, args.days)} holds")
+        elif args.command == "search":
+            query = search_books(db, args.text, fuzzy=args.fuzzy, sort=args.sort, descending=args.desc,
+                                 author=args.author, availability=args.availability)
+            for values in query.all():
+                print(*values, sep="\t")
+        elif args.command == "borrowed":
+            # Loans are listed with their borrow id first, as taken by "return"
+            query = borrowed_books(db, args.text, sort=args.sort, descending=args.desc, borrower=args.borrower,
+                                   due_from=args.due_from, due_to=args.due_to)
+            after = None
+            while True:
+                page = query.page(after, 1000)
+                for key, values in page:
+                    print(key[-1], *values, sep="\t")
+                if len(page) < 1000:
+                    break
+                after = page[-1][0]
+        elif args.command == "overdue":
+            for (name, email), loans in overdue_report(db, args.days):
+                print(f"{name} <{email}>")
+                for title, return_date, days in loans:
+                    status = f"{days} days overdue" if days > 0 else f"due {return_date}"
+                    print(f"    {title}\t{status}")
+        elif args.command == "stats":
+            stats = db.circulation_stats(args.top, args.days)
+            print(f"Loans: {stats['loans']}  Returns: {stats['returns']}  Active: {stats['active']}")
+            print("\nMost borrowed books")
+            for title, author, loans in stats["top_books"]:
+                print(f"    {loans}\t{title} ({author})")
+            print("\nBusiest members")
+            for name, email, loans in stats["top_members"]:
+                print(f"    {loans}\t{name} <{email}>")
+            print("\nDaily loans / returns")
+            for day, loans, returns in stats["daily"]:
+                print(f"    {day}\t{loans}\t{returns}")
+        else:
+            result = run_batch(db, args.path)
+            for line, error in result.errors:
+                print(f"line {line}: {error}", file=sys.stderr)
+            print(result)
+            sys.exit(1 if result.errors else 0)
+    except ValidationError as e:
+        sys.exit(str(e))
+    except sqlite3.Error as e:
+        sys.exit(f"Database error: {e}")
@@ -0,0 +1,169 @@
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmark import SIZES, log, prepare
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# What a desk or kiosk does, by share of requests
+MIX = [
+    ("search", 0.45),
+    ("search_sorted", 0.10),
+    ("book", 0.15),
+    ("members", 0.15),
+    ("borrow", 0.10),
+    ("return", 0.05),
+]
+SEARCH_WORDS = ["harry", "lost", "garden", "silent", "river", "stone", "zzz"]
+MEMBER_PREFIXES = ["a", "me", "ali", "john", "zeynep"]
+
+
+def start_server(path, threads):
+    """Start server.py on a free port; returns (process, port) once it is listening."""
+    process = subprocess.Popen(
+        [sys.executable, "server.py", "--db", path, "--port", "0", "--threads", str(threads)],
+        cwd=HERE, stdout=subprocess.PIPE, text=True,
+    )
+    for line in process.stdout:
+        if line.startswith("Serving on "):
+            return process, int(line.rsplit(":", 1)[1])
+    process.wait()
+    raise RuntimeError("the server did not start")
+
+
+def client(host, port, books, members, requests, seed):
+    """One kiosk on one kept-alive connection; returns {operation: [ms, ...]} and error counts."""
+    rng = random.Random(seed)
+    operations = [name for name, _ in MIX]
+    weights = [share for _, share in MIX]
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    times = {name: [] for name in operations}
+    errors = {}
+    for _ in range(requests):
+        operation = rng.choices(operations, weights)[0]
+        method, body = "GET", None
+        if operation == "search":
+            url = f"/books?q={rng.choice(SEARCH_WORDS)}&limit=50"
+        elif operation == "search_sorted":
+            url = f"/books?sort=title&desc={rng.randint(0, 1)}&availability=available&limit=50"
+        elif operation == "book":
+            url = f"/books/{rng.randint(1, books)}"
+        elif operation == "members":
+            url = f"/members?q={rng.choice(MEMBER_PREFIXES)}"
+        elif operation == "borrow":
+            method, url = "POST", "/loans"
+            body = {"book_id": rng.randint(1, books), "member_id": rng.randint(1, members), "days": 14}
+        else:
+            method, url = "POST", "/returns"
+            body = {"book_id": rng.randint(1, books)}
+        start = time.perf_counter()
+        data = None if body is None else json.dumps(body)
+        headers = {} if body is None else {"Content-Type": "application/json"}
+        conn.request(method, url, data, headers)
+        response = conn.getresponse()
+        response.read()
+        times[operation].append((time.perf_counter() - start) * 1000)
+        # 400s are expected: the book may be lent out, or have no loan to return
+        if response.status >= 500:
+            errors[response.status] = errors.get(response.status, 0) + 1
+    conn.close()
+    return times, errors
+
+
+def percentiles(times):
+    times = sorted(times)
+    if not times:
+        return {"requests": 0}
+
+    def at(p):
+        return round(times[min(int(p / 100 * len(times)), len(times) - 1)], 3)
+
+    return {"requests": len(times), "p50_ms": at(50), "p95_ms": at(95), "p99_ms": at(99), "max_ms": round(times[-1], 3)}
+
+
+def run(size, clients, requests, threads, path=None, url=None, seed=0):
+    books, members, _ = SIZES[size]
+    process = None
+    if url is None:
+        path = path or os.path.join(tempfile.gettempdir(), f"library-bench-{size}.db")
+        prepare(path, size, seed).close()
+        process, port = start_server(path, threads)
+        host = "127.0.0.1"
+    else:
+        host, port = url.split("//", 1)[-1].rstrip("/").rsplit(":", 1)
+        port = int(port)
+    try:
+        # Separate processes, so the clients don't share one GIL with each other
+        context = multiprocessing.get_context("spawn")
+        start = time.perf_counter()
+        with context.Pool(clients) as pool:
+            results = pool.starmap(
+                client, [(host, port, books, members, requests, seed * 1000 + n) for n in range(clients)]
+            )
+        elapsed = time.perf_counter() - start
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    by_operation, errors = {}, {}
+    for times, client_errors in results:
+        for name, values in times.items():
+            by_operation.setdefault(name, []).extend(values)
+        for status, count in client_errors.items():
+            errors[status] = errors.get(status, 0) + count
+    everything = [value for values in by_operation.values() for value in values]
+    return {
+        "size": size,
+        "clients": clients,
+        "server_threads": threads,
+        "requests": len(everything),
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(len(everything) / elapsed, 1),
+        "latency": percentiles(everything),
+        "operations": {name: percentiles(values) for name, values in by_operation.items()},
+        "server_errors": errors,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Load-test the JSON API on localhost.")
+    parser.add_argument("--size", choices=SIZES, default="10k", help="catalogue size (default: %(default)s)")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent kiosks (default: %(default)s)")
+    parser.add_argument("--requests", type=int, default=500, help="requests per kiosk (default: %(default)s)")
+    parser.add_argument("--threads", type=int, default=16, help="server threads (default: %(default)s)")
+    parser.add_argument("--db", help="benchmark database file (default: one per size in the temp directory)")
+    parser.add_argument("--url", help="test an already running server instead, e.g. http://127.0.0.1:8080; "
+                                      "it must serve a --size catalogue, as borrows go to random ids")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-p99", type=float, help="exit 1 if the overall p99 latency (ms) is above this")
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    if args.clients > args.threads and args.url is None:
+        log("More clients than server threads: the extra kept-alive connections queue for a thread")
+    report = run(args.size, args.clients, args.requests, args.threads, args.db, args.url, args.seed)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    log(f"{report['requests_per_second']:,.0f} requests/s, p99 {report['latency']['p99_ms']:.1f} ms")
+    failed = bool(report["server_errors"])
+    if failed:
+        log(f"SERVER ERRORS: {report['server_errors']}")
+    if args.max_p99 is not None and report["latency"]["p99_ms"] > args.max_p99:
+        log(f"OVER BUDGET: p99 {report['latency']['p99_ms']:.1f} ms > {args.max_p99:.0f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
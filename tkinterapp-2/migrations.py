@@ -0,0 +1,519 @@
+from database import GENERATED_BARCODE, NOW_SECONDS, fts5_available, trigram_available
+
+# Schema migrations, applied in order. The number of migrations applied so far
+# is stored in the database header (PRAGMA user_version), so existing
+# library.db files are upgraded in place and each step only ever runs once.
+
+
+def create_base_tables(db):
+    # Create Books Table
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS books (
+            id INTEGER PRIMARY KEY,
+            title TEXT NOT NULL,
+            author TEXT NOT NULL,
+            available INTEGER DEFAULT 1
+        )
+    """)
+
+    # Create Members Table
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS members (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL
+        )
+    """)
+
+    # Create Borrow Records Table with borrow_date and return_date
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS borrows (
+            id INTEGER PRIMARY KEY,
+            book_id INTEGER,
+            member_id INTEGER,
+            borrow_date TEXT,
+            return_date TEXT,
+            FOREIGN KEY(book_id) REFERENCES books(id),
+            FOREIGN KEY(member_id) REFERENCES members(id)
+        )
+    """)
+
+
+def create_books_fts(db):
+    if not fts5_available():
+        # Searches fall back to LIKE; see Database.search_books
+        return
+    exists = db.query_one(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'books_fts'"
+    )
+    # External content table: the index stores only tokens, rows live in books
+    db.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+            title, author, content='books', content_rowid='id'
+        )
+    """)
+    # Keep the index in sync with books
+    db.execute("""
+        CREATE TRIGGER IF NOT EXISTS books_fts_ai AFTER INSERT ON books BEGIN
+            INSERT INTO books_fts (rowid, title, author) VALUES (new.id, new.title, new.author);
+        END
+    """)
+    db.execute("""
+        CREATE TRIGGER IF NOT EXISTS books_fts_ad AFTER DELETE ON books BEGIN
+            INSERT INTO books_fts (books_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+        END
+    """)
+    db.execute("""
+        CREATE TRIGGER IF NOT EXISTS books_fts_au AFTER UPDATE OF title, author ON books BEGIN
+            INSERT INTO books_fts (books_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+            INSERT INTO books_fts (rowid, title, author) VALUES (new.id, new.title, new.author);
+        END
+    """)
+    if not exists:
+        # Index the books that were added before the FTS table existed
+        db.execute("INSERT INTO books_fts (books_fts) VALUES ('rebuild')")
+
+
+def create_lookup_indexes(db):
+    # Joins and deletes in the return form look loans up by book and member
+    db.execute("CREATE INDEX IF NOT EXISTS idx_borrows_book_id ON borrows (book_id)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_borrows_member_id ON borrows (member_id)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_borrows_return_date ON borrows (return_date)")
+    # Only books that can be lent, in id order, for the borrow form's default list
+    db.execute("CREATE INDEX IF NOT EXISTS idx_books_available ON books (id) WHERE available > 0")
+    # Case-insensitive so LIKE 'prefix%' on member names can use it
+    db.execute("CREATE INDEX IF NOT EXISTS idx_members_name ON members (name COLLATE NOCASE)")
+
+
+def create_member_email_index(db):
+    # The UNIQUE index on email is case-sensitive; the member picker's
+    # case-insensitive LIKE 'prefix%' needs a NOCASE one
+    db.execute("CREATE INDEX IF NOT EXISTS idx_members_email ON members (email COLLATE NOCASE)")
+
+
+def add_loan_due_at(db):
+    # return_date is a "%Y-%m-%d %H:%M:%S" string; due_at holds the same moment
+    # as an integer (the local time read as UTC seconds, see library.epoch),
+    # so overdue lookups are a range scan on an index instead of string parsing
+    db.execute("ALTER TABLE borrows ADD COLUMN due_at INTEGER")
+    db.execute("UPDATE borrows SET due_at = CAST(strftime('%s', return_date) AS INTEGER)")
+    db.execute("DROP INDEX IF EXISTS idx_borrows_return_date")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_borrows_due_at ON borrows (due_at)")
+
+
+def add_loan_history(db):
+    # Returning a loan now sets returned_at instead of deleting the row. The
+    # lookups the app makes only care about active loans, so their indexes are
+    # partial and stay as small as the set of books currently lent out
+    db.execute("ALTER TABLE borrows ADD COLUMN returned_at INTEGER")
+    db.execute("DROP INDEX IF EXISTS idx_borrows_book_id")
+    db.execute("DROP INDEX IF EXISTS idx_borrows_member_id")
+    db.execute("DROP INDEX IF EXISTS idx_borrows_due_at")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_borrows_active ON borrows (id) WHERE returned_at IS NULL")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_borrows_active_book ON borrows (book_id) WHERE returned_at IS NULL")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_borrows_active_member ON borrows (member_id) WHERE returned_at IS NULL")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_borrows_active_due ON borrows (due_at) WHERE returned_at IS NULL")
+    # History by return time, for statistics and archive.py
+    db.execute("CREATE INDEX IF NOT EXISTS idx_borrows_returned_at ON borrows (returned_at) WHERE returned_at IS NOT NULL")
+
+
+def create_circulation_stats(db):
+    # Counters kept up to date by triggers on borrows, so the statistics window
+    # reads a handful of rows however long the loan history gets. Archiving
+    # deletes old loans but doesn't touch these, so the numbers stay complete
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS circulation_totals (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            loans INTEGER NOT NULL DEFAULT 0,
+            returns INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS book_stats (
+            book_id INTEGER PRIMARY KEY,
+            loans INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS member_stats (
+            member_id INTEGER PRIMARY KEY,
+            loans INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS daily_stats (
+            day TEXT PRIMARY KEY,
+            loans INTEGER NOT NULL DEFAULT 0,
+            returns INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    # Top-N lists read these in order instead of sorting
+    db.execute("CREATE INDEX IF NOT EXISTS idx_book_stats_loans ON book_stats (loans)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_member_stats_loans ON member_stats (loans)")
+
+    db.execute("""
+        CREATE TRIGGER IF NOT EXISTS borrows_stats_ai AFTER INSERT ON borrows BEGIN
+            UPDATE circulation_totals SET loans = loans + 1 WHERE id = 1;
+            INSERT INTO book_stats (book_id, loans) VALUES (new.book_id, 1)
+                ON CONFLICT (book_id) DO UPDATE SET loans = loans + 1;
+            INSERT INTO member_stats (member_id, loans) VALUES (new.member_id, 1)
+                ON CONFLICT (member_id) DO UPDATE SET loans = loans + 1;
+            INSERT INTO daily_stats (day, loans) VALUES (substr(new.borrow_date, 1, 10), 1)
+                ON CONFLICT (day) DO UPDATE SET loans = loans + 1;
+        END
+    """)
+    # Loans inserted already returned (e.g. generated history) count as returns too
+    db.execute("""
+        CREATE TRIGGER IF NOT EXISTS borrows_stats_ai_returned AFTER INSERT ON borrows
+        WHEN new.returned_at IS NOT NULL BEGIN
+            UPDATE circulation_totals SET returns = returns + 1 WHERE id = 1;
+            INSERT INTO daily_stats (day, returns) VALUES (date(new.returned_at, 'unixepoch'), 1)
+                ON CONFLICT (day) DO UPDATE SET returns = returns + 1;
+        END
+    """)
+    db.execute("""
+        CREATE TRIGGER IF NOT EXISTS borrows_stats_au_returned AFTER UPDATE OF returned_at ON borrows
+        WHEN old.returned_at IS NULL AND new.returned_at IS NOT NULL BEGIN
+            UPDATE circulation_totals SET returns = returns + 1 WHERE id = 1;
+            INSERT INTO daily_stats (day, returns) VALUES (date(new.returned_at, 'unixepoch'), 1)
+                ON CONFLICT (day) DO UPDATE SET returns = returns + 1;
+        END
+    """)
+
+    # Count the loans made before the triggers existed
+    db.execute("""
+        INSERT OR REPLACE INTO circulation_totals (id, loans, returns)
+        SELECT 1, count(*), count(returned_at) FROM borrows
+    """)
+    db.execute("""
+        INSERT OR REPLACE INTO book_stats (book_id, loans)
+        SELECT book_id, count(*) FROM borrows GROUP BY book_id
+    """)
+    db.execute("""
+        INSERT OR REPLACE INTO member_stats (member_id, loans)
+        SELECT member_id, count(*) FROM borrows GROUP BY member_id
+    """)
+    db.execute("""
+        INSERT OR REPLACE INTO daily_stats (day, loans, returns)
+        SELECT day, sum(loans), sum(returns) FROM (
+            SELECT substr(borrow_date, 1, 10) AS day, 1 AS loans, 0 AS returns FROM borrows
+            UNION ALL
+            SELECT date(returned_at, 'unixepoch'), 0, 1 FROM borrows WHERE returned_at IS NOT NULL
+        )
+        GROUP BY day
+    """)
+
+
+def add_change_tracking(db):
+    # Every insert or update stamps the row with the next number from
+    # change_counter, so exporter.py can fetch just the rows changed since
+    # its last run with an index range scan on change_seq
+    db.execute("CREATE TABLE IF NOT EXISTS change_counter (id INTEGER PRIMARY KEY CHECK (id = 1), seq INTEGER NOT NULL)")
+    db.execute("INSERT OR IGNORE INTO change_counter (id, seq) VALUES (1, 0)")
+    db.execute("CREATE TABLE IF NOT EXISTS export_watermarks (name TEXT PRIMARY KEY, seq INTEGER NOT NULL)")
+    for table in ("books", "members", "borrows"):
+        db.execute(f"ALTER TABLE {table} ADD COLUMN change_seq INTEGER")
+        db.execute("UPDATE change_counter SET seq = seq + 1 WHERE id = 1")
+        db.execute(f"UPDATE {table} SET change_seq = (SELECT seq FROM change_counter WHERE id = 1)")
+        db.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_change_seq ON {table} (change_seq)")
+        stamp = f"""
+            UPDATE change_counter SET seq = seq + 1 WHERE id = 1;
+            UPDATE {table} SET change_seq = (SELECT seq FROM change_counter WHERE id = 1) WHERE id = new.id;
+        """
+        db.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_change_ai AFTER INSERT ON {table} BEGIN {stamp} END")
+        # The WHEN clause keeps the trigger's own UPDATE from stamping the row again
+        db.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_change_au AFTER UPDATE ON {table}
+            WHEN new.change_seq IS old.change_seq BEGIN {stamp} END
+        """)
+
+
+def create_books_trigram(db):
+    if not trigram_available():
+        # Fuzzy searches fall back to the exact search; see Database.search_books
+        return
+    # Every three-letter sequence of titles and authors, so a misspelt word
+    # still shares most of its trigrams with the right one. detail=column keeps
+    # the index smaller than a full one but still allows title-only matches
+    db.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS books_trigram USING fts5(
+            title, author, content='books', content_rowid='id', tokenize='trigram', detail='column'
+        )
+    """)
+    db.execute("""
+        CREATE TRIGGER IF NOT EXISTS books_trigram_ai AFTER INSERT ON books BEGIN
+            INSERT INTO books_trigram (rowid, title, author) VALUES (new.id, new.title, new.author);
+        END
+    """)
+    db.execute("""
+        CREATE TRIGGER IF NOT EXISTS books_trigram_ad AFTER DELETE ON books BEGIN
+            INSERT INTO books_trigram (books_trigram, rowid, title, author)
+            VALUES ('delete', old.id, old.title, old.author);
+        END
+    """)
+    db.execute("""
+        CREATE TRIGGER IF NOT EXISTS books_trigram_au AFTER UPDATE OF title, author ON books BEGIN
+            INSERT INTO books_trigram (books_trigram, rowid, title, author)
+            VALUES ('delete', old.id, old.title, old.author);
+            INSERT INTO books_trigram (rowid, title, author) VALUES (new.id, new.title, new.author);
+        END
+    """)
+    db.execute("INSERT INTO books_trigram (books_trigram) VALUES ('rebuild')")
+
+
+def create_sort_indexes(db):
+    # Sorting a list by a column and the column filters walk these in order,
+    # so the first page of a sorted million-book list comes straight off an
+    # index. NOCASE matches the lists' ORDER BY and lets LIKE 'prefix%' use them
+    db.execute("CREATE INDEX IF NOT EXISTS idx_books_title ON books (title COLLATE NOCASE)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_books_author ON books (author COLLATE NOCASE)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_books_availability ON books (available)")
+
+
+def create_copies(db):
+    # A books row is now the title record; each physical copy is a row of
+    # copies with its own barcode. books.copies and books.available are
+    # counters over those rows, kept exact by triggers, so "how many copies
+    # are free" is still one primary key lookup however many copies exist.
+    # A loan records the copy it took, and lending or returning a copy flips
+    # its lent flag from the borrows triggers below
+    db.execute("ALTER TABLE books ADD COLUMN copies INTEGER NOT NULL DEFAULT 0")
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS copies (
+            id INTEGER PRIMARY KEY,
+            book_id INTEGER NOT NULL REFERENCES books(id),
+            barcode TEXT NOT NULL UNIQUE,
+            lent INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    # A free copy of a title is one seek; so is listing a title's copies
+    db.execute("CREATE INDEX IF NOT EXISTS idx_copies_book ON copies (book_id, lent)")
+    db.execute("ALTER TABLE borrows ADD COLUMN copy_id INTEGER REFERENCES copies(id)")
+    # At most one active loan per copy, and the loan of a scanned copy is one seek
+    db.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_borrows_active_copy ON borrows (copy_id) WHERE returned_at IS NULL")
+
+    # Until now available counted the copies on the shelf; the ones out on
+    # loan make up the rest. Create them all free, then lend out one per
+    # active loan (the triggers take those off available again)
+    db.execute("""
+        UPDATE books SET (copies, available) = (
+            SELECT max(books.available, 0) + count(*), max(books.available, 0) + count(*)
+            FROM borrows WHERE borrows.book_id = books.id AND borrows.returned_at IS NULL
+        )
+    """)
+    db.execute(f"""
+        WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < (SELECT max(copies) FROM books))
+        INSERT INTO copies (book_id, barcode)
+        SELECT books.id, {GENERATED_BARCODE} FROM books CROSS JOIN n WHERE n.i <= books.copies
+    """)
+    db.execute(f"""
+        UPDATE borrows SET copy_id = copies.id
+        FROM (
+            SELECT id, book_id, row_number() OVER (PARTITION BY book_id ORDER BY id) AS i
+            FROM borrows WHERE returned_at IS NULL
+        ) AS n
+        JOIN books ON books.id = n.book_id
+        JOIN copies ON copies.barcode = {GENERATED_BARCODE}
+        WHERE borrows.id = n.id
+    """)
+
+    db.execute("""
+        CREATE TRIGGER IF NOT EXISTS copies_ai AFTER INSERT ON copies BEGIN
+            UPDATE books SET copies = copies + 1, available = available + (new.lent = 0) WHERE id = new.book_id;
+        END
+    """)
+    db.execute("""
+        CREATE TRIGGER IF NOT EXISTS copies_ad AFTER DELETE ON copies BEGIN
+            UPDATE books SET copies = copies - 1, available = available - (old.lent = 0) WHERE id = old.book_id;
+        END
+    """)
+    db.execute("""
+        CREATE TRIGGER IF NOT EXISTS copies_au AFTER UPDATE OF book_id, lent ON copies BEGIN
+            UPDATE books SET copies = copies - 1, available = available - (old.lent = 0) WHERE id = old.book_id;
+            UPDATE books SET copies = copies + 1, available = available + (new.lent = 0) WHERE id = new.book_id;
+        END
+    """)
+    db.execute("""
+        CREATE TRIGGER IF NOT EXISTS borrows_copy_ai AFTER INSERT ON borrows
+        WHEN new.copy_id IS NOT NULL AND new.returned_at IS NULL BEGIN
+            UPDATE copies SET lent = 1 WHERE id = new.copy_id;
+        END
+    """)
+    db.execute("""
+        CREATE TRIGGER IF NOT EXISTS borrows_copy_au AFTER UPDATE OF returned_at ON borrows
+        WHEN new.copy_id IS NOT NULL AND old.returned_at IS NULL AND new.returned_at IS NOT NULL BEGIN
+            UPDATE copies SET lent = 0 WHERE id = new.copy_id;
+        END
+    """)
+    db.execute("UPDATE copies SET lent = 1 WHERE id IN (SELECT copy_id FROM borrows WHERE returned_at IS NULL)")
+
+
+def create_holds(db):
+    # Members queue for a title whose copies are all out. A hold is
+    # 'waiting' in the queue, 'ready' once a copy is put aside for it (that
+    # copy's lent is 2: off the shelf, but not on loan), and then
+    # 'fulfilled', 'cancelled' or 'expired'. Only open holds are indexed
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS holds (
+            id INTEGER PRIMARY KEY,
+            book_id INTEGER NOT NULL REFERENCES books(id),
+            member_id INTEGER NOT NULL REFERENCES members(id),
+            created_at INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'waiting',
+            copy_id INTEGER REFERENCES copies(id),
+            ready_at INTEGER,
+            closed_at INTEGER
+        )
+    """)
+    # The queue of a title in order: its next hold is the first entry
+    db.execute("CREATE INDEX IF NOT EXISTS idx_holds_queue ON holds (book_id, created_at) WHERE status = 'waiting'")
+    # The holds view lists open holds per title in the same order
+    db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_holds_open ON holds (book_id, created_at)
+        WHERE status IN ('waiting', 'ready')
+    """)
+    # One open hold per member and title, found when that member borrows it
+    db.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_holds_member ON holds (member_id, book_id)
+        WHERE status IN ('waiting', 'ready')
+    """)
+    db.execute("CREATE INDEX IF NOT EXISTS idx_holds_copy ON holds (copy_id) WHERE status = 'ready'")
+    # Pickups not collected in time are released by expire_holds
+    db.execute("CREATE INDEX IF NOT EXISTS idx_holds_ready_at ON holds (ready_at) WHERE status = 'ready'")
+
+    # A copy that comes free (returned, added, or released from a hold) goes
+    # to the oldest waiting hold of its title before anyone can borrow it
+    assign = f"""
+        UPDATE holds SET status = 'ready', copy_id = new.id, ready_at = {NOW_SECONDS}
+        WHERE id = (
+            SELECT id FROM holds WHERE book_id = new.book_id AND status = 'waiting'
+            ORDER BY created_at, id LIMIT 1
+        );
+        UPDATE copies SET lent = 2 WHERE id = new.id;
+    """
+    waiting = "EXISTS (SELECT 1 FROM holds WHERE book_id = new.book_id AND status = 'waiting')"
+    db.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS copies_hold_ai AFTER INSERT ON copies
+        WHEN new.lent = 0 AND {waiting} BEGIN {assign} END
+    """)
+    db.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS copies_hold_au AFTER UPDATE OF lent ON copies
+        WHEN new.lent = 0 AND old.lent != 0 AND {waiting} BEGIN {assign} END
+    """)
+
+
+MIGRATIONS = [
+    create_base_tables,
+    create_books_fts,
+    create_lookup_indexes,
+    create_member_email_index,
+    add_loan_due_at,
+    add_loan_history,
+    create_circulation_stats,
+    add_change_tracking,
+    create_books_trigram,
+    create_sort_indexes,
+    create_copies,
+    create_holds,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(db):
+    return db.query_one("PRAGMA user_version")[0]
+
+
+def migrate(db):
+    """Bring the database up to SCHEMA_VERSION. Returns the versions applied."""
+    applied = []
+    version = schema_version(db)
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        # Each step commits together with its version bump, so an
+        # interrupted upgrade resumes where it stopped
+        with db.transaction():
+            migration(db)
+            db.execute(f"PRAGMA user_version = {number}")
+        applied.append(number)
+    return applied
+
+
+# Queries the UI runs on every search or refresh, with sample parameters
+HOT_QUERIES = {
+    "available books": lambda db: db.search_books("", title_only=True, available_only=True),
+    "book search": lambda db: db.search_books("harry"),
+    "title search": lambda db: db.search_books("harry", title_only=True),
+    "borrowed books": lambda db: db.borrowed_books(),
+    "borrowed books by title": lambda db: db.borrowed_books("harry"),
+    "overdue loans": lambda db: db.overdue_loans(1735689600, within_days=3),
+    "books by title": lambda db: db.search_books(sort="title"),
+    "books by author, descending": lambda db: db.search_books(sort="author", descending=True),
+    "books by an author": lambda db: db.search_books(author="harry", sort="title"),
+    "books lent out": lambda db: db.search_books(availability="unavailable"),
+    "loans by return date": lambda db: db.borrowed_books(sort="return_date"),
+}
+
+# Listing a whole table in primary-key order is expected to scan it
+ORDERED_LISTINGS = {
+    "borrowed books": "SCAN borrows",
+    # While most books are on the shelf, walking them in id order fills a page
+    # after a few rows more than it shows; with few available, ANALYZE steers
+    # the planner to idx_books_available instead
+    "available books": "SCAN books",
+}
+
+HOT_STATEMENTS = {
+    "return book": ("SELECT book_id FROM borrows WHERE id = ? AND returned_at IS NULL", (1,)),
+    "oldest loan of book": ("SELECT min(id) FROM borrows WHERE book_id = ? AND returned_at IS NULL", (1,)),
+    "member by name": ("SELECT id, name FROM members WHERE name LIKE ?", ("ab%",)),
+    "member by email": ("SELECT id, name FROM members WHERE email LIKE ?", ("ab%",)),
+    "loans by member": ("SELECT id FROM borrows WHERE member_id = ? AND returned_at IS NULL", (1,)),
+    "loans due before": ("SELECT id FROM borrows WHERE due_at < ? AND returned_at IS NULL", (1735689600,)),
+    "loans returned before": ("SELECT id FROM borrows WHERE returned_at < ?", (1735689600,)),
+    "free copy of book": ("SELECT id FROM copies WHERE book_id = ? AND lent = 0 LIMIT 1", (1,)),
+    "copy by barcode": ("SELECT id, book_id, lent FROM copies WHERE barcode = ?", ("1-1",)),
+    "loan of copy": ("SELECT id FROM borrows WHERE copy_id = ? AND returned_at IS NULL", (1,)),
+    "next hold": ("SELECT id FROM holds WHERE book_id = ? AND status = 'waiting' ORDER BY created_at, id LIMIT 1", (1,)),
+    "hold of member": (
+        "SELECT id, status, copy_id FROM holds WHERE member_id = ? AND book_id = ? AND status IN ('waiting', 'ready')",
+        (1, 1),
+    ),
+    "hold of copy": ("SELECT id, member_id FROM holds WHERE copy_id = ? AND status = 'ready'", (1,)),
+    "expired pickups": ("SELECT id, copy_id FROM holds WHERE status = 'ready' AND ready_at < ?", (1735689600,)),
+}
+
+
+def full_scans(db):
+    """Return {name: plan} for hot queries whose plan scans a whole table.
+
+    Any "SCAN <table>" step that isn't walking an index (and isn't one of the
+    ORDERED_LISTINGS) means a filter or join isn't using an index.
+    """
+    statements = dict(HOT_STATEMENTS)
+    for name, build in HOT_QUERIES.items():
+        query = build(db)
+        statements[name] = query.page_sql()
+    offenders = {}
+    for name, (sql, params) in statements.items():
+        plan = [row[3] for row in db.query(f"EXPLAIN QUERY PLAN {sql}", params)]
+        bad = [
+            step for step in plan
+            if step.startswith("SCAN ") and " USING " not in step
+            and "VIRTUAL TABLE" not in step and step != ORDERED_LISTINGS.get(name)
+        ]
+        if bad:
+            offenders[name] = plan
+    return offenders
+
+
+if __name__ == "__main__":
+    import sys
+
+    from database import get_db
+
+    db = get_db()
+    print(f"Applied migrations: {migrate(db) or 'none'} (schema version {schema_version(db)})")
+    offenders = full_scans(db)
+    for name, plan in offenders.items():
+        print(f"{name}: " + "; ".join(plan))
+    sys.exit(1 if offenders else 0)
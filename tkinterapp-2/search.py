@@ -0,0 +1,220 @@
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+# Number of recent result sets kept per database
+CACHE_SIZE = 64
+
+
+def words(text):
+    """Split text into lower-cased words the way the FTS5 unicode61 tokenizer does."""
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return re.findall(r"[^\W_]+", text.casefold())
+
+
+def trigram_words(text):
+    """The trigrams an FTS5 trigram index holds for each word of ``text``, in order."""
+    return [
+        list(dict.fromkeys(word[i:i + 3] for i in range(len(word) - 2)))
+        for word in re.findall(r"[^\W_]+", str(text).lower())
+        if len(word) >= 3
+    ]
+
+
+def _grams(word):
+    # Padded like pg_trgm, so word starts weigh more and short words have grams too
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class FuzzyMatcher:
+    """Scores how closely a row's words resemble the query's, typos included.
+
+    Each query word is compared with every word of the row's fields by the
+    Dice coefficient of their trigram sets; the score is the mean of each
+    query word's best match, from 0 (nothing alike) to 1.
+    """
+
+    def __init__(self, query, fields):
+        self.fields = fields
+        self.query_grams = [_grams(word) for word in words(query)]
+
+    def score(self, values):
+        row_grams = [_grams(word) for i in self.fields for word in words(values[i])]
+        if not row_grams or not self.query_grams:
+            return 0.0
+        total = 0.0
+        for query in self.query_grams:
+            total += max(2 * len(query & grams) / (len(query) + len(grams)) for grams in row_grams)
+        return total / len(self.query_grams)
+
+
+class PrefixMatcher:
+    """Matches FTS prefix searches: every query word starts some word of the row."""
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def refines(self, query, base):
+        # Anything matching "harry pot" also matched "harry p", so the
+        # narrower query can be answered from the broader one's rows
+        query_words, base_words = words(query), words(base)
+        return bool(base_words) and all(
+            any(q.startswith(b) for q in query_words) for b in base_words
+        )
+
+    def matches(self, query, values):
+        row_words = [w for i in self.fields for w in words(values[i])]
+        return all(any(w.startswith(q) for w in row_words) for q in words(query))
+
+
+class SubstringMatcher:
+    """Matches the LIKE '%query%' fallback used when FTS5 is unavailable."""
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def refines(self, query, base):
+        return bool(base) and base.lower() in query.lower()
+
+    def matches(self, query, values):
+        query = query.lower()
+        return any(query in str(values[i]).lower() for i in self.fields)
+
+
+class StartsWithMatcher:
+    """Matches LIKE 'prefix%' lookups on any of the given fields."""
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def refines(self, query, base):
+        return query.lower().startswith(base.lower())
+
+    def matches(self, query, values):
+        query = query.lower()
+        return any(str(values[i]).lower().startswith(query) for i in self.fields)
+
+
+class ResultCache:
+    """LRU cache of complete, small search results.
+
+    Entries are dropped as soon as the database's generation changes, i.e.
+    after any book or member is added, or a book is borrowed or returned, in
+    this process.
+    """
+
+    def __init__(self, db, capacity=CACHE_SIZE):
+        self.db = db
+        self.capacity = capacity
+        self.hits = 0
+        self.refinements = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._generation = db.generation
+        self._lock = threading.Lock()
+
+    def _check_generation(self):
+        if self._generation != self.db.generation:
+            self._entries.clear()
+            self._generation = self.db.generation
+
+    def get(self, kind, text):
+        with self._lock:
+            self._check_generation()
+            rows = self._entries.get((kind, text))
+            if rows is not None:
+                self._entries.move_to_end((kind, text))
+                self.hits += 1
+            return rows
+
+    def refine(self, kind, text, matcher):
+        """Answer ``text`` by filtering a cached broader result, if there is one."""
+        with self._lock:
+            self._check_generation()
+            for (cached_kind, base), rows in reversed(self._entries.items()):
+                if cached_kind == kind and matcher.refines(text, base):
+                    self.refinements += 1
+                    break
+            else:
+                self.misses += 1
+                return None
+        rows = [(key, values) for key, values in rows if matcher.matches(text, values)]
+        self.put(kind, text, rows)
+        return rows
+
+    def put(self, kind, text, rows, generation=None):
+        with self._lock:
+            self._check_generation()
+            if generation is not None and generation != self._generation:
+                # The data changed while these rows were being read
+                return
+            self._entries[(kind, text)] = rows
+            self._entries.move_to_end((kind, text))
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class CachedQuery:
+    """Wraps a KeysetQuery so small, complete results are served from a ResultCache.
+
+    A result is complete when its first page comes back short. Only complete
+    results are cached, so a cached list is always the exact answer and can be
+    filtered in memory for refined queries.
+    """
+
+    def __init__(self, query, cache, kind, text, matcher):
+        self.query = query
+        self.cache = cache
+        self.kind = kind
+        self.text = text
+        self.matcher = matcher
+
+    def _cached_rows(self):
+        if not self.text:
+            return None
+        rows = self.cache.get(self.kind, self.text)
+        if rows is None:
+            rows = self.cache.refine(self.kind, self.text, self.matcher)
+        return rows
+
+    def page(self, after=None, limit=200):
+        rows = self._cached_rows()
+        if rows is not None:
+            start = 0
+            if after is not None:
+                start = next((i + 1 for i, (key, _) in enumerate(rows) if key == tuple(after)), len(rows))
+            return rows[start:start + limit]
+        generation = self.cache.db.generation
+        page = self.query.page(after, limit)
+        if self.text and after is None and len(page) < limit:
+            self.cache.put(self.kind, self.text, page, generation)
+        return page
+
+    def count(self):
+        rows = self._cached_rows()
+        if rows is not None:
+            return len(rows)
+        return self.query.count()
+
+    def all(self, page_size=1000):
+        return self.query.all(page_size)
+
+    def page_sql(self, after=None, limit=200):
+        return self.query.page_sql(after, limit)
+
+    def valid_key(self, key):
+        return self.query.valid_key(key)
+
+    @property
+    def key_table(self):
+        return self.query.key_table
+
+    def rows_for(self, ids):
+        return self.query.rows_for(ids)
@@ -0,0 +1,355 @@
+import base64
+import binascii
+import json
+import sqlite3
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import library
+from database import get_db, is_busy
+from instrument import dump_on_exit, metrics
+
+# A local JSON API over the same library operations as the GUI, for kiosks
+# and scanner stations:
+#
+#   GET  /health
+#   GET  /books?q=&title_only=&fuzzy=&sort=&desc=&author=&availability=&after=&limit=&count=
+#   GET  /books/<id>
+#   GET  /members?q=&limit=
+#   GET  /loans?q=&sort=&desc=&borrower=&due_from=&due_to=&after=&limit=&count=
+#   POST /loans    {"book_id": 1, "member_id": 2, "days": 14}, or a scanned copy's "barcode" for "book_id"
+#   POST /returns  {"borrow_id": 3}, {"barcode": "1-2"}, or {"book_id": 1} to return its oldest loan
+#   GET  /holds?q=&status=&after=&limit=&count=
+#   POST /holds    {"book_id": 1, "member_id": 2}
+#   POST /holds/<id>/cancel
+#   GET  /metrics
+#
+# Lists are paged: pass a response's "next" back as "after" for the next page.
+
+DEFAULT_PORT = 8080
+# Connections are handled by this many threads, each with its own (reused) read connection
+THREADS = 16
+# Rows per page unless ?limit= asks for another number, and the most it may ask for
+PAGE_LIMIT = 50
+MAX_LIMIT = 500
+# Seconds a kept-alive connection may sit idle before its thread is handed back
+IDLE_TIMEOUT = 5
+MAX_BODY = 64 * 1024
+
+ROUTES = {
+    ("GET", "health"): "health",
+    ("GET", "books"): "books",
+    ("GET", "books/{id}"): "book",
+    ("GET", "members"): "members",
+    ("GET", "loans"): "loans",
+    ("POST", "loans"): "borrow",
+    ("POST", "returns"): "return",
+    ("GET", "holds"): "holds",
+    ("POST", "holds"): "hold",
+    ("POST", "holds/{id}/cancel"): "cancel_hold",
+    ("GET", "metrics"): "metrics",
+}
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        raise ApiError(400, "Invalid cursor.") from None
+    if not isinstance(key, list) or not key:
+        raise ApiError(400, "Invalid cursor.")
+    return tuple(key)
+
+
+class LibraryServer(HTTPServer):
+    """HTTP server handling connections on a fixed pool of threads.
+
+    Database connections are per thread, so every pool thread reads through
+    its own connection, opened once and reused. Writes are all handed to a
+    single writer thread and run one at a time, in arrival order, so they
+    never wait on each other's locks.
+    """
+
+    def __init__(self, address, threads=THREADS, verbose=False):
+        super().__init__(address, Handler)
+        self.verbose = verbose
+        self.pool = ThreadPoolExecutor(threads, thread_name_prefix="http")
+        self.writer = ThreadPoolExecutor(1, thread_name_prefix="db-writer")
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def write(self, fn, *args):
+        """Run ``fn(*args)`` on the writer thread and wait for its result."""
+        queued = time.perf_counter()
+
+        def run():
+            start = time.perf_counter()
+            metrics.record("write.wait", start - queued)
+            try:
+                return fn(*args)
+            finally:
+                metrics.record(f"write.{fn.__name__}", time.perf_counter() - start)
+
+        return self.writer.submit(run).result()
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.writer.shutdown()
+
+
+class Handler(BaseHTTPRequestHandler):
+    # Keep-alive, so a kiosk reuses one connection for all its requests
+    protocol_version = "HTTP/1.1"
+    timeout = IDLE_TIMEOUT
+    # Headers and body go out in separate writes; with Nagle on, the body waits
+    # for the client's delayed ACK (40 ms a request)
+    disable_nagle_algorithm = True
+    server_version = "LibraryAPI/1"
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _dispatch(self, method):
+        start = time.perf_counter()
+        url = urlsplit(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        ids = [int(part) for part in parts if part.isdigit()]
+        name = ROUTES.get((method, "/".join("{id}" if part.isdigit() else part for part in parts)))
+        self.params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            body = self._read_body() if method == "POST" else None
+            if name is None:
+                raise ApiError(404, f"No such endpoint: {method} {url.path}")
+            if any(value > library.MAX_ID for value in ids):
+                # Too big to be a row id, and too big to bind
+                raise ApiError(404, "Not found.")
+            status, result = getattr(self, f"api_{name}")(*ids, **({} if body is None else {"body": body}))
+        except ApiError as e:
+            status, result = e.status, {"error": str(e)}
+        except library.ValidationError as e:
+            status, result = 400, {"error": str(e)}
+        except sqlite3.Error as e:
+            # Locked even after the writer's retries: the client may try again
+            status, result = (503 if is_busy(e) else 500), {"error": f"Database error: {e}"}
+        except Exception:
+            traceback.print_exc()
+            status, result = 500, {"error": "Internal error."}
+        self._send(status, result)
+        metrics.record(f"http.{name or 'unknown'}", time.perf_counter() - start)
+        metrics.count(f"http.{status}")
+
+    def _read_body(self):
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0 or length > MAX_BODY:
+            # The rest of the request can't be skipped reliably; drop the connection after answering
+            self.close_connection = True
+            raise ApiError(413 if length > MAX_BODY else 400, "Bad request body.")
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            raise ApiError(400, "The request body must be JSON.") from None
+        if not isinstance(body, dict):
+            raise ApiError(400, "The request body must be a JSON object.")
+        return body
+
+    def _send(self, status, result):
+        data = json.dumps(result, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # One line per request would swamp the console under load
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    # Query string helpers
+    def param(self, name, default=""):
+        return self.params.get(name, default).strip()
+
+    def flag(self, name):
+        return self.param(name).lower() in ("1", "true", "yes", "on")
+
+    def limit(self, default=PAGE_LIMIT):
+        try:
+            limit = int(self.param("limit") or default)
+        except ValueError:
+            raise ApiError(400, "limit must be a number.") from None
+        if not 1 <= limit <= MAX_LIMIT:
+            raise ApiError(400, f"limit must be between 1 and {MAX_LIMIT}.")
+        return limit
+
+    def page(self, query, row):
+        limit = self.limit()
+        after = decode_cursor(self.param("after"))
+        if after is not None and not query.valid_key(after):
+            # A cursor from another list (or made up) would not bind to this query's keys
+            raise ApiError(400, "Invalid cursor.")
+        page = query.page(after, limit)
+        result = {
+            "items": [row(key, values) for key, values in page],
+            "next": encode_cursor(page[-1][0]) if len(page) == limit else None,
+        }
+        if self.flag("count"):
+            result["total"] = query.count()
+        return 200, result
+
+    # Endpoints; each returns (status, JSON-able result)
+    def api_health(self):
+        return 200, {"ok": True}
+
+    def api_books(self):
+        query = library.search_books(
+            get_db(), self.param("q"), title_only=self.flag("title_only"), fuzzy=self.flag("fuzzy"),
+            sort=self.param("sort") or None, descending=self.flag("desc"), author=self.param("author"),
+            availability=self.param("availability") or None,
+        )
+        return self.page(query, lambda key, values: book_json(values))
+
+    def api_book(self, book_id):
+        book = get_db().get_book(book_id)
+        if book is None:
+            raise ApiError(404, f"No book {book_id}.")
+        result = dict(book_json(book[:4]), copies=book[4])
+        # lent is 1 for a copy on loan, 2 for one set aside for a hold
+        result["barcodes"] = [{"barcode": barcode, "lent": lent == 1, "on_hold": lent == 2}
+                              for _, barcode, lent in get_db().book_copies(book_id)]
+        return 200, result
+
+    def api_members(self):
+        members = get_db().find_members(self.param("q"), self.limit(20))
+        return 200, {"items": [{"id": id, "name": name, "email": email} for id, name, email in members]}
+
+    def api_loans(self):
+        query = library.borrowed_books(
+            get_db(), self.param("q"), sort=self.param("sort") or None, descending=self.flag("desc"),
+            borrower=self.param("borrower"), due_from=self.param("due_from"), due_to=self.param("due_to"),
+        )
+        return self.page(query, loan_json)
+
+    def api_borrow(self, body):
+        item = "barcode" if "barcode" in body else "book_id"
+        for field in (item, "member_id", "days"):
+            if field not in body:
+                raise ApiError(400, f"Missing {field}.")
+        lend = library.borrow_barcode if item == "barcode" else library.borrow_book
+        return_date = self.server.write(lend, get_db(), body[item], body["member_id"], body["days"])
+        return 201, {item: body[item], "member_id": body["member_id"], "return_date": return_date}
+
+    def api_return(self, body):
+        if "borrow_id" in body:
+            self.server.write(library.return_book, get_db(), body["borrow_id"])
+        elif "barcode" in body:
+            self.server.write(library.return_barcode, get_db(), body["barcode"])
+        elif "book_id" in body:
+            # A scanner only knows the book; return its longest-running loan
+            self.server.write(library.return_copy, get_db(), body["book_id"])
+        else:
+            raise ApiError(400, "Missing borrow_id, barcode or book_id.")
+        return 200, {"returned": True}
+
+    def api_holds(self):
+        query = library.holds(get_db(), self.param("q"), self.param("status") or None)
+        return self.page(query, hold_json)
+
+    def api_hold(self, body):
+        for field in ("book_id", "member_id"):
+            if field not in body:
+                raise ApiError(400, f"Missing {field}.")
+        position = self.server.write(library.place_hold, get_db(), body["book_id"], body["member_id"])
+        return 201, {"book_id": body["book_id"], "member_id": body["member_id"], "position": position}
+
+    def api_cancel_hold(self, hold_id, body):
+        self.server.write(library.cancel_hold, get_db(), hold_id)
+        return 200, {"cancelled": True}
+
+    def api_metrics(self):
+        return 200, dict(metrics.snapshot(), sql=get_db().stats.snapshot())
+
+
+def book_json(values):
+    book_id, title, author, available = values
+    return {"id": book_id, "title": title, "author": author, "available": available}
+
+
+def loan_json(key, values):
+    book_id, title, author, member, email, return_date = values
+    return {"borrow_id": key[-1], "book_id": book_id, "title": title, "author": author,
+            "member": member, "email": email, "return_date": return_date}
+
+
+def hold_json(key, values):
+    book_id, title, member, email, status, placed, position, barcode = values
+    return {"hold_id": key[-1], "book_id": book_id, "title": title, "member": member, "email": email,
+            "status": status, "placed": placed, "position": position or None, "barcode": barcode or None}
+
+
+def serve(host="127.0.0.1", port=DEFAULT_PORT, threads=THREADS, verbose=False):
+    """Serve the configured database until interrupted."""
+    server = LibraryServer((host, port), threads, verbose)
+    # The load test waits for this line (and reads the port from it when started with --port 0)
+    print(f"Serving on http://{host}:{server.server_port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        dump_on_exit(sql=lambda: get_db().stats.snapshot())
+
+
+if __name__ == "__main__":
+    import argparse
+    import signal
+
+    from database import DB_PATH, configure, init_db
+
+    parser = argparse.ArgumentParser(description="Serve the library as a JSON API on the local network.")
+    parser.add_argument("--db", default=DB_PATH, help="database file (default: %(default)s)")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="address to listen on; 0.0.0.0 for other machines (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="0 picks a free port (default: %(default)s)")
+    parser.add_argument("--threads", type=int, default=THREADS,
+                        help="connections served at once (default: %(default)s)")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args()
+
+    # Stop cleanly (and write LIBRARY_METRICS) when a service manager terminates us
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    configure(args.db)
+    init_db()
+    serve(args.host, args.port, args.threads, args.verbose)
@@ -0,0 +1,107 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmark import log, remove_db, summarize
+
+# Median time from launching the app to the menu being on screen must stay
+# under this; raise it deliberately, not by accident
+BUDGET_MS = 500
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Without a display the window can't open, so measure the same start-up up to it
+HEADLESS = """
+import sys
+from instrument import mark, metrics
+import tkinterapp2
+from database import configure, init_db
+configure(sys.argv[1])
+init_db()
+mark("init_db")
+import json
+print(json.dumps(metrics.snapshot()["startup"]), flush=True)
+"""
+
+
+def has_display():
+    if sys.platform in ("win32", "darwin"):
+        return True
+    return bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+
+
+def start_once(path, headless):
+    """Launch the app once; returns (ms until its trace arrived, the app's own trace in ms)."""
+    if headless:
+        command = [sys.executable, "-c", HEADLESS, path]
+    else:
+        command = [sys.executable, "tkinterapp2.py", "--db", path, "--startup-trace", "exit"]
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=HERE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    elapsed = trace = None
+    # The trace is the line printed once the first frame is drawn; the app's
+    # shutdown afterwards isn't part of start-up
+    for line in process.stdout:
+        if line.startswith("{"):
+            elapsed = (time.perf_counter() - start) * 1000
+            trace = {name: seconds * 1000 for name, seconds in json.loads(line).items()}
+    errors = process.stderr.read()
+    if process.wait() != 0 or trace is None:
+        raise RuntimeError(f"start-up failed: {errors.strip() or 'no trace printed'}")
+    return elapsed, trace
+
+
+def run(runs, headless):
+    directory = tempfile.mkdtemp(prefix="library-startup-")
+    path = os.path.join(directory, "startup.db")
+    try:
+        # The very first start creates the schema; every later one takes the fast path
+        first, _ = start_once(path, headless)
+        totals, phases = [], {}
+        for _ in range(runs):
+            elapsed, trace = start_once(path, headless)
+            totals.append(elapsed)
+            for name, ms in trace.items():
+                phases.setdefault(name, []).append(ms)
+    finally:
+        remove_db(path)
+        os.rmdir(directory)
+    return {
+        "headless": headless,
+        "new_database_ms": round(first, 3),
+        "startup": summarize(totals),
+        "phases": {name: summarize(times) for name, times in phases.items()},
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Measure cold start-up time and check it against a budget.")
+    parser.add_argument("--runs", type=int, default=10, help="app launches (default: %(default)s)")
+    parser.add_argument("--budget", type=float, default=BUDGET_MS,
+                        help="allowed median start-up in ms (default: %(default)s)")
+    parser.add_argument("--headless", action="store_true",
+                        help="stop before opening the window (the default when there is no display)")
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    headless = args.headless or not has_display()
+    if headless:
+        log("Measuring start-up without the window")
+    report = run(args.runs, headless)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    median = report["startup"]["median_ms"]
+    if median > args.budget:
+        log(f"OVER BUDGET: median start-up {median:.1f} ms > {args.budget:.0f} ms")
+        sys.exit(1)
+    log(f"Median start-up {median:.1f} ms (budget {args.budget:.0f} ms)")
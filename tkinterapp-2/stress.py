@@ -0,0 +1,180 @@
+import contextlib
+import io
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+from database import configure, init_db
+
+# A small catalogue with few copies, so clients keep fighting over the same books
+BOOKS = 20
+COPIES = 3
+MEMBERS = 10
+
+
+def setup(path):
+    db = configure(path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        init_db()
+    with db.transaction():
+        for i in range(1, BOOKS + 1):
+            db.add_book(f"Book {i}", f"Author {i}", COPIES)
+        db.executemany(
+            "INSERT INTO members (name, email) VALUES (?, ?)",
+            [(f"Member {i}", f"member{i}@example.com") for i in range(1, MEMBERS + 1)],
+        )
+    db.close()
+
+
+def client(path, number, operations, seed):
+    """One desk terminal: randomly borrows books (queueing when they are out)
+    or scanned copies, returns anybody's loans and cancels anybody's holds."""
+    db = configure(path)
+    rng = random.Random(seed * 1000 + number)
+    counts = {"borrowed": 0, "unavailable": 0, "returned": 0, "already_returned": 0,
+              "held": 0, "cancelled": 0}
+    start = time.perf_counter()
+    for _ in range(operations):
+        book_id = rng.randint(1, BOOKS)
+        action = rng.random()
+        if action < 0.5:
+            member_id = rng.randint(1, MEMBERS)
+            borrow_id = db.borrow_book(book_id, member_id, "2025-01-01 00:00:00", "2025-01-15 00:00:00")
+            counts["borrowed" if borrow_id else "unavailable"] += 1
+            if not borrow_id and rng.random() < 0.5:
+                try:
+                    if db.place_hold(book_id, member_id):
+                        counts["held"] += 1
+                except sqlite3.IntegrityError:
+                    # Already queueing for it
+                    pass
+        elif action < 0.6:
+            # A scanned copy, often by a member whose hold has a different copy set aside
+            barcode = f"{book_id}-{rng.randint(1, COPIES)}"
+            copy_id, _, _ = db.find_copy(barcode)
+            ready = db.query("SELECT member_id FROM holds WHERE book_id = ? AND status = 'ready'", (book_id,))
+            member_id = rng.choice(ready)[0] if ready and rng.random() < 0.5 else rng.randint(1, MEMBERS)
+            borrow_id = db.borrow_book(book_id, member_id, "2025-01-01 00:00:00", "2025-01-15 00:00:00", copy_id)
+            counts["borrowed" if borrow_id else "unavailable"] += 1
+        elif action < 0.65:
+            holds = db.query("SELECT id FROM holds WHERE book_id = ? AND status IN ('waiting', 'ready')", (book_id,))
+            if holds and db.cancel_hold(rng.choice(holds)[0]):
+                counts["cancelled"] += 1
+        else:
+            # Pick a loan another client may be returning at the same moment
+            loans = db.query("SELECT id FROM borrows WHERE book_id = ? AND returned_at IS NULL", (book_id,))
+            if not loans:
+                continue
+            if db.return_book(rng.choice(loans)[0]):
+                counts["returned"] += 1
+            else:
+                counts["already_returned"] += 1
+    counts["elapsed"] = time.perf_counter() - start
+    counts["busy_retries"] = db.busy_retries
+    db.close()
+    return counts
+
+
+def check(path, totals):
+    """Return a list of problems; empty if no loan was lost or handed out twice."""
+    db = configure(path)
+    problems = []
+    loans = db.query_one("SELECT count(*) FROM borrows WHERE returned_at IS NULL")[0]
+    expected = totals["borrowed"] - totals["returned"]
+    if loans != expected:
+        problems.append(f"{loans} active loans, expected {expected}")
+    history = db.query_one("SELECT count(*) FROM borrows WHERE returned_at IS NOT NULL")[0]
+    if history != totals["returned"]:
+        problems.append(f"{history} returned loans in the history, expected {totals['returned']}")
+    rows = db.query("""
+        SELECT books.id, books.available,
+            (SELECT count(*) FROM borrows WHERE book_id = books.id AND returned_at IS NULL),
+            (SELECT count(*) FROM holds WHERE book_id = books.id AND status = 'ready')
+        FROM books
+    """)
+    for book_id, available, lent, held in rows:
+        if available < 0 or available + lent + held != COPIES:
+            problems.append(f"book {book_id}: {available} available + {lent} lent + {held} held != {COPIES} copies")
+    # The trigger-kept counters must match the copies they count
+    rows = db.query("""
+        SELECT books.id, books.copies, books.available, count(copies.id), coalesce(sum(copies.lent = 0), 0)
+        FROM books LEFT JOIN copies ON copies.book_id = books.id
+        GROUP BY books.id
+    """)
+    for book_id, copies, available, counted, free in rows:
+        if (copies, available) != (counted, free):
+            problems.append(f"book {book_id}: counters say {available}/{copies} free, copies say {free}/{counted}")
+    lent = db.query_one("SELECT count(*) FROM copies WHERE lent = 1")[0]
+    if lent != loans:
+        problems.append(f"{lent} copies marked lent for {loans} active loans")
+    # Every copy set aside belongs to exactly one ready hold, and nobody
+    # queues for a book that has a copy on the shelf
+    held = db.query_one("SELECT count(*) FROM copies WHERE lent = 2")[0]
+    ready, matched = db.query_one(
+        "SELECT count(*), count(DISTINCT copies.id) FROM holds LEFT JOIN copies "
+        "ON copies.id = holds.copy_id AND copies.lent = 2 WHERE holds.status = 'ready'"
+    )
+    if not held == ready == matched:
+        problems.append(f"{held} copies set aside for {ready} ready holds ({matched} of them on their copy)")
+    stuck = db.query_one(
+        "SELECT count(*) FROM holds JOIN books ON books.id = holds.book_id "
+        "WHERE holds.status = 'waiting' AND books.available > 0"
+    )[0]
+    if stuck:
+        problems.append(f"{stuck} holds waiting for books with a copy on the shelf")
+    db.close()
+    return problems
+
+
+def run(clients, operations, seed=0, path=None):
+    directory = None
+    if path is None:
+        directory = tempfile.mkdtemp(prefix="library-stress-")
+        path = os.path.join(directory, "stress.db")
+    setup(path)
+
+    # spawn, so no client inherits another process's SQLite connections
+    context = multiprocessing.get_context("spawn")
+    start = time.perf_counter()
+    with context.Pool(clients) as pool:
+        results = pool.starmap(client, [(path, n, operations, seed) for n in range(clients)])
+    elapsed = time.perf_counter() - start
+
+    totals = {key: sum(result[key] for result in results) for key in results[0] if key != "elapsed"}
+    ops = (totals["borrowed"] + totals["unavailable"] + totals["returned"] + totals["already_returned"]
+           + totals["cancelled"])
+    client_time = max(result["elapsed"] for result in results)
+    problems = check(path, totals)
+    if directory is not None:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        os.rmdir(directory)
+    return totals, ops, client_time, elapsed, problems
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Run concurrent borrow/return clients against one database and check no loan is lost."
+    )
+    parser.add_argument("--clients", type=int, default=8, help="processes (default: %(default)s)")
+    parser.add_argument("--operations", type=int, default=500, help="operations per client (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", help="database file to create (default: a temporary one)")
+    args = parser.parse_args()
+
+    totals, ops, client_time, elapsed, problems = run(args.clients, args.operations, args.seed, args.db)
+    print(f"{args.clients} clients, {ops} operations in {client_time:.2f}s "
+          f"({ops / client_time:,.0f} ops/s; {elapsed:.2f}s including process start-up)")
+    print(", ".join(f"{key} {value}" for key, value in totals.items()))
+    for problem in problems:
+        print(f"INCONSISTENT: {problem}")
+    if not problems:
+        print("OK: no lost or duplicated loans")
+    sys.exit(1 if problems else 0)
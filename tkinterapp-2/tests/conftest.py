@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+# The app's modules live one directory up and import each other by name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import configure  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path):
+    """A fresh, migrated database that get_db() also returns."""
+    db = configure(str(tmp_path / "library.db"))
+    db.init_schema()
+    yield db
+    db.close()
@@ -0,0 +1,22 @@
+import os
+import sqlite3
+
+import pytest
+
+import library
+from backup import backup, snapshots
+
+
+def test_backup(db, tmp_path):
+    library.add_book(db, "Dune", "Frank Herbert")
+    result = backup(db.path, str(tmp_path / "backups"))
+    assert snapshots(db.path, str(tmp_path / "backups")) == [result.path]
+
+
+def test_failed_backup_leaves_no_partial_file(tmp_path):
+    broken = tmp_path / "broken.db"
+    broken.write_bytes(b"not a database" * 1000)
+    directory = tmp_path / "backups"
+    with pytest.raises(sqlite3.DatabaseError):
+        backup(str(broken), str(directory))
+    assert os.listdir(directory) == []
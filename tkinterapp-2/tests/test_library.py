@@ -0,0 +1,75 @@
+import pytest
+
+import library
+from library import ValidationError
+
+
+def test_borrow_for_missing_member_is_rejected(db):
+    book_id = library.add_book(db, "Dune", "Frank Herbert")
+    with pytest.raises(ValidationError, match="No such member"):
+        library.borrow_book(db, book_id, 999, 7)
+    with pytest.raises(ValidationError, match="No such member"):
+        library.borrow_barcode(db, f"{book_id}-1", 999, 7)
+    # No loan was recorded and the copy is still on the shelf
+    assert db.query_one("SELECT count(*) FROM borrows")[0] == 0
+    assert db.get_book(book_id)[3] == 1
+
+
+def test_borrow_for_existing_member(db):
+    book_id = library.add_book(db, "Dune", "Frank Herbert")
+    member_id = library.add_member(db, "Ann", "ann@example.com")
+    library.borrow_book(db, book_id, member_id, 7)
+    assert db.get_book(book_id)[3] == 0
+
+
+def test_hold_for_missing_member_is_rejected(db):
+    book_id = library.add_book(db, "Dune", "Frank Herbert")
+    member_id = library.add_member(db, "Ann", "ann@example.com")
+    library.borrow_book(db, book_id, member_id, 7)
+    with pytest.raises(ValidationError, match="No such member"):
+        library.place_hold(db, book_id, 555)
+    assert db.query_one("SELECT count(*) FROM holds")[0] == 0
+    # So the returned copy goes back on the shelf, not aside for nobody
+    library.return_copy(db, book_id)
+    assert db.get_book(book_id)[3] == 1
+
+
+def test_hold_queues_an_existing_member(db):
+    book_id = library.add_book(db, "Dune", "Frank Herbert")
+    first = library.add_member(db, "Ann", "ann@example.com")
+    second = library.add_member(db, "Bob", "bob@example.com")
+    library.borrow_book(db, book_id, first, 7)
+    assert library.place_hold(db, book_id, second) == 1
+    with pytest.raises(ValidationError, match="already on hold"):
+        library.place_hold(db, book_id, second)
+
+
+def test_only_a_missing_copy_is_not_available(db):
+    book_id = library.add_book(db, "Dune", "Frank Herbert")
+    member_id = library.add_member(db, "Ann", "ann@example.com")
+    library.borrow_book(db, book_id, member_id, 7)
+    with pytest.raises(library.NotAvailableError):
+        library.borrow_book(db, book_id, member_id, 7)
+    with pytest.raises(library.NotAvailableError):
+        library.borrow_barcode(db, f"{book_id}-1", member_id, 7)
+    # A bad entry on a title that is out is still just a bad entry
+    with pytest.raises(ValidationError) as error:
+        library.borrow_book(db, book_id, member_id, "soon")
+    assert not isinstance(error.value, library.NotAvailableError)
+
+
+@pytest.mark.parametrize("barcode", ["7-1", " 12-3 ", "0-0"])
+def test_generated_barcodes_are_reserved(db, barcode):
+    with pytest.raises(ValidationError, match="reserved"):
+        library.add_book(db, "Dune", "Frank Herbert", barcodes=[barcode])
+    assert db.query_one("SELECT count(*) FROM books")[0] == 0
+
+
+def test_hand_entered_barcode_cannot_collide_with_a_generated_one(db):
+    book_id = library.add_book(db, "Dune", "Frank Herbert", barcodes=["LIB-0001"])
+    # The next book would be labelled "<id>-1"; taking it by hand is refused
+    with pytest.raises(ValidationError, match="reserved"):
+        library.add_copies(db, book_id, barcodes=[f"{book_id + 1}-1"])
+    next_id = library.add_book(db, "Emma", "Jane Austen", copies=2)
+    assert [barcode for _, barcode, _ in db.book_copies(next_id)] == [f"{next_id}-1", f"{next_id}-2"]
+    assert db.find_copy("LIB-0001")[1] == book_id
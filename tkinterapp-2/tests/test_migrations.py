@@ -0,0 +1,11 @@
+import pytest
+
+from benchmark import generate
+from migrations import full_scans
+
+
+@pytest.mark.parametrize("loans", [1_000, 9_000])
+def test_hot_queries_use_indexes(db, loans):
+    # benchmark.py's 10k catalogue, with most books on the shelf or most lent out
+    generate(db, 10_000, 1_000, loans)
+    assert full_scans(db) == {}
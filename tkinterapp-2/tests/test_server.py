@@ -0,0 +1,70 @@
+import http.client
+import json
+import threading
+
+import pytest
+
+import library
+from server import LibraryServer
+
+
+@pytest.fixture
+def server(db):
+    server = LibraryServer(("127.0.0.1", 0), threads=2)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def request(server, method, path, body=None):
+    conn = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=5)
+    try:
+        conn.request(method, path, None if body is None else json.dumps(body),
+                     {"Content-Type": "application/json"})
+        response = conn.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def book_and_member(db):
+    return library.add_book(db, "Dune", "Frank Herbert"), library.add_member(db, "Ann", "ann@example.com")
+
+
+def test_borrow(server, book_and_member):
+    book_id, member_id = book_and_member
+    status, _ = request(server, "POST", "/loans", {"book_id": book_id, "member_id": member_id, "days": 14})
+    assert status == 201
+
+
+@pytest.mark.parametrize("days", [99999999999, 10 ** 30, library.MAX_LOAN_DAYS + 1, 0, "soon"])
+def test_borrow_rejects_bad_days(server, book_and_member, days):
+    book_id, member_id = book_and_member
+    status, result = request(server, "POST", "/loans", {"book_id": book_id, "member_id": member_id, "days": days})
+    assert status == 400
+    assert "days" in result["error"]
+
+
+@pytest.mark.parametrize("field", ["book_id", "member_id"])
+def test_borrow_rejects_ids_too_big_to_store(server, book_and_member, field):
+    body = dict(zip(("book_id", "member_id"), book_and_member), days=14)
+    body[field] = 10 ** 19
+    status, result = request(server, "POST", "/loans", body)
+    assert status == 400
+    assert "Invalid" in result["error"]
+
+
+def test_borrow_rejects_missing_member(server, book_and_member):
+    status, result = request(server, "POST", "/loans", {"book_id": book_and_member[0], "member_id": 4242, "days": 7})
+    assert status == 400
+    assert result["error"] == "No such member."
+
+
+def test_big_ids_elsewhere_are_client_errors(server):
+    assert request(server, "POST", "/returns", {"borrow_id": 10 ** 20})[0] == 400
+    assert request(server, "POST", "/holds", {"book_id": 10 ** 20, "member_id": 1})[0] == 400
+    assert request(server, "GET", f"/books/{10 ** 20}")[0] == 404
+    assert request(server, "POST", f"/holds/{10 ** 20}/cancel", {})[0] == 404
@@ -1,7 +1,16 @@
+# Imported first, so the start-up trace covers everything after it
+from instrument import dump_on_exit, mark, metrics, start_profiling, timer
 import tkinter as tk
 from tkinter import messagebox, ttk, font
-from datetime import datetime, timedelta
 import sqlite3
+
+from database import DB_PATH, configure, get_db, init_db
+import library
+from widgets import LiveSearch, MemberPicker, PagedTreeview, split_sort_mark
+from worker import BusyIndicator, DBExecutor
+
+# Backup, export, import and the file dialogs are only imported when first used
+mark("imports")
  
 # Custom Style and Color Scheme
 class AppStyles:
@@ -13,50 +22,9 @@ class AppStyles:
     BUTTON_COLOR = "#3498DB"
     BUTTON_TEXT_COLOR = "white"
  
-# Initialize the SQLite database
-def init_db():
-    try:
-        conn = sqlite3.connect("library.db")
-        cursor = conn.cursor()
- 
-        # Create Books Table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS books (
-                id INTEGER PRIMARY KEY,
-                title TEXT NOT NULL,
-                author TEXT NOT NULL,
-                available INTEGER DEFAULT 1
-            )
-        """)
- 
-        # Create Members Table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS members (
-                id INTEGER PRIMARY KEY,
-                name TEXT NOT NULL,
-                email TEXT UNIQUE NOT NULL
-            )
-        """)
- 
-        # Create Borrow Records Table with borrow_date and return_date
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS borrows (
-                id INTEGER PRIMARY KEY,
-                book_id INTEGER,
-                member_id INTEGER,
-                borrow_date TEXT,
-                return_date TEXT,
-                FOREIGN KEY(book_id) REFERENCES books(id),
-                FOREIGN KEY(member_id) REFERENCES members(id)
-            )
-        """)
-        
-        conn.commit()
-        conn.close()
-        print("Database initialized successfully")
-    except sqlite3.Error as e:
-        print(f"Error initializing database: {e}")
- 
+# While the app is open, snapshot library.db into backups/ this often (ms)
+BACKUP_INTERVAL = 60 * 60 * 1000
+
 # Language translations
 LANGUAGE = "EN"
 translations = {
@@ -66,7 +34,23 @@ translations = {
            "email": "Email", "title": "Title", "author": "Author", "search_by_title":"Search by Title","select_member":"Select Member",
            "book_added": "Book added successfully!", "member_added": "Member added!", "search":"Search","return_button":"Return","add_new_book":"Add New Book",
            "days_prompt": "How many days would you like to borrow the book?", "settings":"Settings", "submit_btn":"Submit", "add_new_member":"Add new Member",
-           "enter_borrowing_period_(days):":"Enter Borrowing Period (days):", "available":"Available", "return_date":"Return Date", "borrowed_by":"Borrowed By"},
+           "enter_borrowing_period_(days):":"Enter Borrowing Period (days):", "available":"Available", "return_date":"Return Date", "borrowed_by":"Borrowed By",
+           "total":"Total", "import_data":"Import Data", "books":"Books", "members":"Members", "choose_file":"Choose File",
+           "rows":"rows", "overdue":"Overdue", "due_within_days":"Include loans due within (days):",
+           "days_overdue":"Days Overdue", "show":"Show", "statistics":"Statistics", "loans":"Loans",
+           "returns":"Returns", "active_loans":"Active Loans", "most_borrowed":"Most Borrowed",
+           "busiest_members":"Busiest Members", "daily_loans":"Daily Loans", "date":"Date",
+           "export_data":"Export Data", "export_btn":"Export", "compress":"Compress (gzip)",
+           "changed_only":"Only changes since the last export", "performance":"Performance",
+           "refresh":"Refresh", "reset":"Reset", "save_json":"Save JSON", "timings":"Timings",
+           "counters":"Counters", "sql":"SQL", "startup":"Start-up", "fuzzy":"Fuzzy",
+           "author_starts":"Author begins with:", "all_books":"All", "on_shelf":"On shelf", "lent_out":"Lent out",
+           "borrower_starts":"Borrower or email begins with:", "due_between":"Due between (YYYY-MM-DD):", "and":"and",
+           "copies":"Copies", "barcodes":"Barcodes (optional, comma separated)", "holds":"Holds",
+           "member":"Member", "status":"Status", "placed_on":"Placed On", "queue_position":"In Queue",
+           "barcode":"Barcode", "cancel_hold":"Cancel Hold", "expire_holds":"Release Uncollected",
+           "hold_prompt":"No copy is on the shelf. Put the member on hold for this book?",
+           "hold_placed":"On hold; number {} in the queue.", "holds_expired":"{} uncollected holds released."},
            
     
     "TR": {"add_book": "Kitap Ekle", "add_member": "Üye Ekle", "borrow": "Kitap Ödünç Al", "add_member":"Üye Ekle", "add_book":"Kitap Ekle","borrow_book":"Kitap Ödünç Al",
@@ -75,16 +59,40 @@ translations = {
            "email": "E-posta", "title": "Başlık", "author": "Yazar", "borrow_btn":"Ödünç Al","select_member":"Üye Seç","library_management_system":"Kütüphane Yönetici Sistemi",
            "book_added": "Kitap başarıyla eklendi!", "member_added": "Üye başarıyla eklendi!","search":"Ara" ,"return_button":"İade et",
            "days_prompt": "Kitabı kaç gün almak istersiniz?", "settings": "Ayarlar", "submit_btn":"Yükle", "add_new_member":"Yeni üye ekle",
-            "enter_borrowing_period_(days):":"Ödünç Alınacak Gün Sayısı", "available":"Müsaitlik", "return_date":"İade Edilecek Tarih", "borrowed_by":"Ödünç Alan"},
+            "enter_borrowing_period_(days):":"Ödünç Alınacak Gün Sayısı", "available":"Müsaitlik", "return_date":"İade Edilecek Tarih", "borrowed_by":"Ödünç Alan",
+            "total":"Toplam", "import_data":"Veri İçe Aktar", "books":"Kitaplar", "members":"Üyeler", "choose_file":"Dosya Seç",
+            "rows":"satır", "overdue":"Gecikenler", "due_within_days":"Şu kadar gün içinde iade edilecekler:",
+            "days_overdue":"Geciken Gün", "show":"Göster", "statistics":"İstatistikler", "loans":"Ödünçler",
+            "returns":"İadeler", "active_loans":"Aktif Ödünçler", "most_borrowed":"En Çok Ödünç Alınanlar",
+            "busiest_members":"En Aktif Üyeler", "daily_loans":"Günlük Ödünçler", "date":"Tarih",
+            "export_data":"Veri Dışa Aktar", "export_btn":"Dışa Aktar", "compress":"Sıkıştır (gzip)",
+            "changed_only":"Yalnızca son dışa aktarımdan beri değişenler", "performance":"Performans",
+            "refresh":"Yenile", "reset":"Sıfırla", "save_json":"JSON Kaydet", "timings":"Süreler",
+            "counters":"Sayaçlar", "sql":"SQL", "startup":"Açılış", "fuzzy":"Benzerlerini bul",
+            "author_starts":"Yazar adının başı:", "all_books":"Tümü", "on_shelf":"Rafta", "lent_out":"Ödünçte",
+            "borrower_starts":"Ödünç alanın adı veya e-postasının başı:", "due_between":"İade tarihi (YYYY-AA-GG):", "and":"ile",
+            "copies":"Kopya Sayısı", "barcodes":"Barkodlar (isteğe bağlı, virgülle ayrılmış)", "holds":"Ayırtmalar",
+            "member":"Üye", "status":"Durum", "placed_on":"Ayırtma Tarihi", "queue_position":"Sıra",
+            "barcode":"Barkod", "cancel_hold":"Ayırtmayı İptal Et", "expire_holds":"Alınmayanları Bırak",
+            "hold_prompt":"Rafta kopya yok. Üye bu kitap için sıraya alınsın mı?",
+            "hold_placed":"Ayırtıldı; sırada {}. kişi.", "holds_expired":"Alınmayan {} ayırtma bırakıldı."},
 }
  
 def tr(key):
     return translations[LANGUAGE].get(key, key)
+
+def total_text(count):
+    return f"{tr('total')}: {count}"
+
+def performance_report():
+    """In-process timings and counters plus the per-statement SQL stats, as one dict."""
+    return dict(metrics.snapshot(), sql=get_db().stats.snapshot())
  
 # Main Application Class
 class BookLendingApp(tk.Tk):
-    def __init__(self):
+    def __init__(self, startup_trace=None):
         super().__init__()
+        self.startup_trace = startup_trace
         
         # Configure root window
         self.title("Python GUI Project")
@@ -111,14 +119,74 @@ class BookLendingApp(tk.Tk):
         # Create custom frame
         self.main_frame = tk.Frame(self, bg=AppStyles.BACKGROUND_COLOR)
         self.main_frame.pack(expand=True, fill=tk.BOTH, padx=20, pady=20)
+
+        # Database work runs on background threads; results come back via after()
+        self.db_executor = DBExecutor(self, on_error=self.show_db_error)
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # Form windows, built on first use and kept (hidden) after closing
+        self.windows = {}
+
+        # Writes announce the rows they changed; open lists update just those rows
+        self._changes = get_db().changes.subscribe(
+            lambda changes: self.db_executor.call_soon(self.on_changes, changes)
+        )
+
+        self.after(BACKUP_INTERVAL, self.scheduled_backup)
+        mark("styles")
         
         self.show_main_menu()
+        mark("menu")
+        self.bind("<Map>", self.on_first_map)
+
+    def on_first_map(self, event):
+        # Every widget carries the root's bind tag; only the root window counts
+        if event.widget is not self:
+            return
+        self.unbind("<Map>")
+        # Draw what is pending, so the mark is when the menu is actually on screen
+        self.update_idletasks()
+        mark("first_frame")
+        if self.startup_trace:
+            import json
+
+            print(json.dumps(metrics.snapshot()["startup"]), flush=True)
+            if self.startup_trace == "exit":
+                self.after_idle(self.on_close)
+
+    def show_db_error(self, error):
+        if isinstance(error, sqlite3.Error):
+            messagebox.showerror("Error", f"Database error: {error}")
+        else:
+            messagebox.showerror("Error", str(error))
+
+    def scheduled_backup(self):
+        from backup import backup
+
+        # Copied a few pages at a time on a reader thread, so the app stays usable
+        self.db_executor.read(backup, get_db().path,
+                              on_error=lambda error: print(f"Backup failed: {error}"))
+        self.after(BACKUP_INTERVAL, self.scheduled_backup)
+
+    def on_changes(self, changes):
+        """Pass committed changes to every list in the form windows, hidden ones included."""
+        widgets = list(self.windows.values())
+        while widgets:
+            widget = widgets.pop()
+            if isinstance(widget, PagedTreeview):
+                widget.apply_changes(changes)
+            else:
+                widgets.extend(widget.winfo_children())
+
+    def on_close(self):
+        get_db().changes.unsubscribe(self._changes)
+        self.db_executor.shutdown()
+        # Only when LIBRARY_METRICS names a file to write them to
+        dump_on_exit(sql=lambda: get_db().stats.snapshot())
+        self.destroy()
  
     def show_main_menu(self):
-        # Clear previous widgets
-        for widget in self.main_frame.winfo_children():
-            widget.destroy()
- 
+        # Built once; a language switch retranslates it in place
         # Title Label with custom styling
         title_label = tk.Label(
             self.main_frame,
@@ -136,6 +204,11 @@ class BookLendingApp(tk.Tk):
             (tr("borrow"), self.borrow_book_window),
             (tr("return"), self.return_book_window),
             (tr("view_books"), self.view_books_window),
+            (tr("overdue"), self.overdue_window),
+            (tr("holds"), self.holds_window),
+            (tr("import_data"), self.import_window),
+            (tr("export_data"), self.export_window),
+            (tr("statistics"), self.statistics_window),
             (tr("settings"), self.settings_window),
         ]
  
@@ -171,21 +244,98 @@ class BookLendingApp(tk.Tk):
     def view_books_window(self):
         self._new_window(tr("view_books"), self.view_books)
  
+    def overdue_window(self):
+        self._new_window(tr("overdue"), self.overdue_form)
+
+    def holds_window(self):
+        self._new_window(tr("holds"), self.holds_form)
+
+    def import_window(self):
+        self._new_window(tr("import_data"), self.import_form)
+
+    def export_window(self):
+        self._new_window(tr("export_data"), self.export_form)
+
+    def statistics_window(self):
+        self._new_window(tr("statistics"), self.statistics_form)
+
     def settings_window(self):
         self._new_window(tr("settings"), self.settings_form)
+
+    def performance_window(self):
+        self._new_window(tr("performance"), self.performance_form)
  
     def _new_window(self, title, form_func):
+        window = self.windows.get(form_func.__name__)
+        if window is not None and window.winfo_exists():
+            metrics.count(f"window.show.{form_func.__name__}")
+            window.deiconify()
+            window.lift()
+            window.focus_set()
+            # Lists keep themselves current through the change bus; anything
+            # else is reloaded only if something was written since it last loaded
+            if window.refresh is not None and window.generation != get_db().generation:
+                window.generation = get_db().generation
+                window.refresh()
+            return
+
+        with timer(f"window.build.{form_func.__name__}"):
+            self._build_window(title, form_func)
+
+    def _build_window(self, title, form_func):
         window = tk.Toplevel(self)
         window.title(title)
         window.geometry("600x500")
         window.configure(bg=AppStyles.BACKGROUND_COLOR)
+
+        # Animated while this window waits on the database
+        window.busy = BusyIndicator(window)
+        window.busy.pack(side=tk.BOTTOM, fill=tk.X)
         
         # Create a frame inside the window
         frame = tk.Frame(window, bg=AppStyles.BACKGROUND_COLOR)
         frame.pack(expand=True, fill=tk.BOTH, padx=20, pady=20)
         
-        # Override the window
-        form_func(frame)
+        # Closing only hides the window, so opening it again is instant
+        window.protocol("WM_DELETE_WINDOW", window.withdraw)
+        window.generation = get_db().generation
+        # Forms that show data return a function that reloads it
+        window.refresh = form_func(frame)
+        self.windows[form_func.__name__] = window
+
+    def retranslate(self, old_language):
+        """Swap every translated text in the main menu and form windows for the current language."""
+        keys = {text: key for key, text in translations[old_language].items()}
+        widgets = [self]
+        while widgets:
+            widget = widgets.pop()
+            widgets.extend(widget.winfo_children())
+            if isinstance(widget, (tk.Tk, tk.Toplevel)):
+                key = keys.get(widget.title())
+                if key is not None:
+                    widget.title(tr(key))
+            elif isinstance(widget, ttk.Notebook):
+                for tab in widget.tabs():
+                    key = keys.get(str(widget.tab(tab, "text")))
+                    if key is not None:
+                        widget.tab(tab, text=tr(key))
+            elif isinstance(widget, ttk.Treeview):
+                for column in widget["columns"]:
+                    # Keep the sort mark of a sorted column
+                    text, mark = split_sort_mark(str(widget.heading(column, "text")))
+                    key = keys.get(text)
+                    if key is not None:
+                        widget.heading(column, text=tr(key) + mark)
+            else:
+                try:
+                    key = keys.get(str(widget.cget("text")))
+                except tk.TclError:
+                    # Entries, scrollbars etc. have no text
+                    key = None
+                if key is not None:
+                    widget.config(text=tr(key))
+            if hasattr(widget, "retranslate"):
+                widget.retranslate()
  
     def settings_form(self, frame):
             # Title Label
@@ -204,9 +354,9 @@ class BookLendingApp(tk.Tk):
  
             def switch_language(lang):
                 global LANGUAGE
-                LANGUAGE = lang
+                old_language, LANGUAGE = LANGUAGE, lang
                 messagebox.showinfo("Success", "Language switched!")
-                self.show_main_menu()
+                self.retranslate(old_language)
  
             # Language Buttons
             langs = [
@@ -223,7 +373,84 @@ class BookLendingApp(tk.Tk):
                     width=20
                 )
                 btn.pack(pady=10)
- 
+
+            # Hidden way into the performance panel: double-click the title or press F12
+            title_label.bind("<Double-Button-1>", lambda e: self.performance_window())
+            frame.winfo_toplevel().bind("<F12>", lambda e: self.performance_window())
+
+    def performance_form(self, frame):
+        title_label = tk.Label(
+            frame,
+            text=tr("performance"),
+            font=self.title_font,
+            fg=AppStyles.PRIMARY_COLOR,
+            bg=AppStyles.BACKGROUND_COLOR
+        )
+        title_label.pack(pady=(0, 20))
+
+        notebook = ttk.Notebook(frame)
+        notebook.pack(fill=tk.BOTH, expand=True)
+        tables = {}
+        tabs = [
+            ("timings", ("Name", "Count", "Avg", "P50", "P95", "P99", "Max")),
+            ("sql", ("Statement", "Count", "Avg", "P95", "Max", "Total")),
+            ("counters", ("Name", "Count")),
+            ("startup", ("Phase", "Ms")),
+        ]
+        for name, columns in tabs:
+            tree = ttk.Treeview(notebook, columns=columns, show="headings")
+            for column in columns:
+                tree.heading(column, text=column)
+                tree.column(column, width=70, anchor=tk.E, stretch=False)
+            tree.column(columns[0], width=260, anchor=tk.W, stretch=True)
+            notebook.add(tree, text=tr(name))
+            tables[name] = tree
+
+        def ms(seconds):
+            return f"{seconds * 1000:.2f}"
+
+        def refresh():
+            report = performance_report()
+            rows = {
+                "timings": [(name, t["count"], ms(t["avg"]), ms(t["p50"]), ms(t["p95"]), ms(t["p99"]), ms(t["max"]))
+                            for name, t in sorted(report["timings"].items(), key=lambda item: -item[1]["total"])],
+                # The statements the app spends most time in, first
+                "sql": [(sql, t["count"], ms(t["avg"]), ms(t["p95"]), ms(t["max"]), ms(t["total"]))
+                        for sql, t in sorted(report["sql"].items(), key=lambda item: -item[1]["total"])[:100]],
+                "counters": sorted(report["counters"].items()),
+                # Milliseconds from launch until each phase finished
+                "startup": [(name, ms(seconds)) for name, seconds in report["startup"].items()],
+            }
+            for name, tree in tables.items():
+                tree.delete(*tree.get_children())
+                for row in rows[name]:
+                    tree.insert("", tk.END, values=row)
+
+        def reset():
+            metrics.reset()
+            get_db().stats.reset()
+            refresh()
+
+        def save():
+            from tkinter import filedialog
+
+            path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON", "*.json")])
+            if not path:
+                return
+            try:
+                metrics.dump(path, sql=get_db().stats.snapshot())
+            except OSError as e:
+                messagebox.showerror("Error", str(e))
+
+        button_frame = tk.Frame(frame, bg=AppStyles.BACKGROUND_COLOR)
+        button_frame.pack(pady=(10, 0))
+        for col, (key, command) in enumerate((("refresh", refresh), ("reset", reset), ("save_json", save))):
+            ttk.Button(button_frame, text=tr(key), command=command,
+                       style='Custom.TButton').grid(row=0, column=col, padx=5)
+
+        refresh()
+        return refresh
+
     def add_book_form(self, frame):
         # Title Label
         title_label = tk.Label(
@@ -248,30 +475,30 @@ class BookLendingApp(tk.Tk):
         tk.Label(form_frame, text=tr("author"), bg=AppStyles.BACKGROUND_COLOR, fg=AppStyles.TEXT_COLOR).grid(row=1, column=0, sticky='e', padx=5, pady=5)
         author_entry = tk.Entry(form_frame, width=30, font=('Helvetica', 12))
         author_entry.grid(row=1, column=1, padx=5, pady=5)
+
+        # Copies Entry; adding a title that is already in the catalogue adds copies to it
+        tk.Label(form_frame, text=tr("copies"), bg=AppStyles.BACKGROUND_COLOR, fg=AppStyles.TEXT_COLOR).grid(row=2, column=0, sticky='e', padx=5, pady=5)
+        copies_entry = tk.Entry(form_frame, width=30, font=('Helvetica', 12))
+        copies_entry.insert(0, "1")
+        copies_entry.grid(row=2, column=1, padx=5, pady=5)
+
+        # Barcode labels of the new copies; the rest get generated ones
+        tk.Label(form_frame, text=tr("barcodes"), bg=AppStyles.BACKGROUND_COLOR, fg=AppStyles.TEXT_COLOR).grid(row=3, column=0, sticky='e', padx=5, pady=5)
+        barcodes_entry = tk.Entry(form_frame, width=30, font=('Helvetica', 12))
+        barcodes_entry.grid(row=3, column=1, padx=5, pady=5)
  
         def submit():
-            title = title_entry.get().strip()
-            author = author_entry.get().strip()
-            if not title or title.isspace():
-                messagebox.showerror("Error", "Title cannot be empty or contain only spaces.")
-                return
-            
-            if not author or author.isspace():
-                messagebox.showerror("Error", "Author cannot be empty or contain only spaces.")
-                return
- 
-            try:
-                conn = sqlite3.connect("library.db")
-                cursor = conn.cursor()
-                cursor.execute("INSERT INTO books (title, author) VALUES (?, ?)", (title, author))
-                conn.commit()
-                conn.close()
+            def added(_):
                 messagebox.showinfo("Success", tr("book_added"))
                 # Clear entries
                 title_entry.delete(0, tk.END)
                 author_entry.delete(0, tk.END)
-            except sqlite3.Error as e:
-                messagebox.showerror("Error", f"Database error: {e}")
+                barcodes_entry.delete(0, tk.END)
+
+            # Validation errors are shown by show_db_error
+            self.db_executor.write(library.add_book, get_db(), title_entry.get(), author_entry.get(),
+                                   copies_entry.get(), barcodes_entry.get().split(","),
+                                   on_done=added, busy=frame.winfo_toplevel().busy)
  
         # Submit Button
         submit_btn = ttk.Button(
@@ -280,7 +507,7 @@ class BookLendingApp(tk.Tk):
             command=submit,
             style='Custom.TButton'
         )
-        submit_btn.grid(row=2, column=0, columnspan=2, pady=20)
+        submit_btn.grid(row=4, column=0, columnspan=2, pady=20)
  
     def add_member_form(self, frame):
         title_label = tk.Label(
@@ -306,34 +533,14 @@ class BookLendingApp(tk.Tk):
         email_entry.grid(row=1, column=1, padx=5, pady=5)
  
         def submit():
-            name = name_entry.get().strip()
-            email = email_entry.get().strip()
- 
-            if not name or not email:
-                messagebox.showerror("Error", "All fields are required.")
-                return
-            if '@' not in email:
-                messagebox.showerror("Error", "Please enter a valid email address.")
-                return    
-            if not name or name.isspace():
-                messagebox.showerror("Error", "Title cannot be empty or contain only spaces.")
-                return
-            if not email or email.isspace():
-                messagebox.showerror("Error", "Author cannot be empty or contain only spaces.")
-                return
- 
-            try:
-                conn = sqlite3.connect("library.db")
-                cursor = conn.cursor()
-                cursor.execute("INSERT INTO members (name, email) VALUES (?, ?)", (name, email))
-                conn.commit()
-                conn.close()
+            def added(_):
                 messagebox.showinfo("Success", tr("member_added"))
                 # Clear entries
                 name_entry.delete(0, tk.END)
                 email_entry.delete(0, tk.END)
-            except sqlite3.Error as e:
-                messagebox.showerror("Error", f"Database error: {e}")
+
+            self.db_executor.write(library.add_member, get_db(), name_entry.get(), email_entry.get(),
+                                   on_done=added, busy=frame.winfo_toplevel().busy)
  
         # Submit Button
         submit_btn = ttk.Button(
@@ -344,6 +551,23 @@ class BookLendingApp(tk.Tk):
         )
         submit_btn.grid(row=2, column=0, columnspan=2, pady=20)
  
+    def book_filters(self, frame, on_change, availability=""):
+        """Author and availability filters for a book list; returns (author entry, availability var)."""
+        filter_frame = tk.Frame(frame, bg=AppStyles.BACKGROUND_COLOR)
+        filter_frame.pack(fill=tk.X, padx=10, pady=(0, 10))
+
+        tk.Label(filter_frame, text=tr("author_starts"), bg=AppStyles.BACKGROUND_COLOR,
+                 fg=AppStyles.TEXT_COLOR).pack(side=tk.LEFT, padx=(0, 5))
+        author_entry = tk.Entry(filter_frame, width=20)
+        author_entry.pack(side=tk.LEFT, padx=(0, 10))
+        LiveSearch(author_entry, lambda text: on_change())
+
+        availability_var = tk.StringVar(value=availability)
+        for key, value in (("all_books", ""), ("on_shelf", "available"), ("lent_out", "unavailable")):
+            tk.Radiobutton(filter_frame, text=tr(key), variable=availability_var, value=value,
+                           command=on_change, bg=AppStyles.BACKGROUND_COLOR).pack(side=tk.LEFT)
+        return author_entry, availability_var
+
     def borrow_book_form(self, frame):
         # Title Label
         title_label = tk.Label(
@@ -371,37 +595,39 @@ class BookLendingApp(tk.Tk):
         search_entry = tk.Entry(search_frame, font=('Helvetica', 12), width=30)
         search_entry.pack(side=tk.LEFT, padx=(0, 5))
 
+        # Every title by default: one with no copy on the shelf may have a
+        # copy set aside for this member's hold, or can be put on hold
+        author_entry, availability_var = self.book_filters(
+            frame, lambda: search_books(search_entry.get().strip()))
+
         # Treeview to display books
-        tree = ttk.Treeview(frame, columns=("ID", "Title", "Author", "Available"), show="headings")
+        table = PagedTreeview(frame, columns=("ID", "Title", "Author", "Available"),
+                              count_text=total_text, executor=self.db_executor,
+                              busy=frame.winfo_toplevel().busy, bg=AppStyles.BACKGROUND_COLOR)
+        tree = table.tree
         tree.heading("ID", text="ID")
         tree.heading("Title", text=tr("title"))
         tree.heading("Author", text=tr("author"))
         tree.heading("Available", text=tr("available"))
-        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=(10, 0))
+        table.pack(fill=tk.BOTH, expand=True, padx=10, pady=(10, 0))
         
-        def search_books(search_query):
-            # Clear the current tree view content
-            for row in tree.get_children():
-                tree.delete(row)
+        # Exact (word prefix) search, or closest titles first despite typos
+        fuzzy_var = tk.BooleanVar(value=False)
 
+        def search_books(search_query):
             try:
-                conn = sqlite3.connect("library.db")
-                cursor = conn.cursor()
-
-                if search_query:
-                    # Search books
-                    cursor.execute("SELECT id, title, author, available FROM books WHERE title LIKE ?", (f"%{search_query}%",))
-                else:
-                    # Fetch all books if no search query is provided
-                    cursor.execute("SELECT id, title, author, available FROM books WHERE available > 0")
-
-                for row in cursor.fetchall():
-                    tree.insert("", tk.END, values=row)
-
-                conn.close()
+                # Search by title; sorting and filters run in SQL, a page at a time
+                table.set_query(library.search_books(get_db(), search_query, title_only=True,
+                                                     fuzzy=fuzzy_var.get(), sort=table.sort,
+                                                     descending=table.descending, author=author_entry.get(),
+                                                     availability=availability_var.get()))
             except sqlite3.Error as e:
                 messagebox.showerror("Error", f"Database error: {e}")
 
+        # Clicking a heading sorts by that column
+        table.enable_sorting({"ID": "id", "Title": "title", "Author": "author", "Available": "available"},
+                             lambda: search_books(search_entry.get().strip()))
+
         search_button = ttk.Button(
             search_frame,
             text=tr("search"),
@@ -410,6 +636,18 @@ class BookLendingApp(tk.Tk):
         )
         search_button.pack(side=tk.LEFT, padx=(5, 0))
 
+        fuzzy_check = tk.Checkbutton(
+            search_frame,
+            text=tr("fuzzy"),
+            variable=fuzzy_var,
+            command=lambda: search_books(search_entry.get().strip()),
+            bg=AppStyles.BACKGROUND_COLOR
+        )
+        fuzzy_check.pack(side=tk.LEFT, padx=(5, 0))
+
+        # Search as the user types
+        LiveSearch(search_entry, search_books)
+
         # Fetch and display all books initially
         search_books("")
 
@@ -419,26 +657,15 @@ class BookLendingApp(tk.Tk):
         
         # Use grid layout for horizontal alignment
         tk.Label(member_frame, text=tr("select_member"), bg=AppStyles.BACKGROUND_COLOR, fg=AppStyles.TEXT_COLOR).grid(row=0, column=0, padx=5)
-        member_var = tk.StringVar()
-        member_dropdown = ttk.Combobox(
+        # Suggests the top matches for the typed name or email prefix
+        member_dropdown = MemberPicker(
             member_frame,
-            textvariable=member_var,
+            get_db().find_members,
+            executor=self.db_executor,
+            busy=frame.winfo_toplevel().busy,
             width=30,
             font=('Helvetica', 10)
         )
-        
-        try:
-            conn = sqlite3.connect("library.db")
-            cursor = conn.cursor()
-            cursor.execute("SELECT id, name FROM members")
-            members = cursor.fetchall()
-            conn.close()
-        
-            member_dropdown['values'] = [f"{member[0]} - {member[1]}" for member in members]
-        except sqlite3.Error as e:
-            messagebox.showerror("Error", f"Database error: {e}")
-            return
-        
         member_dropdown.grid(row=0, column=1, padx=5)
         
         # Days Label and Entry
@@ -452,41 +679,30 @@ class BookLendingApp(tk.Tk):
                 messagebox.showerror("Error", "No book selected.")
                 return
         
-            if not member_var.get():
+            member_id = member_dropdown.member_id()
+            if member_id is None:
                 messagebox.showerror("Error", "No member selected.")
                 return
         
             book_id = tree.item(selected_item, "values")[0]
-            member_id = member_var.get().split(" - ")[0]  # Extract member ID
-        
-            try:
-                days = int(days_entry.get())
-                if days <= 0:
-                    messagebox.showerror("Error", "Please enter a valid number of days.")
-                    return
-    
-                return_date = datetime.now() + timedelta(days=days)
-                borrow_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                return_date_str = return_date.strftime("%Y-%m-%d %H:%M:%S")
-    
-                conn = sqlite3.connect("library.db")
-                cursor = conn.cursor()
-                cursor.execute("SELECT available FROM books WHERE id = ?", (book_id,))
-                available = cursor.fetchone()
-                if available and available[0] > 0:
-                    cursor.execute("UPDATE books SET available = available - 1 WHERE id = ?", (book_id,))
-                    cursor.execute("INSERT INTO borrows (book_id, member_id, borrow_date, return_date) VALUES (?, ?, ?, ?)",
-                                (book_id, member_id, borrow_date, return_date_str))
-                    conn.commit()
-                    conn.close()
-                    messagebox.showinfo("Success", f"Book borrowed successfully! Please return by {return_date_str}.")
-                    search_books("")  # Refresh book list
-                else:
-                    messagebox.showerror("Error", "Book is not available for borrowing.")
-                    conn.close()
-    
-            except ValueError:
-                messagebox.showerror("Error", "Please enter a valid number of days.")
+
+            def borrowed(return_date):
+                # The book's row (and any other open list) is updated through the change bus
+                messagebox.showinfo("Success", f"Book borrowed successfully! Please return by {return_date}.")
+
+            def not_borrowed(error):
+                # Every copy is out (or set aside for someone else's hold): offer a place in the queue
+                if not isinstance(error, library.NotAvailableError):
+                    self.show_db_error(error)
+                elif messagebox.askyesno(tr("holds"), tr("hold_prompt")):
+                    self.db_executor.write(
+                        library.place_hold, get_db(), book_id, member_id,
+                        on_done=lambda position: messagebox.showinfo("Success", tr("hold_placed").format(position)),
+                        busy=frame.winfo_toplevel().busy)
+
+            # A member whose hold is ready simply borrows the copy set aside for them
+            self.db_executor.write(library.borrow_book, get_db(), book_id, member_id, days_entry.get(),
+                                   on_done=borrowed, on_error=not_borrowed, busy=frame.winfo_toplevel().busy)
         
         # Borrow Button
         borrow_button = ttk.Button(
@@ -497,6 +713,13 @@ class BookLendingApp(tk.Tk):
         )
         borrow_button.grid(row=2, column=0, columnspan=2, pady=10)
 
+        def refresh():
+            # The book list keeps itself current; new members may now match
+            # what is typed in the picker
+            member_dropdown.lookup(member_dropdown.get().strip())
+
+        return refresh
+
     def view_books(self, frame):
             # Title Label
             title_label = tk.Label(
@@ -524,31 +747,18 @@ class BookLendingApp(tk.Tk):
             search_entry = tk.Entry(search_frame, font=('Helvetica', 12), width=30)
             search_entry.pack(side=tk.LEFT, padx=(0, 5))
  
+            # Exact (word prefix) search, or closest matches first despite typos
+            fuzzy_var = tk.BooleanVar(value=False)
+
             def search_books():
                 search_query = search_entry.get().strip()
-                # Clear current tree view content
-                for row in tree.get_children():
-                    tree.delete(row)
- 
                 try:
-                    conn = sqlite3.connect("library.db")
-                    cursor = conn.cursor()
- 
-                    if search_query:
-                        # Search books by title
-                        cursor.execute("""
-                SELECT id, title, author, available 
-                FROM books 
-                WHERE title LIKE ? OR author LIKE ?
-                """, (f"%{search_query}%", f"%{search_query}%"))
-                    else:
-                        # Fetch all books if no search query is provided
-                        cursor.execute("SELECT id, title, author, available FROM books")
-                    
-                    for row in cursor.fetchall():
-                        tree.insert("", tk.END, values=row)
- 
-                    conn.close()
+                    # Search books by title or author, or fetch all books if no query is provided;
+                    # sorting and filters run in SQL, a page at a time
+                    table.set_query(library.search_books(get_db(), search_query, fuzzy=fuzzy_var.get(),
+                                                         sort=table.sort, descending=table.descending,
+                                                         author=author_entry.get(),
+                                                         availability=availability_var.get()))
                 except sqlite3.Error as e:
                     messagebox.showerror("Error", f"Database error: {e}")
  
@@ -559,9 +769,26 @@ class BookLendingApp(tk.Tk):
                 style='Custom.TButton'
             )
             search_button.pack(side=tk.LEFT, padx=(5, 0))
+
+            fuzzy_check = tk.Checkbutton(
+                search_frame,
+                text=tr("fuzzy"),
+                variable=fuzzy_var,
+                command=search_books,
+                bg=AppStyles.BACKGROUND_COLOR
+            )
+            fuzzy_check.pack(side=tk.LEFT, padx=(5, 0))
+
+            # Search as the user types
+            LiveSearch(search_entry, lambda text: search_books())
+
+            author_entry, availability_var = self.book_filters(frame, search_books)
  
             # Treeview to display books
-            tree = ttk.Treeview(frame, columns=("ID", "Title", "Author", "Available"), show="headings")
+            table = PagedTreeview(frame, columns=("ID", "Title", "Author", "Available"),
+                                  count_text=total_text, executor=self.db_executor,
+                                  busy=frame.winfo_toplevel().busy, bg=AppStyles.BACKGROUND_COLOR)
+            tree = table.tree
             tree.heading("ID", text="ID")
             tree.heading("Title", text=tr("title"))
             tree.heading("Author", text=tr("author"))
@@ -572,7 +799,11 @@ class BookLendingApp(tk.Tk):
             tree.column("Author", width=150)  # Medium column for Author
             tree.column("Available", width=100)  # Medium column for Available status
             
-            tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=(10, 0))
+            table.pack(fill=tk.BOTH, expand=True, padx=10, pady=(10, 0))
+
+            # Clicking a heading sorts by that column
+            table.enable_sorting({"ID": "id", "Title": "title", "Author": "author", "Available": "available"},
+                                 search_books)
  
             # Populate the treeview with all books initially
             search_books()
@@ -601,49 +832,59 @@ class BookLendingApp(tk.Tk):
             command=lambda: fetch_borrowed_books(search_entry.get().strip())
         )
         search_button.pack(side=tk.LEFT, padx=(5, 0))
+
+        # Search as the user types
+        LiveSearch(search_entry, fetch_borrowed_books)
+
+        filter_frame = tk.Frame(window, bg=AppStyles.BACKGROUND_COLOR)
+        filter_frame.pack(fill=tk.X, padx=10, pady=(0, 10))
+        tk.Label(filter_frame, text=tr("borrower_starts"), bg=AppStyles.BACKGROUND_COLOR,
+                 fg=AppStyles.TEXT_COLOR).pack(side=tk.LEFT, padx=(0, 5))
+        borrower_entry = tk.Entry(filter_frame, width=20)
+        borrower_entry.pack(side=tk.LEFT, padx=(0, 10))
+        LiveSearch(borrower_entry, lambda text: fetch_borrowed_books(search_entry.get().strip()))
+
+        tk.Label(filter_frame, text=tr("due_between"), bg=AppStyles.BACKGROUND_COLOR,
+                 fg=AppStyles.TEXT_COLOR).pack(side=tk.LEFT, padx=(0, 5))
+        due_from_entry = tk.Entry(filter_frame, width=11)
+        due_from_entry.pack(side=tk.LEFT)
+        tk.Label(filter_frame, text=tr("and"), bg=AppStyles.BACKGROUND_COLOR,
+                 fg=AppStyles.TEXT_COLOR).pack(side=tk.LEFT, padx=5)
+        due_to_entry = tk.Entry(filter_frame, width=11)
+        due_to_entry.pack(side=tk.LEFT)
+        # Dates are only checked once typed in full, on Enter
+        for entry in (due_from_entry, due_to_entry):
+            entry.bind("<Return>", lambda event: fetch_borrowed_books(search_entry.get().strip()))
  
         # Treeview to display borrowed books
-        tree = ttk.Treeview(window, columns=("ID", "Title", "Author", "Borrowed By", "Email", "Return Date"), show="headings")
+        table = PagedTreeview(window, columns=("ID", "Title", "Author", "Borrowed By", "Email", "Return Date"),
+                              count_text=total_text, executor=self.db_executor,
+                              busy=window.winfo_toplevel().busy, bg=AppStyles.BACKGROUND_COLOR)
+        tree = table.tree
         tree.heading("ID", text="ID")
         tree.heading("Title", text=tr("title"))
         tree.heading("Author", text=tr("author"))
         tree.heading("Borrowed By", text=tr("borrowed_by"))
         tree.heading("Email", text="Email")
         tree.heading("Return Date", text=tr("return_date"))
-        tree.pack(fill=tk.BOTH, expand=True)
+        table.pack(fill=tk.BOTH, expand=True)
  
         def fetch_borrowed_books(search_query=""):
             """Fetch and display all borrowed books, optionally filtering by title."""
             try:
-                conn = sqlite3.connect("library.db")
-                cursor = conn.cursor()
- 
-                if search_query:
-                    # Search borrowed books by title
-                    cursor.execute("""
-                        SELECT borrows.book_id, books.title, books.author, members.name, members.email, borrows.return_date
-                        FROM borrows
-                        JOIN books ON borrows.book_id = books.id
-                        JOIN members ON borrows.member_id = members.id
-                        WHERE books.title LIKE ?
-                    """, (f"%{search_query}%",))
-                else:
-                    # Fetch all borrowed books
-                    cursor.execute("""
-                        SELECT borrows.book_id, books.title, books.author, members.name, members.email, borrows.return_date
-                        FROM borrows
-                        JOIN books ON borrows.book_id = books.id
-                        JOIN members ON borrows.member_id = members.id
-                    """)
- 
-                # Clear Treeview and populate with fresh data
-                tree.delete(*tree.get_children())
-                for row in cursor.fetchall():
-                    tree.insert("", tk.END, values=row)
- 
-                conn.close()
+                # Clear Treeview and page in fresh data, sorted and filtered in SQL
+                table.set_query(library.borrowed_books(get_db(), search_query, sort=table.sort,
+                                                       descending=table.descending, borrower=borrower_entry.get(),
+                                                       due_from=due_from_entry.get(), due_to=due_to_entry.get()))
+            except library.ValidationError as e:
+                messagebox.showerror("Error", str(e))
             except sqlite3.Error as e:
                 messagebox.showerror("Error", f"Database error: {e}")
+
+        # Clicking a heading sorts by that column
+        table.enable_sorting({"ID": "book", "Title": "title", "Author": "author", "Borrowed By": "borrower",
+                              "Email": "email", "Return Date": "return_date"},
+                             lambda: fetch_borrowed_books(search_entry.get().strip()))
  
         fetch_borrowed_books()  # Initial population of the Treeview
  
@@ -653,33 +894,356 @@ class BookLendingApp(tk.Tk):
                 messagebox.showerror("Error", "No book selected.")
                 return
  
-            book_id = tree.item(selected_item, "values")[0]
-            try:
-                conn = sqlite3.connect("library.db")
-                cursor = conn.cursor()
- 
-                # Delete borrow record for the book
-                cursor.execute("DELETE FROM borrows WHERE book_id = ?", (book_id,))
- 
-                # Increment the availability count for the book
-                cursor.execute("UPDATE books SET available = available + 1 WHERE id = ?", (book_id,))
-                conn.commit()
- 
+            # Rows are keyed by borrow id, so only this loan is closed
+            borrow_id = selected_item[0]
+
+            def returned(_):
+                # The loan's row leaves the list through the change bus
                 messagebox.showinfo("Success", "Book returned successfully!")
- 
-                # Refresh the borrowed books list
-                fetch_borrowed_books()
-                conn.close()
-            except sqlite3.Error as e:
-                messagebox.showerror("Error", f"Database error: {e}")
+
+            self.db_executor.write(library.return_book, get_db(), borrow_id,
+                                   on_done=returned, busy=window.winfo_toplevel().busy)
  
         return_button = tk.Button(window, text=tr("return_button"), command=return_selected_book)
         return_button.pack(pady=5)
+
+    def overdue_form(self, frame):
+        title_label = tk.Label(
+            frame,
+            text=tr("overdue"),
+            font=self.title_font,
+            fg=AppStyles.PRIMARY_COLOR,
+            bg=AppStyles.BACKGROUND_COLOR
+        )
+        title_label.pack(pady=(0, 20))
+
+        options_frame = tk.Frame(frame, bg=AppStyles.BACKGROUND_COLOR)
+        options_frame.pack(fill=tk.X, padx=10, pady=(0, 10))
+
+        tk.Label(options_frame, text=tr("due_within_days"), font=('Helvetica', 12),
+                 fg=AppStyles.TEXT_COLOR, bg=AppStyles.BACKGROUND_COLOR).pack(side=tk.LEFT, padx=(0, 5))
+        days_spinbox = tk.Spinbox(options_frame, from_=0, to=365, width=5, font=('Helvetica', 12))
+        days_spinbox.pack(side=tk.LEFT, padx=(0, 5))
+
+        table = PagedTreeview(frame, columns=("Borrowed By", "Email", "Title", "Return Date", "Days Overdue"),
+                              count_text=total_text, executor=self.db_executor,
+                              busy=frame.winfo_toplevel().busy, bg=AppStyles.BACKGROUND_COLOR)
+        tree = table.tree
+        tree.heading("Borrowed By", text=tr("borrowed_by"))
+        tree.heading("Email", text=tr("email"))
+        tree.heading("Title", text=tr("title"))
+        tree.heading("Return Date", text=tr("return_date"))
+        tree.heading("Days Overdue", text=tr("days_overdue"))
+        tree.column("Days Overdue", width=100)
+        table.pack(fill=tk.BOTH, expand=True, padx=10, pady=(10, 0))
+
+        def show_overdue():
+            try:
+                days = max(int(days_spinbox.get()), 0)
+            except ValueError:
+                days = 0
+            try:
+                # Loans due before now (plus the chosen days), most overdue first
+                table.set_query(library.overdue_loans(get_db(), days))
+            except sqlite3.Error as e:
+                messagebox.showerror("Error", f"Database error: {e}")
+
+        show_button = ttk.Button(
+            options_frame,
+            text=tr("show"),
+            command=show_overdue,
+            style='Custom.TButton'
+        )
+        show_button.pack(side=tk.LEFT, padx=(5, 0))
+
+        show_overdue()
+
+        # Re-run on re-open after loans changed; Show also picks up loans that have since fallen due
+        return show_overdue
+
+    def holds_form(self, frame):
+        title_label = tk.Label(
+            frame,
+            text=tr("holds"),
+            font=self.title_font,
+            fg=AppStyles.PRIMARY_COLOR,
+            bg=AppStyles.BACKGROUND_COLOR
+        )
+        title_label.pack(pady=(0, 20))
+
+        search_frame = tk.Frame(frame, bg=AppStyles.BACKGROUND_COLOR)
+        search_frame.pack(fill=tk.X, padx=10, pady=(0, 10))
+
+        tk.Label(search_frame, text=tr("search_by_title"), font=('Helvetica', 12),
+                 fg=AppStyles.TEXT_COLOR, bg=AppStyles.BACKGROUND_COLOR).pack(side=tk.LEFT, padx=(0, 5))
+        search_entry = tk.Entry(search_frame, font=('Helvetica', 12), width=30)
+        search_entry.pack(side=tk.LEFT, padx=(0, 5))
+
+        # One row per open hold, title by title in queue order; the copy set
+        # aside for a ready hold shows its barcode
+        table = PagedTreeview(frame, columns=("ID", "Title", "Member", "Email", "Status", "Placed On",
+                                              "In Queue", "Barcode"),
+                              count_text=total_text, executor=self.db_executor,
+                              busy=frame.winfo_toplevel().busy, bg=AppStyles.BACKGROUND_COLOR)
+        tree = table.tree
+        tree.heading("ID", text="ID")
+        tree.heading("Title", text=tr("title"))
+        tree.heading("Member", text=tr("member"))
+        tree.heading("Email", text=tr("email"))
+        tree.heading("Status", text=tr("status"))
+        tree.heading("Placed On", text=tr("placed_on"))
+        tree.heading("In Queue", text=tr("queue_position"))
+        tree.heading("Barcode", text=tr("barcode"))
+        for column in ("ID", "Status", "In Queue"):
+            tree.column(column, width=80)
+        table.pack(fill=tk.BOTH, expand=True, padx=10, pady=(10, 0))
+
+        def show_holds(search_query=""):
+            try:
+                table.set_query(library.holds(get_db(), search_query))
+            except sqlite3.Error as e:
+                messagebox.showerror("Error", f"Database error: {e}")
+
+        # Search as the user types
+        LiveSearch(search_entry, show_holds)
+
+        def cancel_selected_hold():
+            selected_item = tree.selection()
+            if not selected_item:
+                messagebox.showerror("Error", "No hold selected.")
+                return
+            # Rows are keyed by hold id; the list updates itself through the change bus
+            self.db_executor.write(library.cancel_hold, get_db(), selected_item[0],
+                                   busy=frame.winfo_toplevel().busy)
+
+        def expire_holds():
+            self.db_executor.write(
+                library.expire_holds, get_db(),
+                on_done=lambda count: messagebox.showinfo("Success", tr("holds_expired").format(count)),
+                busy=frame.winfo_toplevel().busy)
+
+        button_frame = tk.Frame(frame, bg=AppStyles.BACKGROUND_COLOR)
+        button_frame.pack(pady=10)
+        ttk.Button(button_frame, text=tr("cancel_hold"), command=cancel_selected_hold,
+                   style='Custom.TButton').pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text=tr("expire_holds"), command=expire_holds,
+                   style='Custom.TButton').pack(side=tk.LEFT, padx=5)
+
+        show_holds()
+
+    def export_form(self, frame):
+        from tkinter import filedialog
+
+        from exporter import export_file
+
+        title_label = tk.Label(
+            frame,
+            text=tr("export_data"),
+            font=self.title_font,
+            fg=AppStyles.PRIMARY_COLOR,
+            bg=AppStyles.BACKGROUND_COLOR
+        )
+        title_label.pack(pady=(0, 20))
+
+        form_frame = tk.Frame(frame, bg=AppStyles.BACKGROUND_COLOR)
+        form_frame.pack(expand=True)
+
+        # What to export
+        kind_var = tk.StringVar(value="books")
+        for col, kind in enumerate(("books", "members", "loans")):
+            tk.Radiobutton(form_frame, text=tr(kind), variable=kind_var, value=kind,
+                           bg=AppStyles.BACKGROUND_COLOR, fg=AppStyles.TEXT_COLOR).grid(row=0, column=col, padx=5, pady=5)
+
+        compress_var = tk.BooleanVar(value=False)
+        changed_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(form_frame, text=tr("compress"), variable=compress_var,
+                       bg=AppStyles.BACKGROUND_COLOR, fg=AppStyles.TEXT_COLOR).grid(row=1, column=0, columnspan=3, sticky='w')
+        tk.Checkbutton(form_frame, text=tr("changed_only"), variable=changed_var,
+                       bg=AppStyles.BACKGROUND_COLOR, fg=AppStyles.TEXT_COLOR).grid(row=2, column=0, columnspan=3, sticky='w')
+
+        status_label = tk.Label(form_frame, text="", bg=AppStyles.BACKGROUND_COLOR, fg=AppStyles.TEXT_COLOR)
+        status_label.grid(row=4, column=0, columnspan=3)
+
+        def show_progress(rows):
+            if status_label.winfo_exists():
+                status_label.config(text=f"{rows:,} {tr('rows')}")
+
+        def export():
+            # The format follows the chosen file's extension
+            path = filedialog.asksaveasfilename(
+                parent=frame,
+                defaultextension=".csv",
+                initialfile=kind_var.get(),
+                filetypes=[("CSV", "*.csv"), ("JSON Lines", "*.jsonl"), ("Parquet", "*.parquet"), ("All files", "*")]
+            )
+            if not path:
+                return
+
+            def finished(result):
+                export_button.config(state=tk.NORMAL)
+                messagebox.showinfo("Success", str(result))
+
+            def failed(error):
+                export_button.config(state=tk.NORMAL)
+                self.show_db_error(error)
+
+            export_button.config(state=tk.DISABLED)
+            status_label.config(text="")
+            # Streams on a reader thread so the app's own writes aren't held up;
+            # only the final watermark update of an incremental export writes
+            self.db_executor.read(
+                export_file, get_db(), kind_var.get(), path,
+                compress=compress_var.get() or None, changed_only=changed_var.get(),
+                progress=lambda rows: self.db_executor.call_soon(show_progress, rows),
+                on_done=finished, on_error=failed, busy=frame.winfo_toplevel().busy
+            )
+
+        export_button = ttk.Button(
+            form_frame,
+            text=tr("export_btn"),
+            command=export,
+            style='Custom.TButton'
+        )
+        export_button.grid(row=3, column=0, columnspan=3, pady=10)
+
+    def statistics_form(self, frame):
+        title_label = tk.Label(
+            frame,
+            text=tr("statistics"),
+            font=self.title_font,
+            fg=AppStyles.PRIMARY_COLOR,
+            bg=AppStyles.BACKGROUND_COLOR
+        )
+        title_label.pack(pady=(0, 20))
+
+        # Totals
+        totals_frame = tk.Frame(frame, bg=AppStyles.BACKGROUND_COLOR)
+        totals_frame.pack(pady=(0, 10))
+        totals = {}
+        for col, key in enumerate(("loans", "returns", "active_loans")):
+            tk.Label(totals_frame, text=tr(key), font=('Helvetica', 12), fg=AppStyles.TEXT_COLOR,
+                     bg=AppStyles.BACKGROUND_COLOR).grid(row=0, column=col, padx=15)
+            totals[key] = tk.Label(totals_frame, text="", font=self.button_font, fg=AppStyles.PRIMARY_COLOR,
+                                   bg=AppStyles.BACKGROUND_COLOR)
+            totals[key].grid(row=1, column=col, padx=15)
+
+        # One tab per list
+        notebook = ttk.Notebook(frame)
+        notebook.pack(fill=tk.BOTH, expand=True)
+        tables = {}
+        tabs = [
+            ("top_books", "most_borrowed", (("Title", tr("title")), ("Author", tr("author")), ("Loans", tr("loans")))),
+            ("top_members", "busiest_members", (("Name", tr("name")), ("Email", tr("email")), ("Loans", tr("loans")))),
+            ("daily", "daily_loans", (("Date", tr("date")), ("Loans", tr("loans")), ("Returns", tr("returns")))),
+        ]
+        for name, tab_key, columns in tabs:
+            tree = ttk.Treeview(notebook, columns=[column for column, _ in columns], show="headings")
+            for column, heading in columns:
+                tree.heading(column, text=heading)
+            notebook.add(tree, text=tr(tab_key))
+            tables[name] = tree
+
+        def show(stats):
+            if not frame.winfo_exists():
+                return
+            totals["loans"].config(text=stats["loans"])
+            totals["returns"].config(text=stats["returns"])
+            totals["active_loans"].config(text=stats["active"])
+            for name, tree in tables.items():
+                tree.delete(*tree.get_children())
+                for row in stats[name]:
+                    tree.insert("", tk.END, values=row)
+
+        def load():
+            # A few rows from the summary tables, however long the loan history is
+            self.db_executor.read(get_db().circulation_stats, on_done=show,
+                                  channel=(str(frame), "stats"), busy=frame.winfo_toplevel().busy)
+
+        load()
+        return load
+
+    def import_form(self, frame):
+        from tkinter import filedialog
+
+        from importer import import_file
+
+        title_label = tk.Label(
+            frame,
+            text=tr("import_data"),
+            font=self.title_font,
+            fg=AppStyles.PRIMARY_COLOR,
+            bg=AppStyles.BACKGROUND_COLOR
+        )
+        title_label.pack(pady=(0, 20))
+
+        form_frame = tk.Frame(frame, bg=AppStyles.BACKGROUND_COLOR)
+        form_frame.pack(expand=True)
+
+        # What the file contains
+        kind_var = tk.StringVar(value="books")
+        for col, kind in enumerate(("books", "members")):
+            tk.Radiobutton(form_frame, text=tr(kind), variable=kind_var, value=kind,
+                           bg=AppStyles.BACKGROUND_COLOR, fg=AppStyles.TEXT_COLOR).grid(row=0, column=col, padx=5, pady=5)
+
+        progress = ttk.Progressbar(form_frame, length=300, maximum=100)
+        progress.grid(row=2, column=0, columnspan=2, pady=(20, 5))
+        status_label = tk.Label(form_frame, text="", bg=AppStyles.BACKGROUND_COLOR, fg=AppStyles.TEXT_COLOR)
+        status_label.grid(row=3, column=0, columnspan=2)
+
+        def show_progress(rows, done, total):
+            if progress.winfo_exists():
+                progress["value"] = done * 100 / max(total, 1)
+                status_label.config(text=f"{rows:,} {tr('rows')}")
+
+        def choose_file():
+            path = filedialog.askopenfilename(
+                parent=frame,
+                filetypes=[("CSV", "*.csv"), ("JSON Lines", "*.jsonl *.ndjson *.json"), ("All files", "*")]
+            )
+            if not path:
+                return
+
+            def finished(result):
+                choose_button.config(state=tk.NORMAL)
+                messagebox.showinfo("Success", str(result))
+
+            def failed(error):
+                choose_button.config(state=tk.NORMAL)
+                self.show_db_error(error)
+
+            choose_button.config(state=tk.DISABLED)
+            progress["value"] = 0
+            # The import runs on the writer thread; progress is handed back to Tk
+            self.db_executor.write(
+                import_file, get_db(), kind_var.get(), path,
+                progress=lambda *args: self.db_executor.call_soon(show_progress, *args),
+                on_done=finished, on_error=failed, busy=frame.winfo_toplevel().busy
+            )
+
+        choose_button = ttk.Button(
+            form_frame,
+            text=tr("choose_file"),
+            command=choose_file,
+            style='Custom.TButton'
+        )
+        choose_button.grid(row=1, column=0, columnspan=2, pady=10)
  
  
  
 # Initialize database and start the application
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Library management system.")
+    parser.add_argument("--db", default=DB_PATH, help="database file (default: %(default)s)")
+    parser.add_argument("--startup-trace", choices=("print", "exit"),
+                        help="print the start-up trace as JSON once the menu is on screen (and then quit)")
+    args = parser.parse_args()
+
+    # cProfile the Tk thread when LIBRARY_PROFILE names a file for the stats
+    start_profiling()
+    configure(args.db)
     init_db()
-    app = BookLendingApp()
+    mark("init_db")
+    app = BookLendingApp(args.startup_trace)
     app.mainloop()
\ No newline at end of file
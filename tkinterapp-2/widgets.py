@@ -0,0 +1,437 @@
+import tkinter as tk
+from collections import deque
+from tkinter import ttk
+
+from instrument import metrics, timed
+
+# Rows fetched per keyset page, and how many pages may live in the widget at once
+PAGE_SIZE = 200
+MAX_PAGES = 5
+# Appended to the heading of the column a PagedTreeview is sorted by
+ASCENDING_MARK = " \u25b2"
+DESCENDING_MARK = " \u25bc"
+
+
+class RowWindow:
+    """Bounded, scrollable window of pages over a KeysetQuery.
+
+    This is the headless half of PagedTreeview: it only knows which pages are
+    loaded, so it can be driven (and benchmarked) without a display.
+    """
+
+    def __init__(self, query, page_size=PAGE_SIZE, max_pages=MAX_PAGES):
+        self.query = query
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.pages = deque()
+        self.first_page = 0         # index of pages[0] within the whole result
+        self.page_starts = [None]   # page_starts[i] = key the i-th page starts after
+        self.exhausted = False
+
+    def rows(self):
+        for page in self.pages:
+            yield from page
+
+    def _fetch(self, index):
+        return self.query.page(self.page_starts[index], self.page_size)
+
+    def load_next(self):
+        """Append the next page. Returns (added, dropped) lists of (key, values)."""
+        if self.exhausted:
+            return [], []
+        index = self.first_page + len(self.pages)
+        page = self._fetch(index)
+        if len(page) < self.page_size:
+            self.exhausted = True
+        elif len(self.page_starts) == index + 1:
+            self.page_starts.append(page[-1][0])
+        if not page:
+            return [], []
+        self.pages.append(page)
+        dropped = []
+        if len(self.pages) > self.max_pages:
+            dropped = self.pages.popleft()
+            self.first_page += 1
+        return page, dropped
+
+    def update(self, ids, rows):
+        """Fold re-read rows into the loaded pages.
+
+        ``rows`` are the (key, values) pairs of those ``ids`` that still match
+        the query. Loaded rows are replaced or removed; new ones are inserted
+        if their key falls inside the loaded range (elsewhere they show up
+        when scrolled to). Returns (updated, added, removed) lists, added as
+        (position among the loaded rows, (key, values)).
+        """
+        fresh = {key[-1]: (key, values) for key, values in rows}
+        updated, removed = [], []
+        for page in self.pages:
+            for i, (key, values) in enumerate(page):
+                if key[-1] not in ids:
+                    continue
+                row = fresh.pop(key[-1], None)
+                if row is not None and row[0] == key:
+                    page[i] = row
+                    updated.append(row)
+                else:
+                    # Gone, or its sort key moved: take it out (and maybe back in below)
+                    removed.append(key)
+                    if row is not None:
+                        fresh[key[-1]] = row
+        if removed:
+            gone = set(removed)
+            for i, page in enumerate(self.pages):
+                self.pages[i] = [row for row in page if row[0] not in gone]
+
+        # Compare keys the way the query's ORDER BY does
+        sort_key = getattr(self.query, "sort_key", tuple)
+        descending = getattr(self.query, "descending", False)
+
+        def before(a, b):
+            a, b = sort_key(a), sort_key(b)
+            return a > b if descending else a < b
+
+        added = []
+        for key, values in fresh.values():
+            keys = [loaded for loaded, _ in self.rows()]
+            try:
+                if keys and not (self.first_page == 0 or before(keys[0], key)):
+                    continue
+                if keys and not (self.exhausted or before(key, keys[-1])):
+                    continue
+                if not keys and not (self.exhausted and self.first_page == 0):
+                    continue
+                position = sum(1 for loaded in keys if before(loaded, key))
+            except TypeError:
+                # A NULL in a sort key; leave the row for a reload to place
+                continue
+            if not self.pages:
+                self.pages.append([])
+            # Put it in the page that holds that position
+            offset = 0
+            for page in self.pages:
+                if position <= offset + len(page):
+                    page.insert(position - offset, (key, values))
+                    break
+                offset += len(page)
+            added.append((position, (key, values)))
+        return updated, added, removed
+
+    def load_previous(self):
+        """Prepend the page before the window. Returns (added, dropped)."""
+        if self.first_page == 0:
+            return [], []
+        self.first_page -= 1
+        page = self._fetch(self.first_page)
+        self.pages.appendleft(page)
+        dropped = []
+        if len(self.pages) > self.max_pages:
+            dropped = self.pages.pop()
+            self.exhausted = False
+        return page, dropped
+
+
+class LiveSearch:
+    """Runs ``callback(text)`` once typing in ``entry`` pauses for ``delay`` ms."""
+
+    def __init__(self, entry, callback, delay=250):
+        self.entry = entry
+        self.callback = callback
+        self.delay = delay
+        self._pending = None
+        self._last = None
+        entry.bind("<KeyRelease>", self._on_key, add="+")
+        entry.bind("<Return>", lambda event: self.search_now(), add="+")
+
+    def _on_key(self, event):
+        if self._pending is not None:
+            self.entry.after_cancel(self._pending)
+        self._pending = self.entry.after(self.delay, self._fire)
+
+    def _fire(self):
+        self._pending = None
+        text = self.entry.get().strip()
+        # Arrow keys, Shift etc. also raise KeyRelease; skip if nothing changed
+        if text != self._last:
+            self.search_now()
+
+    def search_now(self):
+        if self._pending is not None:
+            self.entry.after_cancel(self._pending)
+            self._pending = None
+        self._last = self.entry.get().strip()
+        self.callback(self._last)
+
+
+class MemberPicker(ttk.Combobox):
+    """Combobox that autocompletes members by name or email prefix.
+
+    Only the top ``limit`` matches for what has been typed are fetched (via
+    ``find(prefix, limit)``, normally Database.find_members), so opening the
+    borrow form no longer loads every member.
+    """
+
+    def __init__(self, master, find, executor=None, busy=None, limit=20, **kwargs):
+        super().__init__(master, **kwargs)
+        self.find = find
+        self.executor = executor
+        self.busy = busy
+        self.limit = limit
+        self._members = {}
+        LiveSearch(self, self.lookup, delay=200)
+        self.lookup("")
+
+    @staticmethod
+    def display(member):
+        member_id, name, email = member
+        return f"{member_id} - {name} <{email}>"
+
+    def lookup(self, prefix):
+        # A value picked from the list is not a new prefix to search for
+        if prefix in self._members:
+            return
+        if self.executor is None:
+            self._show(self.find(prefix, self.limit))
+        else:
+            self.executor.read(self.find, prefix, self.limit, on_done=self._show,
+                               channel=(str(self), "lookup"), busy=self.busy)
+
+    def _show(self, members):
+        if not self.winfo_exists():
+            return
+        self._members = {self.display(member): member[0] for member in members}
+        self["values"] = list(self._members)
+
+    def member_id(self):
+        """Id of the chosen member, or None if the text isn't one of the suggestions."""
+        return self._members.get(self.get())
+
+
+class PagedTreeview(tk.Frame):
+    """ttk.Treeview that loads a KeysetQuery lazily as the user scrolls.
+
+    Only ``max_pages`` pages are kept as Treeview items; pages scrolled far out
+    of view are dropped and fetched again when the user scrolls back. With an
+    ``executor`` the count and pages are fetched on its reader threads.
+    """
+
+    def __init__(self, master, columns, count_text=str, page_size=PAGE_SIZE,
+                 max_pages=MAX_PAGES, executor=None, busy=None, **kwargs):
+        super().__init__(master, **kwargs)
+        self.count_text = count_text
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.executor = executor
+        self.busy = busy
+        self.window = None
+        self._loading = False
+        self._count = None
+        # The sort name of the clicked heading (None: the query's own order)
+        self.sort = None
+        self.descending = False
+        self._sorts = {}
+        self._on_sort = None
+        self.bind("<Destroy>", self._on_destroy)
+
+        body = tk.Frame(self, bg=self["bg"])
+        body.pack(fill=tk.BOTH, expand=True)
+        self.tree = ttk.Treeview(body, columns=columns, show="headings")
+        self.scrollbar = ttk.Scrollbar(body, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self._on_scroll)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.count_label = tk.Label(self, bg=self["bg"], anchor="w")
+        self.count_label.pack(fill=tk.X)
+
+    def set_query(self, query):
+        """Show a new result set, starting from its first page."""
+        self.window = RowWindow(query, self.page_size, self.max_pages)
+        self._loading = False
+        self._count = None
+        self.tree.delete(*self.tree.get_children())
+        self.count_label.config(text="")
+        self._load(self.window.load_next, at_end=True, first=True)
+
+    def refresh(self):
+        if self.window is not None:
+            self.set_query(self.window.query)
+
+    def enable_sorting(self, sorts, on_sort):
+        """Sort by a column when its heading is clicked; clicking it again reverses the order.
+
+        ``sorts`` maps column ids to the sort names the query takes. The
+        sorting happens in SQL, so ``on_sort`` is called to run the query
+        again with ``self.sort`` and ``self.descending``.
+        """
+        self._sorts = dict(sorts)
+        self._on_sort = on_sort
+        for column in self._sorts:
+            self.tree.heading(column, command=lambda column=column: self.sort_by(column))
+
+    def sort_by(self, column, descending=None):
+        sort = self._sorts[column]
+        if descending is None:
+            descending = not self.descending if sort == self.sort else False
+        self.sort, self.descending = sort, descending
+        for other, name in self._sorts.items():
+            text, _ = split_sort_mark(str(self.tree.heading(other, "text")))
+            if name == sort:
+                text += DESCENDING_MARK if descending else ASCENDING_MARK
+            self.tree.heading(other, text=text)
+        if self._on_sort is not None:
+            self._on_sort()
+
+    def apply_changes(self, changes):
+        """Update just the rows that ``changes`` (from the change bus) touched."""
+        if self.window is None:
+            return
+        window = self.window
+        table = getattr(window.query, "key_table", None)
+        ids = set()
+        for change in changes:
+            if table not in change.ids:
+                continue
+            if change.ids[table] is None:
+                self.refresh()
+                return
+            ids |= change.ids[table]
+        if not ids:
+            return
+
+        def reread():
+            return window.query.rows_for(ids)
+
+        def loaded(rows):
+            if window is self.window:
+                self._apply_update(ids, rows)
+
+        if self.executor is None:
+            loaded(reread())
+        else:
+            # No channel: every batch of changes has to be applied
+            self.executor.read(reread, on_done=loaded, busy=self.busy)
+
+    @timed("treeview.update")
+    def _apply_update(self, ids, rows):
+        loaded = {key[-1] for key, _ in self.window.rows() if key[-1] in ids}
+        updated, added, removed = self.window.update(ids, rows)
+        metrics.count("treeview.rows_updated", len(updated) + len(added) + len(removed))
+        for key in removed:
+            self.tree.delete(self._iid(key))
+        for key, values in updated:
+            self.tree.item(self._iid(key), values=values)
+        for position, (key, values) in added:
+            self.tree.insert("", position, iid=self._iid(key), values=values)
+
+        if self.window.exhausted and self.window.first_page == 0:
+            self._show_count(sum(1 for _ in self.window.rows()))
+        elif self._count is not None and (added or removed or ids - loaded):
+            # Rows outside the loaded pages may have started or stopped matching too
+            self._run(self.window.query.count, self._show_count, "count")
+
+    def selected_values(self):
+        selected = self.tree.selection()
+        if not selected:
+            return None
+        return self.tree.item(selected[0], "values")
+
+    def _on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if self.window is None or self._loading:
+            return
+        if float(last) >= 0.95 and not self.window.exhausted:
+            self.after_idle(self._load, self.window.load_next, True)
+        elif float(first) <= 0.05 and self.window.first_page > 0:
+            self.after_idle(self._load, self.window.load_previous, False)
+
+    def _run(self, fn, on_done, channel, on_error=None):
+        if self.executor is None:
+            try:
+                result = fn()
+            except Exception as e:
+                if on_error is not None:
+                    on_error(e)
+                raise
+            on_done(result)
+            return
+        self.executor.read(
+            fn, on_done=on_done, on_error=on_error, busy=self.busy,
+            # A newer request from this table supersedes the pending one
+            channel=(str(self), channel),
+        )
+
+    def _show_count(self, count):
+        self._count = count
+        self.count_label.config(text=self.count_text(count))
+
+    def retranslate(self):
+        # count_text may depend on the current language
+        if self._count is not None:
+            self._show_count(self._count)
+
+    def _load(self, loader, at_end, first=False):
+        if self._loading:
+            return
+        self._loading = True
+        window = self.window
+
+        def loaded(result):
+            if window is not self.window:
+                return
+            self._loading = False
+            self._apply(result, at_end)
+            if first:
+                if window.exhausted:
+                    # The whole result fit in one page; no need to count it
+                    self._show_count(len(result[0]))
+                else:
+                    self._run(window.query.count, self._show_count, "count")
+
+        def failed(error):
+            self._loading = False
+            if self.executor is not None and self.executor.on_error is not None:
+                self.executor.on_error(error)
+
+        self._run(loader, loaded, "page", failed)
+
+    @timed("treeview.apply")
+    def _apply(self, result, at_end):
+        # Remember the top visible row so the view doesn't jump when
+        # items are added or dropped above it
+        children = self.tree.get_children()
+        anchor = None
+        if children:
+            top = self.tree.yview()[0]
+            anchor = children[min(int(top * len(children)), len(children) - 1)]
+
+        added, dropped = result
+        metrics.count("treeview.rows_inserted", len(added))
+        metrics.count("treeview.rows_deleted", len(dropped))
+        for key, _ in dropped:
+            self.tree.delete(self._iid(key))
+        position = tk.END if at_end else 0
+        for key, values in (added if at_end else reversed(added)):
+            self.tree.insert("", position, iid=self._iid(key), values=values)
+
+        if anchor is not None and (dropped or not at_end) and self.tree.exists(anchor):
+            children = self.tree.get_children()
+            self.tree.yview_moveto(children.index(anchor) / len(children))
+
+    def _on_destroy(self, event):
+        if event.widget is self and self.executor is not None:
+            self.executor.cancel((str(self), "count"))
+            self.executor.cancel((str(self), "page"))
+
+    @staticmethod
+    def _iid(key):
+        # The last key column is unique, so it doubles as the item id
+        return str(key[-1])
+
+
+def split_sort_mark(text):
+    """Split a heading's text into the text itself and its sort mark ("" if unsorted)."""
+    for mark in (ASCENDING_MARK, DESCENDING_MARK):
+        if text.endswith(mark):
+            return text[:-len(mark)], mark
+    return text, ""
@@ -0,0 +1,196 @@
+import queue
+import sys
+import threading
+import time
+from tkinter import ttk
+
+from database import get_db
+from instrument import metrics, timer
+
+# How often (ms) the Tk thread collects finished jobs
+POLL_INTERVAL = 20
+
+PENDING, RUNNING, DONE = range(3)
+
+
+class Job:
+    def __init__(self, fn, args, on_done, on_error, busy, channel=None):
+        self.fn = fn
+        self.args = args
+        self.on_done = on_done
+        self.on_error = on_error
+        self.busy = busy
+        self.channel = channel
+        self.cancelled = False
+        self.state = PENDING
+        self.conn = None
+        self.queued = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        """Drop the job's result; a query already running is interrupted."""
+        with self._lock:
+            self.cancelled = True
+            if self.state == RUNNING and self.conn is not None:
+                self.conn.interrupt()
+
+    def _start(self, conn):
+        with self._lock:
+            if self.cancelled:
+                return False
+            self.state = RUNNING
+            self.conn = conn
+            return True
+
+    def _finish(self):
+        with self._lock:
+            self.state = DONE
+            self.conn = None
+
+
+class DBExecutor:
+    """Runs database work off the Tk thread.
+
+    Writes go to a single writer thread so they never contend with each
+    other; reads are spread over ``readers`` threads, each with its own
+    connection. Results are handed back through a queue that the Tk thread
+    drains with ``after`` polling, so callbacks always run on the Tk thread.
+    """
+
+    def __init__(self, root, readers=2, on_error=None):
+        self.root = root
+        self.on_error = on_error
+        self._reads = queue.Queue()
+        self._writes = queue.Queue()
+        self._results = queue.Queue()
+        self._calls = queue.Queue()
+        self._channels = {}
+        self._threads = []
+        self._closed = False
+        self._start_thread(self._writes, "db-writer", "write", interruptible=False)
+        for i in range(readers):
+            self._start_thread(self._reads, f"db-reader-{i}", "read", interruptible=True)
+        self._poll_id = root.after(POLL_INTERVAL, self._poll)
+
+    def _start_thread(self, jobs, name, kind, interruptible):
+        thread = threading.Thread(target=self._run, args=(jobs, kind, interruptible), name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def read(self, fn, *args, on_done=None, on_error=None, channel=None, busy=None):
+        """Queue a read-only job. A newer job on the same channel cancels the older one."""
+        job = self._submit(self._reads, fn, args, on_done, on_error, busy, channel)
+        if channel is not None:
+            previous = self._channels.get(channel)
+            if previous is not None:
+                previous.cancel()
+            self._channels[channel] = job
+        return job
+
+    def write(self, fn, *args, on_done=None, on_error=None, busy=None):
+        """Queue a job that modifies the database; writes run one at a time, in order."""
+        return self._submit(self._writes, fn, args, on_done, on_error, busy)
+
+    def _submit(self, jobs, fn, args, on_done, on_error, busy, channel=None):
+        job = Job(fn, args, on_done, on_error, busy, channel)
+        if busy is not None:
+            busy.begin()
+        jobs.put(job)
+        return job
+
+    def call_soon(self, fn, *args):
+        """Run ``fn(*args)`` on the Tk thread; safe to call from any thread."""
+        self._calls.put((fn, args))
+
+    def cancel(self, channel):
+        job = self._channels.pop(channel, None)
+        if job is not None:
+            job.cancel()
+
+    def _run(self, jobs, kind, interruptible):
+        while True:
+            job = jobs.get()
+            if job is None:
+                return
+            conn = get_db().connection() if interruptible else None
+            start = time.perf_counter()
+            # Time spent queued behind other jobs, separately from the job's own run time
+            metrics.record(f"{kind}.wait", start - job.queued)
+            if not job._start(conn):
+                metrics.count(f"{kind}.cancelled")
+                self._results.put((job, None, None))
+                continue
+            try:
+                result, error = job.fn(*job.args), None
+            except Exception as e:
+                result, error = None, e
+                metrics.count(f"{kind}.errors")
+            finally:
+                job._finish()
+                metrics.record(f"{kind}.{getattr(job.fn, '__name__', 'job')}", time.perf_counter() - start)
+            self._results.put((job, result, error))
+
+    def _poll(self):
+        while True:
+            try:
+                job, result, error = self._results.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                with timer("tk.deliver"):
+                    self._deliver(job, result, error)
+            except Exception:
+                self.root.report_callback_exception(*sys.exc_info())
+        while True:
+            try:
+                fn, args = self._calls.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                fn(*args)
+            except Exception:
+                self.root.report_callback_exception(*sys.exc_info())
+        if not self._closed:
+            self._poll_id = self.root.after(POLL_INTERVAL, self._poll)
+
+    def _deliver(self, job, result, error):
+        if job.busy is not None:
+            job.busy.end()
+        if job.channel is not None and self._channels.get(job.channel) is job:
+            del self._channels[job.channel]
+        if job.cancelled:
+            return
+        if error is not None:
+            handler = job.on_error or self.on_error
+            if handler is not None:
+                handler(error)
+        elif job.on_done is not None:
+            job.on_done(result)
+
+    def shutdown(self):
+        self._closed = True
+        self.root.after_cancel(self._poll_id)
+        for channel in list(self._channels):
+            self.cancel(channel)
+        self._writes.put(None)
+        for _ in range(len(self._threads) - 1):
+            self._reads.put(None)
+
+
+class BusyIndicator(ttk.Progressbar):
+    """Indeterminate progress bar that animates while any of its jobs run."""
+
+    def __init__(self, master, **kwargs):
+        super().__init__(master, mode="indeterminate", **kwargs)
+        self._pending = 0
+
+    def begin(self):
+        self._pending += 1
+        if self._pending == 1:
+            self.start(10)
+
+    def end(self):
+        self._pending = max(self._pending - 1, 0)
+        if self._pending == 0 and self.winfo_exists():
+            self.stop()
+